@@ -0,0 +1,64 @@
+'''
+Micro-benchmark of the cost of calling a function decorated with `@verify`, compared with the
+same function undecorated, with verification disabled and enabled (but not run), and with the
+contracts checked at runtime on every call and on one call out of 100.
+
+    python benchmarks/call_overhead.py [--calls N] [--repeat R]
+'''
+import os
+import sys
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import veripy
+from veripy import verify
+
+def add(a : int, b : int) -> int:
+    ans = a + b
+    return ans
+
+@verify(requires=['a >= 0', 'b >= 0'], ensures=['ans >= a'])
+def add_disabled(a : int, b : int) -> int:
+    ans = a + b
+    return ans
+
+veripy.enable_verification()
+veripy.scope('call_overhead')
+
+@verify(requires=['a >= 0', 'b >= 0'], ensures=['ans >= a'])
+def add_enabled(a : int, b : int) -> int:
+    ans = a + b
+    return ans
+
+@verify(requires=['a >= 0', 'b >= 0'], ensures=['ans >= a'], runtime_check=1)
+def add_checked(a : int, b : int) -> int:
+    ans = a + b
+    return ans
+
+@verify(requires=['a >= 0', 'b >= 0'], ensures=['ans >= a'], runtime_check=100)
+def add_sampled(a : int, b : int) -> int:
+    ans = a + b
+    return ans
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    functions = [('undecorated', add), ('verify (disabled)', add_disabled), ('verify (enabled)', add_enabled),
+                 ('runtime check 1/1', add_checked), ('runtime check 1/100', add_sampled)]
+    best = {name: float('inf') for (name, _) in functions}
+    # interleave the measurements so that warm-up and frequency scaling affect all of them alike
+    for _ in range(args.repeat):
+        for name, f in functions:
+            t = timeit.timeit('f(1, 2)', globals={'f': f}, number=args.calls) / args.calls
+            best[name] = min(best[name], t)
+    for name, f in functions:
+        wrapped = ' (wrapper)' if hasattr(f, '__wrapped__') else ''
+        print(f'{name:20s} {best[name] * 1e9:8.1f} ns/call {best[name] / best["undecorated"]:6.2f}x{wrapped}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+'''
+Micro-benchmark of the per-node visitor overhead of StmtTranslator, Expr2Z3 and wp
+on large generated functions.
+
+    python benchmarks/dispatch.py [--statements N] [--repeat R] [--save FILE.json] [--compare FILE.json]
+
+`dispatch_baseline.json` holds the timings of the dispatch through per-node dicts of closures,
+measured before the visitors used class-level tables (2000 statements, best of 5); compare
+with `--compare benchmarks/dispatch_baseline.json`.
+'''
+import os
+import sys
+import argparse
+import ast
+import json
+import time
+import z3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from veripy.parser.syntax import *
+from veripy.transformer import StmtTranslator, Expr2Z3
+from veripy.verify import wp, declare_consts
+from veripy import typecheck as tc
+
+def generate(statements : int):
+    '''
+    A function of arithmetic assignments over a few integer variables, with a branch every fourth statement
+    '''
+    lines = ['def f(a : int, b : int, c : int) -> int:']
+    for i in range(statements):
+        if i % 4 == 3:
+            lines.append(f'    if a - {i} > b and not (c == {i}):')
+            lines.append(f'        c = c + a * {i % 7} - b')
+        else:
+            lines.append(f'    {"abc"[i % 3]} = (a + b) * {i % 5} - (c % {i % 3 + 1}) + -{i}')
+    lines.append('    return c')
+    return '\n'.join(lines)
+
+def generate_asserts(statements : int):
+    '''
+    Straight-line assertions, whose weakest precondition needs no substitution
+    '''
+    lines = ['def g(a : int, b : int, c : int) -> int:']
+    lines.extend(f'    assert {"abc"[i % 3]} - {i} < {"abc"[(i + 1) % 3]} * {i % 5}' for i in range(statements))
+    lines.append('    return c')
+    return '\n'.join(lines)
+
+def count_nodes(expr : Expr):
+    return postorder(expr, lambda node, children: 1 + sum(children))
+
+def measure(f, repeat : int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def report(results, baseline):
+    for (phase, (count, unit, t)) in results.items():
+        line = f'{phase:15s}: {count:8d} {unit}s {t * 1e3:9.2f} ms {t / count * 1e9:8.0f} ns/{unit}'
+        if baseline is not None and phase in baseline:
+            before = baseline[phase]
+            line += f'   baseline {before:8.0f} ns/{unit} ({before / (t / count * 1e9):.1f}x)'
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--statements', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--save', metavar='FILE.json')
+    parser.add_argument('--compare', metavar='FILE.json')
+    args = parser.parse_args()
+    results = dict()
+
+    func_ast = ast.parse(generate(args.statements))
+    py_nodes = sum(1 for _ in ast.walk(func_ast))
+    t, stmt = measure(lambda: StmtTranslator().visit(func_ast), args.repeat)
+    results['StmtTranslator'] = (py_nodes, 'node', t)
+
+    sigma = tc.type_check_stmt({'a': tc.types.TINT, 'b': tc.types.TINT, 'c': tc.types.TINT}, {}, stmt)
+
+    # wp duplicates the postcondition at each branch and its cost on assignments is dominated
+    # by substitution, so the visitor overhead is measured on straight-line assertions
+    straight = StmtTranslator().visit(ast.parse(generate_asserts(args.statements)))
+    post = BinOp(Var('c'), CompOps.Ge, Var('a'))
+    stmts = sum(1 for _ in flatten_seq(straight))
+    t, _ = measure(lambda: wp(sigma, straight, post), args.repeat)
+    results['wp'] = (stmts, 'stmt', t)
+
+    # the VC of long functions is huge, translate the guards and assignments instead
+    exprs = [s.e if isinstance(s, (Assert, Assume)) else s.expr
+             for s in flatten_seq(stmt) if isinstance(s, (Assert, Assume, Assign))]
+    exprs.extend(s.cond for s in flatten_seq(stmt) if isinstance(s, If))
+    expr_nodes = sum(count_nodes(e) for e in exprs)
+    t, _ = measure(lambda: [Expr2Z3(declare_consts(sigma)).visit(e) for e in exprs], args.repeat)
+    results['Expr2Z3'] = (expr_nodes, 'node', t)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        if saved.get('statements') != args.statements:
+            print(f'warning: the baseline was run with --statements {saved.get("statements")}')
+        baseline = saved['ns']
+    report(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'statements': args.statements,
+                'repeat'    : args.repeat,
+                'python'    : sys.version.split()[0],
+                'z3'        : z3.get_version_string(),
+                'ns'        : {phase: round(t / count * 1e9) for (phase, (count, _, t)) in results.items()}
+            }, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+'''
+Parameterized generators of verification benchmarks. Each generator returns a list of
+cases `(source, requires, ensures)`, one per function; every generated function verifies.
+'''
+
+def straight_line(n : int):
+    '''
+    `n` assignments in a row, cycling through three variables
+    '''
+    lines = ['def straight(a : int, b : int, c : int) -> int:']
+    for i in range(n):
+        x, y = 'abc'[i % 3], 'abc'[(i + 1) % 3]
+        lines.append(f'    {x} = {x} + {y} + {i % 7}')
+    lines.append('    return a')
+    return [('\n'.join(lines), ['a >= 0', 'b >= 0', 'c >= 0'], ['a >= 0', 'b >= 0', 'c >= 0'])]
+
+def nested_ifs(k : int):
+    '''
+    `k` nested conditionals, each followed by an assignment, so that the postcondition
+    is pushed through every level
+    '''
+    lines = ['def nested(a : int, b : int) -> int:', '    ans = b']
+    for i in range(k):
+        indent = '    ' * (i + 1)
+        lines.append(f'{indent}if a > {i}:')
+        lines.append(f'{indent}    ans = ans + 1')
+    for i in reversed(range(k)):
+        indent = '    ' * (i + 1)
+        lines.append(f'{indent}else:')
+        lines.append(f'{indent}    ans = ans + 2')
+        lines.append(f'{indent}ans = ans - 1')
+    lines.append('    return ans')
+    return [('\n'.join(lines), ['b >= 0'], [f'ans >= b - {k}'])]
+
+def sequential_ifs(k : int):
+    '''
+    `k` conditionals in a row, whose textbook weakest precondition doubles at each of them
+    '''
+    lines = ['def chain(a : int, b : int) -> int:', '    ans = 0']
+    for i in range(k):
+        lines.append(f'    if a > {i}:')
+        lines.append(f'        ans = ans + b')
+        lines.append(f'    else:')
+        lines.append(f'        ans = ans + 1')
+    lines.append('    return ans')
+    return [('\n'.join(lines), ['b >= 1'], [f'ans >= {k}'])]
+
+def nested_loops(depth : int):
+    '''
+    `depth` nested counting loops with invariants
+    '''
+    lines = ['def loops(n : int) -> int:', '    ans = 0']
+    for d in range(depth):
+        indent = '    ' * (d + 1)
+        lines.append(f'{indent}i{d} = n')
+        lines.append(f'{indent}while i{d} > 0:')
+        lines.append(f"{indent}    invariant('i{d} >= 0')")
+        lines.append(f"{indent}    invariant('ans >= 0')")
+        lines.append(f"{indent}    invariant('n >= 0')")
+    indent = '    ' * (depth + 1)
+    lines.append(f'{indent}ans = ans + 1')
+    for d in reversed(range(depth)):
+        indent = '    ' * (d + 2)
+        lines.append(f'{indent}i{d} = i{d} - 1')
+    lines.append('    return ans')
+    return [('\n'.join(lines), ['n >= 0'], ['ans >= 0'])]
+
+def quantified_contract(n : int):
+    '''
+    A postcondition made of `n` quantified conjuncts
+    '''
+    source = '\n'.join([
+        'def quantified(a : int, b : int) -> int:',
+        '    ans = a + 1',
+        '    return ans'
+    ])
+    ensures = [f'forall x{i} :: x{i} > ans + {i} ==> x{i} > b' for i in range(n)]
+    return [(source, ['a >= b'], ensures)]
+
+def many_functions(n : int, length : int=10):
+    '''
+    A scope of `n` small functions
+    '''
+    cases = []
+    for i in range(n):
+        lines = [f'def f{i}(a : int, b : int) -> int:', '    ans = a']
+        lines.extend(f'    ans = ans + b + {j}' for j in range(length))
+        lines.append('    return ans')
+        cases.append(('\n'.join(lines), ['b >= 0'], ['ans >= a']))
+    return cases
+
+def array_fill(k : int):
+    '''
+    `k` loops in a row overwriting a list, each with a quantified invariant over the
+    elements written so far
+    '''
+    lines = ['def fill(a : List[int]) -> List[int]:']
+    for t in range(k):
+        lines.append(f'    i{t} = 0')
+        lines.append(f'    while i{t} < len(a):')
+        lines.append(f"        invariant('0 <= i{t} and i{t} <= len(a)')")
+        lines.append(f"        invariant('forall j :: 0 <= j and j < i{t} ==> a[j] == {t}')")
+        lines.append(f'        a[i{t}] = {t}')
+        lines.append(f'        i{t} = i{t} + 1')
+    lines.append('    return a')
+    return [('\n'.join(lines), [], [f'forall j :: 0 <= j and j < len(a) ==> a[j] == {k - 1}'])]
+
+def array_sum(k : int):
+    '''
+    `k` loops in a row reading a list whose elements are all non-negative by precondition
+    '''
+    lines = ['def total(a : List[int]) -> int:', '    s = 0']
+    for t in range(k):
+        lines.append(f'    i{t} = 0')
+        lines.append(f'    while i{t} < len(a):')
+        lines.append(f"        invariant('0 <= i{t} and i{t} <= len(a)')")
+        lines.append(f"        invariant('s >= 0')")
+        lines.append(f'        s = s + a[i{t}]')
+        lines.append(f'        i{t} = i{t} + 1')
+    lines.append('    return s')
+    return [('\n'.join(lines), ['forall j :: 0 <= j and j < len(a) ==> a[j] >= 0'], ['s >= 0'])]
+
+# name -> (generator, default size)
+BENCHMARKS = {
+    'straight_line'         : (straight_line, 200),
+    'nested_ifs'            : (nested_ifs, 16),
+    'sequential_ifs'        : (sequential_ifs, 10),
+    'nested_loops'          : (nested_loops, 3),
+    'quantified_contract'   : (quantified_contract, 32),
+    'many_functions'        : (many_functions, 50),
+    'array_fill'            : (array_fill, 8),
+    'array_sum'             : (array_sum, 8),
+}
@@ -0,0 +1,215 @@
+'''
+Benchmark runner of the verification pipeline. Every benchmark of `generators.BENCHMARKS`
+is run through the phases of `verify_func`, and the time and peak memory of each phase are
+reported:
+
+    parse_assertion     parsing the contracts (with an empty parse cache)
+    StmtTranslator      parsing the function and translating it to veripy statements
+    typecheck           type checking the function and its contracts
+    wp                  generating the verification condition
+    simplify            simplifying it and dropping the trivial obligations
+    Expr2Z3             translating the obligations to Z3
+    emit_smt            checking the obligations
+
+Usage:
+
+    python benchmarks/run.py [--only NAME ...] [--size NAME=N ...] [--vcgen wp|passive]
+                             [--parser pyparsing|pratt] [--repeat R] [--timeout SECONDS]
+                             [--save BASELINE.json] [--compare BASELINE.json [--threshold 0.25]]
+
+Times are the best of `--repeat` runs; peak memory (tracemalloc) is measured on a separate run.
+`--compare` exits with status 1 if some phase is slower than the baseline by more than `--threshold`.
+With `--timeout`, every obligation is limited to that many seconds, so a benchmark that does not
+verify in bounded time (e.g. the quantified invariants of `array_fill`) reports its status.
+'''
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+import platform
+import subprocess
+import tracemalloc
+import z3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from veripy import typecheck as tc
+from veripy.parser import parser
+from veripy.transformer import StmtTranslator, Expr2Z3
+from veripy.verify import fold_constraints, typecheck_function, generate_vc, proof_obligations, \
+                          check_obligations, declare_consts
+from generators import BENCHMARKS
+
+PHASES = ('parse_assertion', 'StmtTranslator', 'typecheck', 'wp', 'simplify', 'Expr2Z3', 'emit_smt')
+
+def input_types(func_def):
+    return {a.arg: tc.types.to_ast_type(a.annotation) if a.annotation else tc.types.TANY
+            for a in func_def.args.args}
+
+def pipeline(source, requires, ensures, vcgen, timeout=None):
+    '''
+    The phases of `verify_func` on one function, as a list of `(phase, thunk)`; each thunk
+    runs its phase on the results of the previous ones. The phases are the functions `verify_func`
+    runs; no signatures are given to `typecheck_function`, the benchmarks do not call each other.
+    '''
+    state = dict()
+
+    def parse_assertions():
+        parser.clear_parse_cache()
+        state['pre'] = fold_constraints(requires)
+        state['post'] = fold_constraints(ensures)
+
+    def translate():
+        func_ast = ast.parse(source)
+        state['name'] = func_ast.body[0].name
+        state['inputs'] = input_types(func_ast.body[0])
+        state['stmt'] = StmtTranslator().visit(func_ast)
+
+    def typecheck():
+        (state['sigma'], state['stmt'], state['pre'], state['post']) = \
+            typecheck_function(state['inputs'], dict(), state['stmt'], state['pre'], state['post'])
+
+    def vc():
+        state['vc'] = generate_vc(state['sigma'], state['stmt'], state['post'], vcgen)
+
+    def simplify_vc():
+        (P, C) = state['vc']
+        (state['obligations'], _) = proof_obligations(state['sigma'], state['name'], state['pre'], P, C)
+
+    def translate_z3():
+        translator = Expr2Z3(declare_consts(state['sigma']))
+        obligations = state['obligations']
+        for (h, c, _, _) in obligations:
+            if h is not None:
+                translator.visit(h)
+            translator.visit(c)
+        state['translator'] = translator
+
+    def solve():
+        results = check_obligations(state['translator'], z3.Solver(), state['obligations'], timeout)
+        statuses = {r.status for r in results}
+        state['status'] = 'failed' if 'violated' in statuses else 'unknown' if 'unknown' in statuses else 'verified'
+
+    return state, list(zip(PHASES, (parse_assertions, translate, typecheck, vc, simplify_vc, translate_z3, solve)))
+
+def run_once(cases, vcgen, memory, timeout=None):
+    times = {phase: 0.0 for phase in PHASES}
+    peaks = {phase: 0 for phase in PHASES}
+    status = 'verified'
+    for (source, requires, ensures) in cases:
+        state, phases = pipeline(source, requires, ensures, vcgen, timeout)
+        for (phase, thunk) in phases:
+            if memory:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            thunk()
+            times[phase] += time.perf_counter() - start
+            if memory:
+                peaks[phase] = max(peaks[phase], tracemalloc.get_traced_memory()[1] - base)
+        if state['status'] != 'verified':
+            status = state['status']
+    return times, peaks, status
+
+def run_benchmark(name, size, vcgen, repeat, memory=True, timeout=None):
+    generator, _ = BENCHMARKS[name]
+    cases = generator(size)
+    best = None
+    for _ in range(repeat):
+        times, _, status = run_once(cases, vcgen, memory=False, timeout=timeout)
+        best = times if best is None else {p: min(best[p], times[p]) for p in PHASES}
+    peaks = {phase: 0 for phase in PHASES}
+    if memory:
+        tracemalloc.start()
+        _, peaks, _ = run_once(cases, vcgen, memory=True, timeout=timeout)
+        tracemalloc.stop()
+    return {
+        'size'      : size,
+        'status'    : status,
+        'phases'    : {p: {'time': best[p], 'peak': peaks[p]} for p in PHASES}
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return None
+
+def print_results(results, baseline=None, threshold=0.25):
+    regressions = []
+    header = f'{"benchmark":22s} {"phase":16s} {"time (ms)":>10s} {"peak (KiB)":>11s}'
+    if baseline is not None:
+        header += f' {"baseline":>10s} {"ratio":>7s}'
+    print(header)
+    for name, r in results.items():
+        for phase in PHASES:
+            t = r['phases'][phase]['time']
+            line = f'{name:22s} {phase:16s} {t * 1e3:10.2f} {r["phases"][phase]["peak"] / 1024:11.1f}'
+            old = baseline.get(name) if baseline is not None else None
+            if old is not None and old['size'] == r['size'] and phase in old['phases']:
+                t0 = old['phases'][phase]['time']
+                ratio = t / t0 if t0 > 0 else 1.0
+                line += f' {t0 * 1e3:10.2f} {ratio:7.2f}'
+                # sub-millisecond phases are too noisy to be flagged
+                if ratio > 1 + threshold and t - t0 > 1e-3:
+                    line += '  REGRESSION'
+                    regressions.append((name, phase))
+            print(line)
+        if r['status'] != 'verified':
+            print(f'{name:22s} {r["status"]}')
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    arg_parser.add_argument('--size', nargs='*', default=[], metavar='NAME=N')
+    arg_parser.add_argument('--vcgen', choices=['wp', 'passive'], default='wp')
+    arg_parser.add_argument('--parser', choices=list(parser.PARSERS), default=None)
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--no-memory', action='store_true')
+    arg_parser.add_argument('--save', metavar='BASELINE.json')
+    arg_parser.add_argument('--compare', metavar='BASELINE.json')
+    arg_parser.add_argument('--threshold', type=float, default=0.25)
+    arg_parser.add_argument('--timeout', type=float, default=None)
+    args = arg_parser.parse_args()
+
+    if args.parser is not None:
+        parser.use_parser(args.parser)
+    sizes = {name: size for (name, (_, size)) in BENCHMARKS.items()}
+    for s in args.size:
+        name, size = s.split('=')
+        sizes[name] = int(size)
+
+    results = {name: run_benchmark(name, sizes[name], args.vcgen, args.repeat, memory=not args.no_memory,
+                                   timeout=args.timeout)
+               for name in args.only}
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            saved = json.load(f)
+        baseline = saved['results']
+        for option in ('vcgen', 'parser'):
+            if saved.get(option) != (args.vcgen if option == 'vcgen' else parser.PARSER):
+                print(f'warning: the baseline was run with {option} = {saved.get(option)}')
+    regressions = print_results(results, baseline, args.threshold)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'commit'    : git_commit(),
+                'python'    : platform.python_version(),
+                'z3'        : z3.get_version_string(),
+                'vcgen'     : args.vcgen,
+                'parser'    : parser.PARSER,
+                'results'   : results
+            }, f, indent=1)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Differential test of the parser front-ends: the pyparsing grammar and the Pratt parser must
+build the same (interned, hence identical) ASTs for the contracts of the examples and for
+randomly generated assertions.
+'''
+import os
+import ast
+import random
+import pytest
+from veripy.parser import parser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCES = [os.path.join(ROOT, 'examples', 'tests.py'), os.path.join(ROOT, 'demo', 'demo.py')]
+
+def contracts(path):
+    '''
+    The string arguments of the `verify` and `invariant` calls of the file `path`
+    '''
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    result = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('verify', 'invariant'):
+            for arg in node.args + [k.value for k in node.keywords]:
+                result.extend(n.value for n in ast.walk(arg) if isinstance(n, ast.Constant) and isinstance(n.value, str))
+    return result
+
+ARITH_OPS = ['+', '-', '*', '//', '%']
+COMP_OPS = ['<', '<=', '>', '>=', '==', '!=']
+BOOL_OPS = ['and', 'or', '==>', '<==>']
+
+def arith(rng, names, depth):
+    choice = rng.randrange(7 if depth > 0 else 2)
+    if choice == 0:
+        return str(rng.randrange(100))
+    if choice == 1:
+        return rng.choice(names)
+    if choice == 2:
+        return f'xs[{arith(rng, names, depth - 1)}]'
+    if choice == 3:
+        return 'len(xs)'
+    if choice == 4:
+        return f'({arith(rng, names, depth - 1)})'
+    if choice == 5:
+        return f'-{arith(rng, names, depth - 1)}'
+    return f'{arith(rng, names, depth - 1)} {rng.choice(ARITH_OPS)} {arith(rng, names, depth - 1)}'
+
+def assertion(rng, names, depth):
+    choice = rng.randrange(6 if depth > 0 else 1)
+    if choice == 0:
+        return f'{arith(rng, names, depth)} {rng.choice(COMP_OPS)} {arith(rng, names, depth)}'
+    if choice == 1:
+        return rng.choice(['True', 'False'])
+    if choice == 2:
+        return f'not ({assertion(rng, names, depth - 1)})'
+    if choice == 3:
+        return f'({assertion(rng, names, depth - 1)})'
+    if choice == 4:
+        var = f'i{depth}'
+        ty = rng.choice(['', ' : int'])
+        return f'{rng.choice(["forall", "exists"])} {var}{ty} :: {assertion(rng, names + [var], depth - 1)}'
+    return f'{assertion(rng, names, depth - 1)} {rng.choice(BOOL_OPS)} {assertion(rng, names, depth - 1)}'
+
+def generated(count, seed=0):
+    rng = random.Random(seed)
+    return [assertion(rng, ['a', 'b', 'n'], rng.randrange(1, 5)) for _ in range(count)]
+
+@pytest.fixture(autouse=True, scope='module')
+def pyparsing_enabled():
+    # the pyparsing front-end is opt-in: selecting it raises the recursion limit it needs
+    previous = parser.PARSER
+    parser.use_parser('pyparsing')
+    yield
+    parser.use_parser(previous)
+
+def parse_both(text):
+    return [parse(text) for (_, parse) in (parser.PARSERS['pyparsing'], parser.PARSERS['pratt'])]
+
+@pytest.mark.parametrize('text', [c for path in SOURCES for c in contracts(path)])
+def test_example_contracts(text):
+    (expected, actual) = parse_both(text)
+    assert actual is expected
+
+@pytest.mark.parametrize('text', generated(500))
+def test_generated_assertions(text):
+    (expected, actual) = parse_both(text)
+    assert actual is expected
+
+@pytest.mark.parametrize('text', ['xs[1:2] == xs', 'xs[1:] == xs', 'xs[:2] == xs'])
+@pytest.mark.parametrize('front_end', ['pyparsing', 'pratt'])
+def test_slices_rejected(front_end, text):
+    with pytest.raises(Exception, match='Slices are not supported'):
+        parser.PARSERS[front_end][1](text)
+
+@pytest.mark.parametrize('text', ['a == b c', 'xs[0] > 0 )', 'forall i :: i > 0 i'])
+@pytest.mark.parametrize('front_end', ['pyparsing', 'pratt'])
+def test_trailing_input_rejected(front_end, text):
+    # a contract must never be silently truncated to its longest parsable prefix
+    with pytest.raises(Exception):
+        parser.PARSERS[front_end][1](text)
+
+@pytest.mark.parametrize('text', ['f(a) > 0', 'f(a, b + 1) == len(xs)', 'g(xs[a], f(b)) <= n'])
+def test_calls(text):
+    (expected, actual) = parse_both(text)
+    assert actual is expected
+
+@pytest.mark.parametrize('text', ['f(a, b, n) > 0', 'f(a, b, n, 1) == 0', 'f() > 0'])
+@pytest.mark.parametrize('front_end', ['pyparsing', 'pratt'])
+def test_call_arity_rejected(front_end, text):
+    with pytest.raises(Exception):
+        parser.PARSERS[front_end][1](text)
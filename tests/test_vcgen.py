@@ -0,0 +1,82 @@
+'''
+Behavioural test of the verification condition generators: known-valid functions must verify
+and buggy variants of them must come back violated, both with the textbook weakest precondition
+(`vcgen='wp'`) and with the passive form (`vcgen='passive'`).
+'''
+import textwrap
+import pytest
+from veripy.cache import CACHE
+from veripy.source import function_source
+from veripy.verify import STORE, verify_func, VerificationViolated
+
+COUNTER = '''
+def counter(n : int) -> int:
+    i = 0
+    while i < n:
+        invariant('i <= n')
+        i = i + {step}
+    return i
+'''
+
+ABS = '''
+def abs_value(x : int) -> int:
+    if x < 0:
+        y = -x
+    else:
+        y = {other}
+    return y
+'''
+
+ARRAY_UPDATE = '''
+def update(xs : List[int], i : int) -> List[int]:
+    xs[i] = {value}
+    return xs
+'''
+
+IF_MERGE = '''
+def merge(a : int, b : int) -> int:
+    m = a
+    if b {comparison} a:
+        m = b
+    return m
+'''
+
+# (source, requires, ensures, valid substitution, buggy substitution)
+FUNCTIONS = {
+    'counter'       : (COUNTER, ['n >= 0'], ['i == n'], {'step': '1'}, {'step': '2'}),
+    'abs'           : (ABS, [], ['y >= 0', 'y == x or y == -x'], {'other': 'x'}, {'other': '-x'}),
+    'array_update'  : (ARRAY_UPDATE, ['0 <= i', 'i < len(xs)'], ['xs[i] == 7'], {'value': '7'}, {'value': '-7'}),
+    'if_merge'      : (IF_MERGE, [], ['m >= a', 'm >= b'], {'comparison': '>'}, {'comparison': '<'}),
+}
+
+@pytest.fixture(autouse=True, scope='module')
+def verification_enabled():
+    # verify every function from scratch, in scopes of its own, without touching the proof cache
+    switch, enabled = STORE.switch, CACHE.enabled
+    STORE.switch, CACHE.enabled = True, False
+    scopes = set(STORE.store)
+    yield
+    for scope in set(STORE.store) - scopes:
+        del STORE.store[scope]
+    STORE.scope = [s for s in STORE.scope if s in scopes]
+    STORE.switch, CACHE.enabled = switch, enabled
+
+def run(name, vcgen, valid):
+    (template, requires, ensures, good, bad) = FUNCTIONS[name]
+    source = function_source(textwrap.dedent(template).format(**(good if valid else bad)))
+    scope = f'test_vcgen.{name}.{vcgen}.{"valid" if valid else "buggy"}'
+    STORE.push(scope)
+    STORE.defer_func_attr(scope, source.name, source, [], requires, ensures)
+    return verify_func(source, scope, [], requires, ensures, vcgen)
+
+@pytest.mark.parametrize('name', list(FUNCTIONS))
+@pytest.mark.parametrize('vcgen', ['wp', 'passive'])
+def test_valid_verified(vcgen, name):
+    assert run(name, vcgen, valid=True).status == 'verified'
+
+@pytest.mark.parametrize('name', list(FUNCTIONS))
+@pytest.mark.parametrize('vcgen', ['wp', 'passive'])
+def test_buggy_violated(vcgen, name):
+    with pytest.raises(VerificationViolated) as failure:
+        run(name, vcgen, valid=False)
+    assert failure.value.result.status == 'violated'
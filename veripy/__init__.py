@@ -1,8 +1,17 @@
+__version__ = '0.1.0'
+
 import veripy.parser as parser
 import veripy.typecheck as typecheck
 import veripy.typecheck.types as types
 from veripy.verify import (verify, assume, invariant, do_verification,
-                            enable_verification, scope, verify_all)
+                            enable_verification, scope, verify_all,
+                            enable_cache, disable_cache, set_limits,
+                            enable_profiling, disable_profiling, export_profile,
+                            enable_runtime_checks, enable_portfolio, disable_portfolio,
+                            enable_external_solver, disable_external_solver,
+                            VerificationFailure, VerificationViolated, VerificationUnknown)
+from veripy.result import FunctionResult, ObligationResult
+from veripy.runtime import ContractViolation
 from veripy.prettyprint import pretty_print
 
 import veripy.built_ins
@@ -13,6 +22,24 @@ __all__ = [
     'typecheck',
     'verify',
     'enable_verification',
+    'enable_cache',
+    'disable_cache',
+    'set_limits',
+    'enable_profiling',
+    'disable_profiling',
+    'export_profile',
+    'enable_runtime_checks',
+    'enable_portfolio',
+    'disable_portfolio',
+    'enable_external_solver',
+    'disable_external_solver',
+    'ContractViolation',
+    'profiling',
+    'VerificationFailure',
+    'VerificationViolated',
+    'VerificationUnknown',
+    'FunctionResult',
+    'ObligationResult',
     'scope',
     'log',
     'do_verification',
@@ -20,5 +47,6 @@ __all__ = [
     'transformer',
     'prettyprint',
     'types',
-    'built_ins'
+    'built_ins',
+    'cache'
 ]
\ No newline at end of file
@@ -0,0 +1,153 @@
+'''
+Command-line driver: import modules and packages, and verify every function they decorate with `verify`.
+
+    python -m veripy [--static] [--jobs N] [--timeout SECONDS] [--cache-dir DIR | --no-cache] [--incremental]
+                     [--only PATTERN ...] [--json REPORT.json] [--junit REPORT.xml] TARGET ...
+
+A target is a module or package name, or the path of a Python file or directory (packages and
+directories are searched recursively). Functions decorated before the module opens a scope belong
+to a scope named after the module. The calls of the modules to `verify_all` / `do_verification`
+are deferred: every function is verified by the driver once all the targets are imported.
+With `--static`, the files are parsed instead of imported (see `veripy.discovery`): nothing is
+executed, but the arguments of `verify` and `scope` must be literals.
+
+`--only` patterns are `scope::name`, with `fnmatch` wildcards; a pattern without `::` selects a
+whole scope. The exit status is 1 if some function is not verified or some target could not be
+imported.
+'''
+import os
+import sys
+import json
+import fnmatch
+import pkgutil
+import argparse
+import importlib
+import traceback
+import veripy
+from veripy.verify import STORE
+from veripy.result import summary, json_report, junit_report
+from veripy.discovery import discover, register
+
+def file_module(path : str):
+    '''
+    The name of the module of the file `path`, with the directory it is imported from added to `sys.path`
+    '''
+    directory, file = os.path.split(os.path.abspath(path))
+    stem = os.path.splitext(file)[0]
+    parts = [] if stem == '__init__' else [stem]
+    while os.path.isfile(os.path.join(directory, '__init__.py')):
+        directory, package = os.path.split(directory)
+        parts.insert(0, package)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return '.'.join(parts)
+
+def python_files(directory : str):
+    paths = []
+    for (root, subdirs, files) in os.walk(directory):
+        subdirs[:] = sorted(d for d in subdirs if not d.startswith(('.', '__')))
+        paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith('.py'))
+    return paths
+
+def module_names(target : str):
+    '''
+    The modules of `target`, in import order
+    '''
+    if os.path.isfile(target):
+        return [file_module(target)]
+    if os.path.isdir(target):
+        return [file_module(path) for path in python_files(target)]
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module = importlib.import_module(target)
+    if not hasattr(module, '__path__'):
+        return [target]
+    return [target] + [m.name for m in pkgutil.walk_packages(module.__path__, prefix=f'{target}.')]
+
+def source_files(target : str):
+    '''
+    The files of `target`; a module name is looked up on `sys.path` without importing its packages
+    '''
+    if os.path.isfile(target):
+        return [target]
+    if os.path.isdir(target):
+        return python_files(target)
+    parts = target.split('.')
+    for root in [os.getcwd()] + sys.path:
+        path = os.path.join(root, *parts)
+        if os.path.isfile(os.path.join(path, '__init__.py')):
+            return python_files(path)
+        if os.path.isfile(path + '.py'):
+            return [path + '.py']
+    raise ImportError(f'No module named {target}')
+
+def load_static(path : str):
+    register(discover(path, file_module(path)))
+
+def load(name : str):
+    if name not in STORE.store:
+        STORE.push(name)
+    importlib.import_module(name)
+
+def matcher(patterns):
+    '''
+    The predicate `selected(scope, name)` of the functions matched by `patterns`
+    '''
+    if not patterns:
+        return None
+    patterns = [p if '::' in p else f'{p}::*' for p in patterns]
+    return lambda scope, name: any(fnmatch.fnmatchcase(f'{scope}::{name}', p) for p in patterns)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(prog='python -m veripy', description=__doc__,
+                                         formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('targets', nargs='+', metavar='TARGET')
+    arg_parser.add_argument('--static', action='store_true', help='parse the modules instead of importing them')
+    arg_parser.add_argument('--jobs', '-j', type=int, default=1)
+    arg_parser.add_argument('--timeout', type=float, default=None, help='seconds per obligation')
+    arg_parser.add_argument('--cache-dir', default=None)
+    arg_parser.add_argument('--no-cache', action='store_true')
+    arg_parser.add_argument('--incremental', action='store_true')
+    arg_parser.add_argument('--only', nargs='*', default=[], metavar='PATTERN')
+    arg_parser.add_argument('--json', metavar='REPORT.json')
+    arg_parser.add_argument('--junit', metavar='REPORT.xml')
+    args = arg_parser.parse_args(argv)
+
+    if args.no_cache:
+        veripy.disable_cache()
+    elif args.cache_dir is not None:
+        veripy.enable_cache(args.cache_dir)
+    veripy.set_limits(timeout=args.timeout)
+    STORE.defer()
+
+    failed = []
+    for target in args.targets:
+        try:
+            units = source_files(target) if args.static else module_names(target)
+        except Exception:
+            failed.append((target, traceback.format_exc()))
+            continue
+        for unit in units:
+            try:
+                load_static(unit) if args.static else load(unit)
+            except Exception:
+                failed.append((unit, traceback.format_exc()))
+    for (unit, error) in failed:
+        print(f'Could not {"read" if args.static else "import"} {unit}:\n{error}', file=sys.stderr)
+
+    selected = matcher(args.only)
+    scopes = [scope for scope in STORE.store
+              if any(selected is None or selected(scope, f_name) for (f_name, _) in STORE.store[scope]['vf'])]
+    results = STORE.verify_scopes(scopes, True, args.jobs, incremental=args.incremental, selected=selected)
+
+    counts = summary(results)
+    print(', '.join(f'{n} {status}' for (status, n) in counts.items()))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(json_report(results), f, indent=1, default=str)
+    if args.junit:
+        junit_report(results).write(args.junit, encoding='utf-8', xml_declaration=True)
+    return 1 if failed or counts['verified'] < len(results) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+from veripy.parser.syntax import *
+from veripy.typecheck.types import TARR
+
+'''
+Arrays are encoded as Z3 arrays from integers together with an uninterpreted `len`.
+Element assignments are functional updates (`Store`) of the whole array, which keep its length.
+Every subscript evaluated by the program gets a bounds-check obligation.
+'''
+
+def length(arr : Expr):
+    return FunctionCall(Var('len'), [arr])
+
+def in_bounds(arr : Expr, index : Expr):
+    return BinOp(BinOp(Literal(VInt(0)), CompOps.Le, index),
+                 BoolOps.And,
+                 BinOp(index, CompOps.Lt, length(arr)))
+
+def same_length(a1 : Expr, a2 : Expr):
+    return BinOp(length(a1), CompOps.Eq, length(a2))
+
+def bounds_checks(expr : Expr):
+    '''
+    The conditions under which the subscripts and updates evaluated by `expr` are in bounds.
+    `and` / `or` are evaluated lazily, so their right operand is only checked when the
+    left one does not decide the result.
+    '''
+    checks, seen = [], set()
+    stack = [(expr, None)]
+    while stack:
+        e, guard = stack.pop()
+        if isinstance(e, BinOp) and e.op in (BoolOps.And, BoolOps.Or, BoolOps.Implies):
+            left = UnOp(BoolOps.Not, e.e1) if e.op == BoolOps.Or else e.e1
+            stack.append((e.e2, left if guard is None else BinOp(guard, BoolOps.And, left)))
+            stack.append((e.e1, guard))
+            continue
+        if isinstance(e, Quantification):
+            continue
+        if isinstance(e, Subscript):
+            check = in_bounds(e.var, e.subscript)
+        elif isinstance(e, Store):
+            check = in_bounds(e.arr, e.index)
+        else:
+            check = None
+        if check is not None:
+            check = check if guard is None else BinOp(guard, BoolOps.Implies, check)
+            if check not in seen:
+                seen.add(check)
+                checks.append(check)
+        stack.extend((c, guard) for c in reversed(e.children()))
+    return checks
+
+def check_bounds(stmt : Stmt):
+    '''
+    `stmt` with the bounds checks of its expressions asserted before they are evaluated
+    (assumptions are contracts and are not checked)
+    '''
+    if isinstance(stmt, Seq):
+        stmts = [check_bounds(s) for s in flatten_seq(stmt)]
+        result = stmts.pop()
+        while stmts:
+            result = Seq(stmts.pop(), result)
+        return result
+    if isinstance(stmt, If):
+        checked, e = If(stmt.cond, check_bounds(stmt.lb), check_bounds(stmt.rb)), stmt.cond
+    elif isinstance(stmt, Assign):
+        checked, e = stmt, stmt.expr
+    elif isinstance(stmt, Assert):
+        checked, e = stmt, stmt.e
+    else:
+        return stmt
+    for c in reversed(bounds_checks(e)):
+        checked = Seq(Assert(c), checked)
+    return checked
+
+def length_facts(sigma : dict, hypothesis : Expr):
+    '''
+    `hypothesis` strengthened with the non-negativity of the length of every array of `sigma`
+    '''
+    for (name, ty) in sorted(sigma.items(), key=lambda item: item[0]):
+        if isinstance(ty, TARR):
+            hypothesis = BinOp(hypothesis, BoolOps.And, BinOp(length(Var(name)), CompOps.Ge, Literal(VInt(0))))
+    return hypothesis
@@ -0,0 +1,138 @@
+import os
+import z3
+import uuid
+import hashlib
+import veripy
+from functools import lru_cache
+
+DEFAULT_CACHE_DIR = os.path.join(
+                        os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                        'veripy')
+
+@lru_cache(maxsize=None)
+def implementation_fingerprint():
+    '''
+    Hash of the sources of veripy itself: any change to the verifier invalidates the proofs,
+    whether or not `__version__` was bumped. If a source cannot be read, the fingerprint is
+    unique to this process, so nothing is reused.
+    '''
+    root = os.path.dirname(os.path.abspath(veripy.__file__))
+    h = hashlib.sha256()
+    try:
+        for (directory, subdirs, files) in os.walk(root):
+            subdirs[:] = sorted(d for d in subdirs if d != '__pycache__')
+            for name in sorted(f for f in files if f.endswith('.py')):
+                path = os.path.join(directory, name)
+                h.update(os.path.relpath(path, root).encode('utf-8'))
+                h.update(b'\0')
+                with open(path, 'rb') as f:
+                    h.update(f.read())
+                h.update(b'\0')
+    except OSError:
+        return uuid.uuid4().hex
+    return h.hexdigest()
+
+class ProofCache:
+    '''
+    Content-addressed on-disk cache of verified functions.
+    An entry is an empty file named after the hash of everything the proof depends on,
+    i.e. the function source, its contracts, its input types, the contracts of its callees,
+    the sources of veripy (see `implementation_fingerprint`) and the Z3 version.
+    The least recently used entries are evicted once there are more than `max_entries`, down to
+    three quarters of `max_entries`. The entries are counted once per run and then tracked in
+    memory, so inserting does not list the directory.
+    '''
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_entries=4096, enabled=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.enabled = enabled and not os.environ.get('VERIPY_NO_CACHE')
+        # (path, number of entries) as of the last count, see `insert`
+        self.count = None
+
+    def key(self, source : str, inputs, requires, ensures, *dependencies : str):
+        h = hashlib.sha256()
+        for part in (source, repr(list(inputs)), repr(list(requires)), repr(list(ensures)), *dependencies,
+                     implementation_fingerprint(), z3.get_version_string()):
+            h.update(part.encode('utf-8'))
+            h.update(b'\0')
+        return h.hexdigest()
+
+    def proofs(self):
+        return os.path.join(self.path, 'proofs')
+
+    def graph(self):
+        '''
+        Path of the dependency graph used for incremental verification (see `veripy.depgraph`)
+        '''
+        return os.path.join(self.path, 'graph.json')
+
+    def portfolio(self):
+        '''
+        Path of the winning solver configurations of portfolio solving (see `veripy.portfolio`)
+        '''
+        return os.path.join(self.path, 'portfolio.json')
+
+    def smtlib(self):
+        '''
+        Directory of the SMT-LIB scripts of slow obligations (see `veripy.smtlib`)
+        '''
+        return os.path.join(self.path, 'smt2')
+
+    def entry(self, key : str):
+        return os.path.join(self.proofs(), key)
+
+    def hit(self, key : str):
+        '''
+        Return whether `key` is cached, marking the entry as recently used
+        '''
+        if not self.enabled:
+            return False
+        try:
+            os.utime(self.entry(key))
+            return True
+        except OSError:
+            return False
+
+    def insert(self, key : str):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.proofs(), exist_ok=True)
+            if self.count is None or self.count[0] != self.path:
+                self.count = (self.path, len(os.listdir(self.proofs())))
+            entry = self.entry(key)
+            if not os.path.exists(entry):
+                self.count = (self.path, self.count[1] + 1)
+            with open(entry, 'w'):
+                pass
+            if self.count[1] > self.max_entries:
+                self.evict()
+        except OSError:
+            pass
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.proofs()):
+            try:
+                entries.append((os.stat(self.entry(name)).st_mtime, name))
+            except OSError:
+                pass
+        entries.sort()
+        keep = self.max_entries * 3 // 4 if len(entries) > self.max_entries else len(entries)
+        for _, name in entries[:len(entries) - keep]:
+            try:
+                os.remove(self.entry(name))
+            except OSError:
+                keep += 1
+        self.count = (self.path, keep)
+
+    def clear(self):
+        if os.path.isdir(self.proofs()):
+            for name in os.listdir(self.proofs()):
+                try:
+                    os.remove(self.entry(name))
+                except OSError:
+                    pass
+        self.count = None
+
+CACHE = ProofCache()
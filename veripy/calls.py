@@ -0,0 +1,168 @@
+from functools import reduce
+from veripy.parser.syntax import *
+from veripy.parser.parser import parse_assertion
+from veripy.transformer import subst_many, raise_exception
+from veripy.built_ins import FUNCTIONS
+from veripy import typecheck as tc
+
+class CallLowering:
+    '''
+    Modular verification of calls: every call `f(args)` to a verified function is replaced by
+    a fresh variable `f$<k>` constrained by the contract of `f`:
+
+        f$arg<k> = arg              (for each argument)
+        assert requires_f[params := f$arg]
+        assume ensures_f[params := f$arg, ret := f$<k>]
+
+    The result variable is fresh, so it is as unconstrained as a havocked one before the
+    `assume`. Calls are hoisted out of expressions in evaluation order, so that the
+    weakest precondition never has to look into the callee; a call in the right operand of
+    `and` / `or` / `==>` is only evaluated (and its precondition only checked) under the
+    condition that the left operand does not decide the result. The postcondition of the callee
+    is about the final values of its parameters, so it may not mention those it reassigns.
+    '''
+    def __init__(self, sigma : dict, func_sigma : dict):
+        self.sigma = sigma
+        self.func_sigma = func_sigma
+        self.counter = 0
+
+    def fresh(self, name : str, ty):
+        self.counter += 1
+        var = f'{name}${self.counter}'
+        self.sigma[var] = ty
+        return var
+
+    def contract(self, constraints):
+        if not constraints:
+            return Literal(VBool(True))
+        return reduce(lambda e1, e2: BinOp(e1, BoolOps.And, e2), map(parse_assertion, constraints))
+
+    def typed(self, constraint : Expr):
+        '''
+        `constraint` with the bound variables of its quantifiers typed in the context of the caller
+        '''
+        resolved = dict()
+        tc.type_check_expr(self.sigma, self.func_sigma, tc.types.TBOOL, constraint, resolved)
+        return tc.resolve_types(constraint, resolved)
+
+    def call(self, prefix : list, call : FunctionCall, args, guard : Expr=None):
+        '''
+        The result variable of `call`, whose statements are appended to `prefix`; when the call is
+        only evaluated under the path condition `guard`, so are its statements
+        '''
+        name = call.func_name.name
+        attrs = self.func_sigma[name]
+        params, ret = attrs['params'], attrs['ret_var']
+        if len(args) != len(params):
+            raise_exception(f'{name} expects {len(params)} arguments, {len(args)} given')
+        if attrs['modifies']:
+            raise_exception(f'{name} modifies its argument {", ".join(attrs["modifies"])}; '
+                            f'calls to functions updating arrays in place are not supported')
+        stmts, mapping = [], dict()
+        for (p, a) in zip(params, args):
+            arg = self.fresh(f'{name}$arg', tc.type_infer_expr(self.sigma, self.func_sigma, a))
+            stmts.append(Assign(arg, a))
+            mapping[p] = Var(arg)
+        result = self.fresh(name, attrs['returns'])
+        pre = self.contract(attrs['requires'])
+        post = self.contract(attrs['ensures'])
+        unknown = post.variables() - set(params) - {ret}
+        if unknown:
+            raise_exception(f'The postcondition of {name} refers to {", ".join(sorted(unknown))}, '
+                            f'which is neither a parameter nor the returned variable')
+        reassigned = post.variables() & set(attrs['reassigned'])
+        if reassigned:
+            raise_exception(f'The postcondition of {name} refers to {", ".join(sorted(reassigned))}, '
+                            f'which {name} reassigns: the contract does not relate the result to the argument')
+        stmts.append(Assert(self.typed(subst_many(mapping, pre))))
+        stmts.append(Assume(self.typed(subst_many({**mapping, ret: Var(result)}, post))))
+        if guard is None:
+            prefix.extend(stmts)
+        else:
+            prefix.append(If(guard, self.prepend(stmts[:-1], stmts[-1]), Skip()))
+        return Var(result)
+
+    def hoist_rule(self, prefix : list, node : Expr, guard : Expr):
+        '''
+        Hoist the calls of `node` evaluated under the path condition `guard`: a generator yielding
+        `(child, guard)` for each sub-expression and receiving the child with its calls hoisted.
+        '''
+        if isinstance(node, BinOp) and node.op in (BoolOps.And, BoolOps.Or, BoolOps.Implies):
+            # the right operand is only evaluated when the left one does not decide the result
+            e1 = yield (node.e1, guard)
+            left = UnOp(BoolOps.Not, e1) if node.op == BoolOps.Or else e1
+            e2 = yield (node.e2, left if guard is None else BinOp(guard, BoolOps.And, left))
+            children = [e1, e2]
+        else:
+            children = []
+            for c in node.children():
+                children.append((yield (c, guard)))
+        if isinstance(node, FunctionCall) and node.func_name.name not in FUNCTIONS:
+            if node.func_name.name not in self.func_sigma:
+                raise_exception(f'Unknown function: {node.func_name.name}')
+            return self.call(prefix, node, children, guard)
+        if all(c is o for (c, o) in zip(children, node.children())):
+            return node
+        if isinstance(node, Quantification):
+            raise_exception(f'Function calls under a quantifier are not supported: {node}')
+        return node.rebuild(children)
+
+    def hoist(self, prefix : list, expr : Expr):
+        '''
+        `expr` with its calls replaced by their result variables; the statements
+        evaluating the calls are appended to `prefix`. The rules run on an explicit stack,
+        and a subterm is hoisted once per path condition.
+        '''
+        memo = dict()
+        stack = [((expr, None), self.hoist_rule(prefix, expr, None))]
+        value = None
+        while stack:
+            (_, rule) = stack[-1]
+            try:
+                (child, guard) = rule.send(value)
+            except StopIteration as done:
+                (key, _) = stack.pop()
+                value = memo[key] = done.value
+                continue
+            if (child, guard) in memo:
+                value = memo[(child, guard)]
+            elif not child.children() and not isinstance(child, FunctionCall):
+                value = child
+            else:
+                stack.append(((child, guard), self.hoist_rule(prefix, child, guard)))
+                value = None
+        return value
+
+    def lower_seq(self, stmt : Seq):
+        stmts = [self.lower(s) for s in flatten_seq(stmt)]
+        result = stmts.pop()
+        while stmts:
+            result = Seq(stmts.pop(), result)
+        return result
+
+    def lower(self, stmt : Stmt):
+        if isinstance(stmt, Seq):
+            return self.lower_seq(stmt)
+        if isinstance(stmt, If):
+            prefix = []
+            cond = self.hoist(prefix, stmt.cond)
+            return self.prepend(prefix, If(cond, self.lower(stmt.lb), self.lower(stmt.rb)))
+        if isinstance(stmt, Assign):
+            prefix = []
+            return self.prepend(prefix, Assign(stmt.var, self.hoist(prefix, stmt.expr)))
+        if isinstance(stmt, (Assert, Assume)):
+            prefix = []
+            return self.prepend(prefix, type(stmt)(self.hoist(prefix, stmt.e)))
+        return stmt
+
+    def prepend(self, prefix : list, stmt : Stmt):
+        for s in reversed(prefix):
+            stmt = Seq(s, stmt)
+        return stmt
+
+def lower_calls(sigma : dict, func_sigma : dict, stmt : Stmt):
+    '''
+    Replace the calls of `stmt` by the contracts of the callees (see `CallLowering`).
+    The types of the fresh variables are added to `sigma`.
+    '''
+    return CallLowering(sigma, func_sigma).lower(stmt)
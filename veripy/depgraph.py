@@ -0,0 +1,143 @@
+import os
+import ast
+import json
+import hashlib
+import inspect
+import z3
+from veripy.cache import implementation_fingerprint
+from veripy.built_ins import BUILT_INS, FUNCTIONS
+from veripy.source import FunctionSource, function_source
+
+def fingerprint(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+class FunctionNode:
+    '''
+    A verified function in the dependency graph.
+        - body      : fingerprint of the function definition without its decorators
+                      (line numbers and formatting are ignored)
+        - contract  : fingerprint of its input types, `requires` and `ensures`, and of what its
+                      callers derive from its definition (parameters, returned variable, modified
+                      and reassigned parameters, type)
+        - callees   : names of the functions of the same scope it calls
+        - status    : status of its last verification
+    '''
+    def __init__(self, body, contract, callees, status=None):
+        self.body = body
+        self.contract = contract
+        self.callees = callees
+        self.status = status
+
+    def to_dict(self):
+        return {'body': self.body, 'contract': self.contract, 'callees': sorted(self.callees), 'status': self.status}
+
+    @staticmethod
+    def from_dict(d):
+        return FunctionNode(d['body'], d['contract'], set(d['callees']), d['status'])
+
+def called_functions(func_def):
+    return {n.func.id for n in ast.walk(func_def)
+            if isinstance(n, ast.Call) and isinstance(n.func, ast.Name)
+                and n.func.id not in BUILT_INS and n.func.id not in FUNCTIONS}
+
+def function_node(func, inputs, requires, ensures, scope_functions, semantics=''):
+    '''
+    The node of `func`; `semantics` describes how calls to it are lowered (see `verify.call_semantics`)
+    '''
+    func_def = function_source(func).definition()
+    func_def.decorator_list = []
+    return FunctionNode(
+        fingerprint(ast.dump(func_def)),
+        fingerprint(repr(list(inputs)), repr(list(requires)), repr(list(ensures)), semantics),
+        called_functions(func_def) & scope_functions)
+
+def node_id(func, scope):
+    '''
+    Functions are identified by their source file, scope and name, so that graphs of
+    different programs can share the same file
+    '''
+    if isinstance(func, FunctionSource):
+        return f'{func.path}:{scope}::{func.name}'
+    try:
+        path = os.path.abspath(inspect.getsourcefile(func))
+    except TypeError:
+        path = func.__module__
+    return f'{path}:{scope}::{func.__name__}'
+
+class DependencyGraph:
+    '''
+    Call graph of the verified functions, with fingerprints of their bodies and contracts.
+    A function has to be re-verified when its body or contract changed since its last
+    successful verification, or when the contract of one of its callees changed.
+    '''
+    def __init__(self, nodes=None, version=None):
+        self.nodes = nodes if nodes is not None else dict()
+        self.version = version if version is not None else DependencyGraph.current_version()
+
+    @staticmethod
+    def current_version():
+        return f'{implementation_fingerprint()}/{z3.get_version_string()}'
+
+    def callers(self, ids):
+        '''
+        Ids of the functions calling one of `ids` (in the same scope)
+        '''
+        result = set()
+        for (i, node) in self.nodes.items():
+            prefix = i[:i.rindex('::') + 2]
+            if any(prefix + callee in ids for callee in node.callees):
+                result.add(i)
+        return result
+
+    def dirty(self, previous):
+        '''
+        Ids of the functions of this graph whose last verification in `previous` is out of date
+        '''
+        if previous.version != self.version:
+            return set(self.nodes)
+        result, changed_contracts = set(), set()
+        for (i, node) in self.nodes.items():
+            old = previous.nodes.get(i)
+            if old is None or old.contract != node.contract:
+                changed_contracts.add(i)
+            if old is None or old.status != 'verified' or old.body != node.body or old.contract != node.contract:
+                result.add(i)
+        # a callee that disappeared changes the meaning of its callers as much as a new contract
+        changed_contracts.update(self.removed(previous))
+        return result | self.callers(changed_contracts)
+
+    def removed(self, previous):
+        '''
+        Ids of the functions of `previous` that are no longer in the scopes of this graph
+        '''
+        scopes = {i[:i.rindex('::') + 2] for i in self.nodes}
+        return {i for i in previous.nodes if i not in self.nodes and i[:i.rindex('::') + 2] in scopes}
+
+    def merge(self, previous):
+        '''
+        `previous` updated with the functions of this graph (other programs and scopes are kept)
+        '''
+        nodes = dict()
+        if previous.version == self.version:
+            removed = self.removed(previous)
+            nodes = {i: n for (i, n) in previous.nodes.items() if i not in removed}
+        nodes.update(self.nodes)
+        return DependencyGraph(nodes, self.version)
+
+    def save(self, path : str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump({'version': self.version, 'nodes': {i: n.to_dict() for (i, n) in self.nodes.items()}}, f)
+
+    @staticmethod
+    def load(path : str):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            return DependencyGraph({i: FunctionNode.from_dict(d) for (i, d) in data['nodes'].items()}, data['version'])
+        except (OSError, ValueError, KeyError):
+            return DependencyGraph()
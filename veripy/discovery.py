@@ -0,0 +1,125 @@
+'''
+Static discovery of the functions to verify: a Python file is parsed, not imported, and the
+functions decorated with `verify(...)` at its top level are registered in `STORE` with the
+contracts written in the decorator. The module is never executed, so its imports and top-level
+code cost nothing, but the arguments of `verify` and `scope` have to be literals (the input types
+of `inputs` are read like annotations).
+'''
+import os
+import ast
+import tokenize
+from functools import partial
+from veripy.verify import STORE, verify_func
+from veripy.source import FunctionSource, definition_source
+from veripy.typecheck import types as tc_types
+
+# the parameters of `verify`, in order
+VERIFY_PARAMS = ('inputs', 'requires', 'ensures', 'vcgen', 'timeout', 'rlimit', 'total_timeout', 'runtime_check')
+
+class Aliases:
+    '''
+    The names a module refers to `verify` and `scope` by: their own names (`from veripy import *`),
+    the names they are imported as, and attributes of the `veripy` module
+    '''
+    def __init__(self, tree : ast.Module):
+        self.functions = {'verify': {'verify'}, 'scope': {'scope'}}
+        self.modules = {'veripy'}
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom) and node.module in ('veripy', 'veripy.verify'):
+                for alias in node.names:
+                    if alias.name in self.functions:
+                        self.functions[alias.name].add(alias.asname or alias.name)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    if alias.name == 'veripy':
+                        self.modules.add(alias.asname or alias.name)
+
+    def is_call(self, node : ast.expr, function : str):
+        if not isinstance(node, ast.Call):
+            return False
+        f = node.func
+        if isinstance(f, ast.Name):
+            return f.id in self.functions[function]
+        return isinstance(f, ast.Attribute) and f.attr == function \
+               and isinstance(f.value, ast.Name) and f.value.id in self.modules
+
+def static_type(node : ast.expr):
+    '''
+    The veripy type of a type expression, like an annotation (`typing.List[int]` is `List[int]`)
+    '''
+    if isinstance(node, ast.Attribute):
+        node = ast.Name(node.attr, ast.Load())
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Attribute):
+        node = ast.Subscript(ast.Name(node.value.attr, ast.Load()), node.slice, ast.Load())
+    return tc_types.to_ast_type(node)
+
+def static_inputs(path : str, node : ast.expr):
+    if not isinstance(node, (ast.List, ast.Tuple)):
+        raise Exception(f'{path}:{node.lineno}: the inputs of `verify` must be a list of (name, type) pairs')
+    inputs = []
+    for pair in node.elts:
+        if not (isinstance(pair, (ast.List, ast.Tuple)) and len(pair.elts) == 2
+                and isinstance(pair.elts[0], ast.Constant) and isinstance(pair.elts[0].value, str)):
+            raise Exception(f'{path}:{pair.lineno}: the inputs of `verify` must be a list of (name, type) pairs')
+        inputs.append((pair.elts[0].value, static_type(pair.elts[1])))
+    return inputs
+
+def static_literal(path : str, node : ast.expr, what : str):
+    try:
+        return ast.literal_eval(node)
+    except (ValueError, TypeError):
+        raise Exception(f'{path}:{node.lineno}: {what} must be a literal to be read statically')
+
+def verify_arguments(path : str, call : ast.Call):
+    '''
+    The arguments of a `verify(...)` decorator, by parameter name
+    '''
+    arguments = dict()
+    nodes = list(zip(VERIFY_PARAMS, call.args)) + [(k.arg, k.value) for k in call.keywords]
+    for (param, node) in nodes:
+        if param not in VERIFY_PARAMS:
+            raise Exception(f'{path}:{call.lineno}: unknown argument of `verify`: {param}')
+        if param == 'inputs':
+            arguments[param] = static_inputs(path, node)
+        else:
+            arguments[param] = static_literal(path, node, f'the {param} of `verify`')
+    return arguments
+
+def discover(path : str, module : str=None):
+    '''
+    The functions of the file `path` decorated with `verify`, as `(scope, source, arguments)` with the
+    `FunctionSource` of the function and the arguments of `verify`. Functions decorated before the
+    first call to `scope` belong to the scope `module` (the name of the file by default).
+    '''
+    with tokenize.open(path) as f:
+        lines = f.readlines()
+    tree = ast.parse(''.join(lines), path)
+    aliases = Aliases(tree)
+    scope = module if module is not None else os.path.splitext(os.path.basename(path))[0]
+    functions = []
+    for node in tree.body:
+        if isinstance(node, ast.Expr) and aliases.is_call(node.value, 'scope'):
+            if len(node.value.args) != 1:
+                raise Exception(f'{path}:{node.lineno}: `scope` expects a name')
+            scope = static_literal(path, node.value.args[0], 'the name of a scope')
+        elif isinstance(node, ast.FunctionDef):
+            calls = [d for d in node.decorator_list if aliases.is_call(d, 'verify')]
+            if calls:
+                source = FunctionSource(node.name, definition_source(lines, node), os.path.abspath(path))
+                functions.append((scope, source, verify_arguments(path, calls[0])))
+    return functions
+
+def register(functions):
+    '''
+    Register the discovered `functions` in `STORE`, as the `verify` decorator does when a module is imported
+    '''
+    for (scope, source, arguments) in functions:
+        if scope not in STORE.store:
+            STORE.push(scope)
+        inputs = arguments.get('inputs', [])
+        requires = arguments.get('requires', [])
+        ensures = arguments.get('ensures', [])
+        STORE.defer_func_attr(scope, source.name, source, inputs, requires, ensures)
+        verification = partial(verify_func, source, scope, inputs, requires, ensures, arguments.get('vcgen', 'wp'),
+                               arguments.get('timeout'), arguments.get('rlimit'), arguments.get('total_timeout'))
+        STORE.push_verification(source.name, verification, scope)
@@ -1,3 +1,4 @@
+import ast
 from veripy.parser import syntax
 from veripy.typecheck.types import to_ast_type
 
@@ -91,16 +92,10 @@ class ProcessSubscript(ASTBuilder):
             while self.subscripts and self.subscripts[0] != ']':
                 store.append(self.subscripts[0])
                 self.subscripts = self.subscripts[1:]
-            if len(store) == 3:
-                subscript = syntax.Slice(store[0], store[2])
-            elif len(store) == 2:
-                fst, snd = store
-                if fst == ':':
-                    subscript = syntax.Slilce(None, snd.makeAST())
-                else:
-                    subscript = syntax.Slice(fst.makeAST(), None)
-            else:
-                subscript = store[0].makeAST()
+            if len(store) != 1:
+                # contracts are about elements: slices have no encoding, in any parser front-end
+                raise Exception(f'Slices are not supported in assertions: subscript of {var.name}')
+            subscript = store[0].makeAST()
             if result is None:
                 result = syntax.Subscript(var, subscript)
             else:
@@ -120,12 +115,30 @@ class ProcessFnCall(ASTBuilder):
             return syntax.UnOp(UNOP_DICT[func_name.name], args[0].makeAST())
         return syntax.FunctionCall(func_name, [x.makeAST() for x in args], native=False)
 
+def make_quantification(quantifier, var, ty, expr):
+    '''
+    Build the AST of `quantifier var : ty :: expr` from the ASTs of its parts,
+    renaming the bound variable apart. Shared by all parser front-ends.
+    '''
+    import veripy.transformer as trans
+    if ty is not None:
+        ty = to_ast_type(ast.Name(ty.name, ast.Load()))
+
+    bounded = syntax.Var(var.name + '$$0')
+    e = trans.subst(var.name, bounded, expr)
+    if quantifier == 'exists':
+        # exists x. Q <==> not forall x. not Q
+        return syntax.UnOp(BoolOps.Not,
+                    syntax.Quantification(bounded,
+                                            syntax.UnOp(BoolOps.Not, e), ty=ty))
+    else:
+        return syntax.Quantification(bounded, e, ty=ty)
+
 class ProcessQuantification(ASTBuilder):
     def __init__(self, tokens):
         self.value = tokens
     
     def makeAST(self):
-        import veripy.transformer as trans
         ty = None
         if len(self.value) == 3:
             quantifier, var, expr = self.value
@@ -133,15 +146,4 @@ class ProcessQuantification(ASTBuilder):
             quantifier, var, ty, expr = self.value
         if ty is not None:
             ty = ty.makeAST()
-            ty = to_ast_type(ty.name)
-
-        ori = var.makeAST()
-        bounded = syntax.Var(ori.name + '$$0')
-        e = trans.subst(ori.name, bounded, expr.makeAST())
-        if quantifier == 'exists':
-            # exists x. Q <==> not forall x. not Q
-            return syntax.UnOp(BoolOps.Not,
-                        syntax.Quantification(bounded,
-                                                syntax.UnOp(BoolOps.Not, e), ty=ty))
-        else:
-            return syntax.Quantification(bounded, e, ty=ty)
\ No newline at end of file
+        return make_quantification(quantifier, var.makeAST(), ty, expr.makeAST())
\ No newline at end of file
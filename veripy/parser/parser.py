@@ -1,12 +1,13 @@
+import os
 import sys
-from functools import reduce, wraps
+from functools import reduce, wraps, lru_cache
 from pyparsing import *
 from veripy.parser.ast_builder import *
+from veripy.parser import pratt
 
 ParserElement.enablePackrat()
 
 ppc = pyparsing_common
-sys.setrecursionlimit(114 * 514)
 
 # Basic Tokens
 INT = ppc.integer
@@ -124,20 +125,75 @@ assertion_expr <<= \
 expr <<= (assertion_expr
         | arith_expr)
 
+'''
+Contract strings repeat across functions and loop invariants, and the resulting
+ASTs are immutable, so parses are memoized per string
+'''
+PARSE_CACHE_SIZE = 4096
+
+def pyparsing_parse_expr(e):
+    return expr().parseString(e, parseAll=True)[0].makeAST()
+
+def pyparsing_parse_assertion(assertion):
+    return assertion_expr().parseString(assertion, parseAll=True)[0].makeAST()
+
+'''
+Parser front-ends producing the same ASTs (see tests/test_parsers.py): the precedence-climbing
+parser in `veripy.parser.pratt`, or the much slower pyparsing grammar above. Both accept the
+same assertions; in particular, calls take one or two arguments.
+The front-end is chosen by the `VERIPY_PARSER` environment variable at import time.
+'''
+PARSERS = {
+    'pyparsing' : (pyparsing_parse_expr, pyparsing_parse_assertion),
+    'pratt'     : (pratt.parse_expr, pratt.parse_assertion)
+}
+
+PARSER = None
+PARSE_EXPR, PARSE_ASSERTION = PARSERS['pratt']
+
+def use_parser(name : str):
+    global PARSER, PARSE_EXPR, PARSE_ASSERTION
+    if name not in PARSERS:
+        raise Exception(f'Unknown parser: {name}')
+    if name == 'pyparsing':
+        # the packrat grammar recurses deeply on long assertions; only raised for this opt-in front-end
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 114 * 514))
+    PARSER = name
+    PARSE_EXPR, PARSE_ASSERTION = PARSERS[name]
+    parse_expr.cache_clear()
+    parse_assertion.cache_clear()
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_expr(e):
-    return expr().parseString(e)[0].makeAST()
+    return PARSE_EXPR(e)
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
 def parse_assertion(assertion):
-    return assertion_expr().parseString(assertion)[0].makeAST()
+    return PARSE_ASSERTION(assertion)
+
+def parse_cache_info():
+    '''
+    Hit / miss statistics of the parse caches
+    '''
+    return {
+        'parse_expr'     : parse_expr.cache_info(),
+        'parse_assertion': parse_assertion.cache_info()
+    }
+
+def clear_parse_cache():
+    parse_expr.cache_clear()
+    parse_assertion.cache_clear()
+
+use_parser(os.environ.get('VERIPY_PARSER', 'pratt'))
 
 def parse_comparison(comp):
-    return arith_comp().parseString(comp)[0].makeAST()
+    return arith_comp().parseString(comp, parseAll=True)[0].makeAST()
 
 def parse_bool_expr(bexp):
-    return bool_expr().parseString(bexp)[0].makeAST()
+    return bool_expr().parseString(bexp, parseAll=True)[0].makeAST()
 
 def parse_arith_expr(aexp):
-    return arith_expr().parseString(aexp)[0].makeAST()
+    return arith_expr().parseString(aexp, parseAll=True)[0].makeAST()
 
 def parse_subscript_expr(sexp):
-    return subscript_expr().parseString(sexp)[0].makeAST()
\ No newline at end of file
+    return subscript_expr().parseString(sexp, parseAll=True)[0].makeAST()
\ No newline at end of file
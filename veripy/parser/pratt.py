@@ -0,0 +1,162 @@
+import re
+from veripy.parser import syntax
+from veripy.parser.ast_builder import BINOP_DICT, UNOP_DICT, make_quantification
+
+'''
+A tokenizer and precedence-climbing parser for assertions. It produces the same ASTs
+as the pyparsing grammar in `veripy.parser.parser`, including its operator precedences:
+every operator has a level of its own, e.g. `+` binds tighter than `-`.
+'''
+
+class ParseError(Exception): pass
+
+TOKEN = re.compile(r'\s*(?:(\d+)|([A-Za-z_][A-Za-z_0-9]*)|(<==>|==>|::|<=|>=|==|!=|//|[-+*%<>()\[\]:,]))')
+
+KEYWORDS = ('and', 'or', 'not', 'forall', 'exists', 'True', 'False')
+
+# operator -> (binding power, right associative)
+INFIX = {
+    '<==>': (1, True),
+    '==>' : (2, True),
+    'or'  : (3, False),
+    'and' : (4, False),
+    '!='  : (6, False),
+    '=='  : (7, False),
+    '>='  : (8, False),
+    '>'   : (9, False),
+    '<='  : (10, False),
+    '<'   : (11, False),
+    '-'   : (12, False),
+    '+'   : (13, False),
+    '//'  : (14, False),
+    '*'   : (15, False),
+    '%'   : (16, False),
+}
+
+NOT_BP = 5
+ARITH_BP = 11
+NEG_BP = 17
+
+def tokenize(text : str):
+    tokens = []
+    pos = 0
+    end = len(text.rstrip())
+    while pos < end:
+        m = TOKEN.match(text, pos)
+        if m is None:
+            raise ParseError(f'Unexpected character at {pos}: {text[pos:pos + 10]!r}')
+        num, name, op = m.groups()
+        if num is not None:
+            tokens.append(('int', num))
+        elif name is not None:
+            tokens.append(('op' if name in KEYWORDS else 'name', name))
+        else:
+            tokens.append(('op', op))
+        pos = m.end()
+    tokens.append(('end', None))
+    return tokens
+
+class Parser:
+    def __init__(self, text : str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def expect(self, value):
+        kind, v = self.advance()
+        if v != value:
+            raise ParseError(f'Expected {value!r}, found {v!r} in {self.text!r}')
+
+    def expect_name(self):
+        kind, v = self.advance()
+        if kind != 'name':
+            raise ParseError(f'Expected an identifier, found {v!r} in {self.text!r}')
+        return syntax.Var(v)
+
+    def parse(self):
+        e = self.expr(0)
+        if self.peek()[0] != 'end':
+            raise ParseError(f'Unexpected {self.peek()[1]!r} in {self.text!r}')
+        return e
+
+    def expr(self, min_bp):
+        lhs = self.prefix()
+        while True:
+            kind, op = self.peek()
+            if kind != 'op' or op not in INFIX:
+                return lhs
+            bp, right = INFIX[op]
+            if bp <= min_bp:
+                return lhs
+            self.advance()
+            rhs = self.expr(bp - 1 if right else bp)
+            lhs = syntax.BinOp(lhs, BINOP_DICT[op], rhs)
+
+    def prefix(self):
+        kind, v = self.advance()
+        if kind == 'int':
+            return syntax.Literal(syntax.VInt(v))
+        if kind == 'name':
+            return self.name(syntax.Var(v))
+        if v in ('True', 'False'):
+            return syntax.Literal(syntax.VBool(v))
+        if v == 'not':
+            return syntax.UnOp(UNOP_DICT[v], self.expr(NOT_BP))
+        if v == '-':
+            return syntax.UnOp(UNOP_DICT[v], self.expr(NEG_BP))
+        if v == '(':
+            e = self.expr(0)
+            self.expect(')')
+            return e
+        if v in ('forall', 'exists'):
+            return self.quantification(v)
+        raise ParseError(f'Unexpected {v!r} in {self.text!r}')
+
+    def name(self, var):
+        if self.peek()[1] == '(':
+            self.advance()
+            args = [self.expr(0)]
+            while self.peek()[1] == ',':
+                self.advance()
+                args.append(self.expr(0))
+            self.expect(')')
+            if len(args) > 2:
+                # as in the pyparsing grammar (`built_in_call`)
+                raise ParseError(f'Calls in assertions take one or two arguments: {self.text!r}')
+            return syntax.FunctionCall(var, args, native=False)
+        result = var
+        while self.peek()[1] == '[':
+            self.advance()
+            result = syntax.Subscript(result, self.subscript())
+            self.expect(']')
+        return result
+
+    def subscript(self):
+        index = None if self.peek()[1] == ':' else self.expr(ARITH_BP)
+        if self.peek()[1] == ':':
+            # contracts are about elements: slices have no encoding, as in the pyparsing grammar
+            raise ParseError(f'Slices are not supported in assertions: {self.text!r}')
+        return index
+
+    def quantification(self, quantifier):
+        var = self.expect_name()
+        ty = None
+        if self.peek()[1] == ':':
+            self.advance()
+            ty = self.expect_name()
+        self.expect('::')
+        return make_quantification(quantifier, var, ty, self.expr(0))
+
+def parse_expr(e):
+    return Parser(e).parse()
+
+def parse_assertion(assertion):
+    return Parser(assertion).parse()
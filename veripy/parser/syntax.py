@@ -1,3 +1,5 @@
+import weakref
+import threading
 from enum import Enum
 
 class Op: pass
@@ -31,6 +33,12 @@ class Value:
     def __init__(self, v):
         self.v = v
 
+    def __eq__(self, other):
+        return type(self) is type(other) and self.v == other.v
+
+    def __hash__(self):
+        return hash((type(self), self.v))
+
 class VInt(Value):
     def __init__(self, v):
         super().__init__(int(v))
@@ -51,107 +59,250 @@ class VBool(Value):
     def __repr__(self):
         return f'VBool {self.v}'
 
-class Expr: pass
+INTERN_TABLE = weakref.WeakValueDictionary()
+INTERN_LOCK = threading.Lock()
+
+def intern(cls, *fields):
+    '''
+    Return the live node of class `cls` with the given fields, creating it if there is none.
+    '''
+    key = (cls, *fields)
+    node = INTERN_TABLE.get(key)
+    if node is None:
+        with INTERN_LOCK:
+            node = INTERN_TABLE.get(key)
+            if node is None:
+                node = object.__new__(cls)
+                for name, value in zip(cls.__slots__, fields):
+                    object.__setattr__(node, name, value)
+                object.__setattr__(node, '_hash', hash(key))
+                INTERN_TABLE[key] = node
+    return node
+
+class Expr:
+    '''
+    Expressions are immutable and hash-consed: building a node that is structurally
+    equal to a live one returns that very object, so structurally equal subterms are
+    shared and equality is identity.
+    '''
+    __slots__ = ['_hash', '_free', '__weakref__']
+
+    def __hash__(self):
+        return self._hash
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'{type(self).__name__} is immutable')
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, f) for f in type(self).__slots__))
+
+    def children(self):
+        '''
+        The direct sub-expressions of this node (bound variables excluded)
+        '''
+        return ()
+
+    def rebuild(self, children):
+        '''
+        Build a node like this one with its `children()` replaced by `children`
+        '''
+        return self
+
+    def variables(self):
+        '''
+        The free variables of this expression, computed iteratively and cached on each node
+        '''
+        stack = [self]
+        while stack:
+            node = stack[-1]
+            if hasattr(node, '_free'):
+                stack.pop()
+                continue
+            pending = [c for c in node.children() if not hasattr(c, '_free')]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            if isinstance(node, Var):
+                free = frozenset((node.name,))
+            elif isinstance(node, Quantification):
+                free = node.expr._free - {node.var.name}
+            else:
+                free = frozenset().union(*(c._free for c in node.children()))
+            object.__setattr__(node, '_free', free)
+        return self._free
+
+def postorder(expr : Expr, visit, descend=None):
+    '''
+    Fold `expr` bottom-up with an explicit stack: `visit(node, results)` receives the results of
+    `node.children()`. Shared subterms are visited once. When `descend(node)` is false the children
+    are not visited and `visit(node, None)` is called instead.
+    '''
+    memo = dict()
+    stack = [expr]
+    while stack:
+        node = stack[-1]
+        if node in memo:
+            stack.pop()
+            continue
+        children = node.children() if descend is None or descend(node) else None
+        pending = [c for c in children if c not in memo] if children else []
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        memo[node] = visit(node, None if children is None else [memo[c] for c in children])
+    return memo[expr]
 
 class Var(Expr):
-    def __init__(self, name):
-        self.name = name
+    __slots__ = ['name']
+    def __new__(cls, name):
+        return intern(cls, name)
     
     def __repr__(self):
         return f'(Var {self.name})'
-    
-    def variables(self):
-        return {self.name}
 
 class Literal(Expr):
-    def __init__(self, v : Value):
-        self.value = v
+    __slots__ = ['value']
+    def __new__(cls, v : Value):
+        return intern(cls, v)
     
     def __repr__(self):
         return f'(Literal {self.value})'
-    
-    def variables(self):
-        return set()
 
 class BinOp(Expr):
-    def __init__(self, l : Expr, op : Op, r : Expr):
-        self.e1 = l
-        self.e2 = r
-        self.op = op
+    __slots__ = ['e1', 'op', 'e2']
+    def __new__(cls, l : Expr, op : Op, r : Expr):
+        return intern(cls, l, op, r)
     
     def __repr__(self):
         return f'(BinOp {self.e1} {self.op} {self.e2})'
-    
-    def variables(self):
-        return {*self.e1.variables(), *self.e2.variables()}
+
+    def children(self):
+        return (self.e1, self.e2)
+
+    def rebuild(self, children):
+        return BinOp(children[0], self.op, children[1])
 
 class UnOp(Expr):
-    def __init__(self, op : Op, expr : Expr):
-        self.op = op
-        self.e = expr
+    __slots__ = ['op', 'e']
+    def __new__(cls, op : Op, expr : Expr):
+        return intern(cls, op, expr)
     
     def __repr__(self):
         return f'(UnOp {self.op} {self.e})'
-    
-    def variables(self):
-        return {*self.e.variables()}
+
+    def children(self):
+        return (self.e,)
+
+    def rebuild(self, children):
+        return UnOp(self.op, children[0])
 
 class Pi(Expr):
-    def __init__(self, e1, e2):
-        self.car = e1
-        self.cdr = e2
+    __slots__ = ['car', 'cdr']
+    def __new__(cls, e1, e2):
+        return intern(cls, e1, e2)
     
     def __repr__(self):
-        return f'(Pi {self.e1} {self.e2})'
-    
-    def variables(self):
-        return {*self.e1.variables, *self.e2.variables}
+        return f'(Pi {self.car} {self.cdr})'
+
+    def children(self):
+        return (self.car, self.cdr)
+
+    def rebuild(self, children):
+        return Pi(*children)
 
 class Slice(Expr):
-    def __init__(self, lower, upper, step):
-        self.lower = lower if lower is not None else Literal(VInt(0))
-        self.upper = upper
-        self.step  = step if step is not None else Literal(VInt(1))
+    __slots__ = ['lower', 'upper', 'step']
+    def __new__(cls, lower, upper, step):
+        return intern(cls,
+                      lower if lower is not None else Literal(VInt(0)),
+                      upper,
+                      step if step is not None else Literal(VInt(1)))
     
     def __repr__(self):
         return f'(Slice {self.lower} -> {self.upper} (step={self.step}))'
 
+    def children(self):
+        if self.upper is None:
+            return (self.lower, self.step)
+        return (self.lower, self.upper, self.step)
+
+    def rebuild(self, children):
+        if self.upper is None:
+            return Slice(children[0], None, children[1])
+        return Slice(*children)
+
 class FunctionCall(Expr):
-    def __init__(self, func_name, args, native=True):
-        self.func_name = func_name
-        self.args = args
-        self.native = native
+    __slots__ = ['func_name', 'args', 'native']
+    def __new__(cls, func_name, args, native=True):
+        return intern(cls, func_name, tuple(args), native)
     
     def __repr__(self):
-        return f'(Call {self.func_name} with ({self.args}))'
-    
-    def variables(self):
-        return set()
+        return f'(Call {self.func_name} with ({list(self.args)}))'
+
+    def children(self):
+        return self.args
+
+    def rebuild(self, children):
+        return FunctionCall(self.func_name, children, self.native)
 
 class Subscript(Expr):
-    def __init__(self, var, subscript):
-        self.var = var
-        self.subscript = subscript
+    __slots__ = ['var', 'subscript']
+    def __new__(cls, var, subscript):
+        return intern(cls, var, subscript)
     
     def __repr__(self):
         return f'(Subscript {self.var} {self.subscript})'
-    
-    def variables(self):
-        return self.var.variables().union(self.subscript.variables())
+
+    def children(self):
+        return (self.var, self.subscript)
+
+    def rebuild(self, children):
+        return Subscript(*children)
+
+class Store(Expr):
+    '''
+    The array `arr` with its element at `index` replaced by `value`
+    '''
+    __slots__ = ['arr', 'index', 'value']
+    def __new__(cls, arr, index, value):
+        return intern(cls, arr, index, value)
+
+    def __repr__(self):
+        return f'(Store {self.arr} {self.index} {self.value})'
+
+    def children(self):
+        return (self.arr, self.index, self.value)
+
+    def rebuild(self, children):
+        return Store(*children)
 
 class Quantification(Expr):
     '''
     Since we are using SMT solver, we convert existential quantification
     to the negation of a universal quantification.
     '''
-    def __init__(self, var, expr, ty=None):
-        self.var = var
-        self.ty = ty
-        self.expr = expr
+    __slots__ = ['var', 'expr', 'ty']
+    def __new__(cls, var, expr, ty=None):
+        return intern(cls, var, expr, ty)
     
     def __repr__(self):
         return f'(∀{self.var} : {self.ty}. {self.expr})'
 
+    def children(self):
+        return (self.expr,)
+
+    def rebuild(self, children):
+        return Quantification(self.var, children[0], self.ty)
+
+    def resolve_type(self, ty):
+        '''
+        This quantification with the type of its bound variable resolved to `ty`. Nodes are
+        shared, so the type is part of the key of a new node instead of being set on this one.
+        '''
+        return Quantification(self.var, self.expr, ty)
+
 '''
 Translating ASTs
 '''
@@ -164,6 +315,9 @@ class Skip(Stmt):
     def variables(self):
         return set()
 
+    def assigned(self):
+        return set()
+
 class Assign(Stmt):
     def __init__(self, var, expr):
         self.var = var
@@ -175,6 +329,9 @@ class Assign(Stmt):
     def variables(self):
         return {self.var, *self.expr.variables()}
 
+    def assigned(self):
+        return {self.var}
+
 class If(Stmt):
     def __init__(self, cond_expr : Expr, lb_stmt : Stmt, rb_stmt : Stmt):
         self.cond = cond_expr
@@ -187,6 +344,9 @@ class If(Stmt):
     def variables(self):
         return {*self.cond.variables(), *self.lb.variables(), *self.rb.variables()}
 
+    def assigned(self):
+        return {*self.lb.assigned(), *self.rb.assigned()}
+
 class Seq(Stmt):
     def __init__(self, s1 : Stmt, s2 : Stmt):
         self.s1 = s1 if s1 is not None else Skip()
@@ -196,7 +356,26 @@ class Seq(Stmt):
         return f'(Seq {self.s1} {self.s2})'
     
     def variables(self):
-        return {*self.s1.variables(), *self.s2.variables()}
+        return set().union(*(s.variables() for s in flatten_seq(self)))
+
+    def assigned(self):
+        '''
+        The variables that may be modified by this statement
+        '''
+        return set().union(*(s.assigned() for s in flatten_seq(self)))
+
+def flatten_seq(stmt : Stmt):
+    '''
+    Iterate over the statements of a (possibly deeply nested) `Seq` in execution order
+    '''
+    stack = [stmt]
+    while stack:
+        s = stack.pop()
+        if isinstance(s, Seq):
+            stack.append(s.s2)
+            stack.append(s.s1)
+        else:
+            yield s
 
 class Assume(Stmt):
     def __init__(self, e : Expr):
@@ -208,6 +387,9 @@ class Assume(Stmt):
     def variables(self):
         return {*self.e.variables()}
 
+    def assigned(self):
+        return set()
+
 class Assert(Stmt):
     def __init__(self, e):
         self.e = e
@@ -218,6 +400,9 @@ class Assert(Stmt):
     def variables(self):
         return {*self.e.variables()}
 
+    def assigned(self):
+        return set()
+
 class While(Stmt):
     def __init__(self, invs, cond : Expr, body : Stmt):
         self.cond = cond
@@ -230,6 +415,9 @@ class While(Stmt):
     def variables(self):
         return {*self.body.variables()}
 
+    def assigned(self):
+        return self.body.assigned()
+
 class Havoc(Stmt):
     def __init__(self, var):
         self.var = var
@@ -238,4 +426,7 @@ class Havoc(Stmt):
         return f'(Havoc {self.var})'
     
     def variables(self):
-        return set()
\ No newline at end of file
+        return set()
+
+    def assigned(self):
+        return {self.var}
\ No newline at end of file
@@ -0,0 +1,153 @@
+from veripy.parser.syntax import *
+from veripy.transformer import subst_many, raise_exception
+from veripy.typecheck.types import TBOOL, TARR
+from veripy.arrays import same_length
+
+class PassiveVCGen:
+    '''
+    Verification condition generation through passive form, following Flanagan & Saxe.
+    The passive program has no assignments: `versions` maps each variable to its current value,
+    an expression shared by all its uses, and an assignment only substitutes the current values
+    into its right-hand side, never into the postcondition. Havocs, and the variables whose values
+    differ at the end of the branches of an `If`, get fresh versions constrained by assumptions.
+    Assigned values are not given versions of their own: an SSA equation per assignment makes
+    straight-line code orders of magnitude slower to solve than the shared terms.
+    The postcondition of each `If` is bound to a named predicate `$p<k>` instead of being
+    copied into both branches, which keeps the generated formula linear in the program size.
+    '''
+    def __init__(self, sigma : dict):
+        self.sigma = sigma
+        self.counter = dict()
+        self.definitions = []
+
+    def rename(self, versions : dict, e : Expr):
+        return subst_many(versions, e)
+
+    def fresh(self, versions : dict, var : str):
+        k = self.counter.get(var, 0) + 1
+        self.counter[var] = k
+        name = f'{var}${k}'
+        self.sigma[name] = self.sigma[var]
+        versions[var] = Var(name)
+        return versions[var]
+
+    def name_predicate(self, Q : Expr):
+        if isinstance(Q, (Var, Literal)):
+            return Q
+        name = f'$p{len(self.definitions)}'
+        self.sigma[name] = TBOOL
+        self.definitions.append(BinOp(Var(name), BoolOps.Iff, Q))
+        return Var(name)
+
+    def passify_if(self, versions : dict, stmt : If):
+        cond = self.rename(versions, stmt.cond)
+        lv, rv = dict(versions), dict(versions)
+        lb = self.passify(lv, stmt.lb)
+        rb = self.passify(rv, stmt.rb)
+        for var in sorted({*lv, *rv}):
+            lvalue, rvalue = lv.get(var, Var(var)), rv.get(var, Var(var))
+            if lvalue is rvalue:
+                versions[var] = lvalue
+            else:
+                new = self.fresh(versions, var)
+                lb = Seq(lb, Assume(BinOp(new, CompOps.Eq, lvalue)))
+                rb = Seq(rb, Assume(BinOp(new, CompOps.Eq, rvalue)))
+        return If(cond, lb, rb)
+
+    def passify_assign(self, versions : dict, stmt : Assign):
+        if not isinstance(stmt.var, str):
+            raise_exception(f'Passive form not implemented for assignment to {stmt.var}')
+        # the length of an updated array is that of the array (`len(Store(a, i, v))` is `len(a)`)
+        versions[stmt.var] = self.rename(versions, stmt.expr)
+        return Skip()
+
+    def passify_havoc(self, versions : dict, stmt : Havoc):
+        old = versions.get(stmt.var, Var(stmt.var))
+        new = self.fresh(versions, stmt.var)
+        if isinstance(self.sigma[stmt.var], TARR):
+            return Assume(same_length(new, old))
+        return Skip()
+
+    def passify_skip(self, versions : dict, stmt : Skip):
+        return stmt
+
+    def passify_assume(self, versions : dict, stmt : Assume):
+        return Assume(self.rename(versions, stmt.e))
+
+    def passify_assert(self, versions : dict, stmt : Assert):
+        return Assert(self.rename(versions, stmt.e))
+
+    def passify_seq(self, versions : dict, stmt : Seq):
+        stmts = [self.passify(versions, s) for s in flatten_seq(stmt)]
+        result = stmts.pop()
+        while stmts:
+            result = Seq(stmts.pop(), result)
+        return result
+
+    def passify(self, versions : dict, stmt : Stmt):
+        '''
+        Translate `stmt` to a passive statement (only `Assume`, `Assert`, `Seq`, `If` and `Skip`),
+        updating `versions` to map each assigned variable to its current value.
+        '''
+        rule = self.PASSIFY.get(type(stmt))
+        if rule is None:
+            raise_exception(f'Passive form not implemented for {type(stmt)}')
+        return rule(self, versions, stmt)
+
+    def wp(self, stmt : Stmt, Q : Expr):
+        rule = self.WP.get(type(stmt))
+        if rule is None:
+            raise_exception(f'wp not implemented for passive {type(stmt)}')
+        return rule(self, stmt, Q)
+
+    def wp_skip(self, stmt : Skip, Q : Expr):
+        return Q
+
+    def wp_assume(self, stmt : Assume, Q : Expr):
+        return BinOp(stmt.e, BoolOps.Implies, Q)
+
+    def wp_assert(self, stmt : Assert, Q : Expr):
+        return BinOp(Q, BoolOps.And, stmt.e)
+
+    def wp_seq(self, stmt : Seq, Q : Expr):
+        for s in reversed(list(flatten_seq(stmt))):
+            Q = self.wp(s, Q)
+        return Q
+
+    def wp_if(self, stmt : If, Q : Expr):
+        return BinOp(
+            BinOp(stmt.cond, BoolOps.Implies, self.wp(stmt.lb, Q)),
+            BoolOps.And,
+            BinOp(UnOp(BoolOps.Not, stmt.cond), BoolOps.Implies, self.wp(stmt.rb, Q)))
+
+    PASSIFY = {
+        Skip:   passify_skip,
+        Assume: passify_assume,
+        Assert: passify_assert,
+        Assign: passify_assign,
+        Seq:    passify_seq,
+        If:     passify_if,
+        Havoc:  passify_havoc
+    }
+
+    WP = {
+        Skip:   wp_skip,
+        Assume: wp_assume,
+        Assert: wp_assert,
+        Seq:    wp_seq,
+        If:     lambda self, stmt, Q: self.wp_if(stmt, self.name_predicate(Q))
+    }
+
+def passive_wp(sigma : dict, stmt : Stmt, Q : Expr):
+    '''
+    Compute a weakest precondition of `stmt` w.r.t. `Q` whose size is linear in the program.
+    The returned formula mentions fresh variables (versions and named predicates), whose
+    types are added to `sigma`; it is valid exactly when the usual `wp` is.
+    '''
+    gen = PassiveVCGen(sigma)
+    versions = dict()
+    passive = gen.passify(versions, stmt)
+    P = gen.wp(passive, gen.rename(versions, Q))
+    for d in reversed(gen.definitions):
+        P = BinOp(d, BoolOps.Implies, P)
+    return (P, set())
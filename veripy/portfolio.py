@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+import z3
+
+'''
+Portfolio solving: an obligation the solver cannot decide quickly is checked concurrently under
+several solver configurations, each in its own process. The first definitive answer (sat or
+unsat) wins and the other processes are killed.
+'''
+
+# name -> (logic of `z3.SolverFor`, solver parameters)
+CONFIGS = {
+    'default'           : (None, {}),
+    'qfnia'             : ('QF_NIA', {}),
+    'arith-solver-2'    : (None, {'arith.solver': 2}),
+    'arith-solver-6'    : (None, {'arith.solver': 6}),
+    'seed-1'            : (None, {'random_seed': 1}),
+    'seed-2'            : (None, {'random_seed': 2}),
+}
+
+def model_dict(model):
+    '''
+    The values of a Z3 model as Python values, leaving out internal (`$`-prefixed) names
+    '''
+    values = dict()
+    for d in model.decls():
+        if d.name().startswith('$'):
+            continue
+        v = model[d]
+        if z3.is_int_value(v):
+            values[d.name()] = v.as_long()
+        elif z3.is_true(v) or z3.is_false(v):
+            values[d.name()] = z3.is_true(v)
+        else:
+            values[d.name()] = str(v)
+    return values
+
+# Z3 timeouts are in milliseconds; this one never expires
+NO_TIMEOUT = 4294967295
+
+def timeout_ms(timeout):
+    '''
+    The Z3 `timeout` parameter of a limit of `timeout` seconds (`None` is unlimited)
+    '''
+    return NO_TIMEOUT if timeout is None else max(1, int(timeout * 1000))
+
+def make_solver(config : str):
+    logic, params = CONFIGS[config]
+    solver = z3.SolverFor(logic) if logic is not None else z3.Solver()
+    for (name, value) in params.items():
+        solver.set(name, value)
+    return solver
+
+def to_smt2(*assertions):
+    '''
+    SMT-LIB declarations and assertions of `assertions`, which can be sent to another process
+    '''
+    solver = z3.Solver()
+    solver.add(*assertions)
+    return solver.sexpr()
+
+def solve(config : str, smt2 : str, timeout=None, rlimit=None):
+    '''
+    Check the assertions `smt2` with a fresh solver of `config`.
+    Returns `(status, model, reason)`, with `status` one of `'sat'`, `'unsat'` and `'unknown'`.
+    '''
+    solver = make_solver(config)
+    solver.set('timeout', timeout_ms(timeout))
+    if rlimit is not None:
+        solver.set('rlimit', rlimit)
+    solver.from_string(smt2)
+    status = solver.check()
+    if status == z3.sat:
+        return ('sat', model_dict(solver.model()), None)
+    if status == z3.unsat:
+        return ('unsat', None, None)
+    return ('unknown', None, solver.reason_unknown())
+
+def solve_worker(conn, config, smt2, timeout, rlimit):
+    try:
+        conn.send((config, *solve(config, smt2, timeout, rlimit)))
+    except Exception as e:
+        conn.send((config, 'unknown', None, str(e)))
+    finally:
+        conn.close()
+
+def start_method():
+    return 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+
+class Portfolio:
+    '''
+    Settings of portfolio solving, and the configurations that won.
+        - configs   : names of the `CONFIGS` raced on a hard obligation
+        - trigger   : seconds the solver gets on an obligation before it is considered hard
+        - path      : JSON file of the winning configuration of every function, so that later
+                      runs check its obligations with that configuration straight away
+    '''
+    def __init__(self, configs=None, trigger=1.0, path=None):
+        self.enabled = False
+        self.configs = list(configs) if configs is not None else list(CONFIGS)
+        self.trigger = trigger
+        self.path = path
+        self.winners = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict()
+
+    def winner(self, function : str):
+        if self.path is None:
+            return None
+        if self.winners is None:
+            self.winners = self.load()
+        return self.winners.get(function)
+
+    def record(self, function : str, config : str):
+        '''
+        Store the winning `config` of `function`; the file is re-read first, since
+        parallel workers record their own functions
+        '''
+        if self.path is None:
+            return
+        winners = self.load()
+        winners[function] = config
+        self.winners = winners
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = f'{self.path}.{os.getpid()}'
+            with open(tmp, 'w') as f:
+                json.dump(winners, f, indent=1)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def race(self, smt2 : str, timeout=None, rlimit=None):
+        '''
+        Check `smt2` under every configuration, each in its own process, until one of them
+        gives a definitive answer. Returns `(config, status, model, reason)`; `config` is
+        `None` if no configuration decided it.
+        '''
+        if multiprocessing.current_process().daemon:
+            # workers of a verification pool cannot have children: try the configurations in turn
+            return self.sequence(smt2, timeout, rlimit)
+        context = multiprocessing.get_context(start_method())
+        pending = dict()
+        for config in self.configs:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=solve_worker, args=(sender, config, smt2, timeout, rlimit), daemon=True)
+            process.start()
+            sender.close()
+            pending[receiver] = process
+        processes = list(pending.values())
+        # the solvers stop by themselves after `timeout`; the slack covers the start of the processes
+        deadline = None if timeout is None else time.monotonic() + timeout + 1.0
+        reasons = []
+        try:
+            while pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                for receiver in wait(list(pending), remaining):
+                    pending.pop(receiver)
+                    try:
+                        config, status, model, reason = receiver.recv()
+                    except EOFError:
+                        continue
+                    if status != 'unknown':
+                        return (config, status, model, None)
+                    reasons.append(f'{config}: {reason}')
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.kill()
+                process.join()
+        return (None, 'unknown', None, '; '.join(reasons) if reasons else 'timeout')
+
+    def sequence(self, smt2 : str, timeout=None, rlimit=None):
+        share = None if timeout is None else timeout / len(self.configs)
+        reasons = []
+        for config in self.configs:
+            status, model, reason = solve(config, smt2, share, rlimit)
+            if status != 'unknown':
+                return (config, status, model, None)
+            reasons.append(f'{config}: {reason}')
+        return (None, 'unknown', None, '; '.join(reasons))
+
+PORTFOLIO = Portfolio()
@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import threading
+
+'''
+Phase-level instrumentation of the verifier. `verify_func` and `check_obligations` wrap each
+phase in `PROFILER.phase(name)`; when profiling is enabled every phase produces an event
+
+    {'name': ..., 'function': 'scope::func', 'start': ..., 'duration': ..., 'pid': ..., 'args': {...}}
+
+which is recorded and passed to the registered hooks. Times are in seconds; `args` holds the
+phase-specific measurements (e.g. `vc_size` after `wp`, the Z3 statistics after `check`).
+'''
+
+class Phase:
+    def __init__(self, profiler, name, function, args):
+        self.profiler = profiler
+        self.name = name
+        self.function = function
+        self.args = args
+
+    def __enter__(self):
+        self.profiler.stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        self.profiler.stack.pop()
+        self.profiler.record({
+            'name'      : self.name,
+            'function'  : self.function,
+            'start'     : self.start - self.profiler.epoch,
+            'duration'  : duration,
+            'pid'       : os.getpid(),
+            'args'      : self.args
+        })
+        return False
+
+class NullPhase:
+    '''
+    Phase used while profiling is disabled: measurements attached to it are dropped
+    '''
+    def __init__(self):
+        self.args = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.hooks = []
+        self.events = []
+        self.local = threading.local()
+        self.epoch = time.perf_counter()
+
+    @property
+    def stack(self):
+        '''
+        The enclosing phases of the current thread
+        '''
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.events = []
+        self.epoch = time.perf_counter()
+
+    def add_hook(self, hook):
+        '''
+        Call `hook(event)` at the end of every phase. With `jobs > 1` hooks run in the worker processes.
+        '''
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def phase(self, name : str, function : str=None, **args):
+        '''
+        Context manager timing the phase `name` of `function` (by default, the function of the
+        enclosing phase). Measurements can be added to the `args` of the returned phase.
+        '''
+        if not self.enabled:
+            return NullPhase()
+        if function is None and self.stack:
+            function = self.stack[-1].function
+        return Phase(self, name, function, args)
+
+    def record(self, event):
+        self.events.append(event)
+        for hook in self.hooks:
+            hook(event)
+
+    def summary(self):
+        '''
+        Total, maximum and count of the duration of each phase
+        '''
+        result = dict()
+        for event in self.events:
+            s = result.setdefault(event['name'], {'count': 0, 'total': 0.0, 'max': 0.0})
+            s['count'] += 1
+            s['total'] += event['duration']
+            s['max'] = max(s['max'], event['duration'])
+        return result
+
+    def report(self):
+        return {'summary': self.summary(), 'events': self.events}
+
+    def chrome_trace(self):
+        '''
+        The events in the Chrome trace event format (chrome://tracing, Perfetto)
+        '''
+        return {
+            'traceEvents': [{
+                'name'  : event['name'],
+                'cat'   : 'veripy',
+                'ph'    : 'X',
+                'ts'    : event['start'] * 1e6,
+                'dur'   : event['duration'] * 1e6,
+                'pid'   : event['pid'],
+                'tid'   : event['pid'],
+                'args'  : dict(event['args'], function=event['function'])
+            } for event in self.events],
+            'displayTimeUnit': 'ms'
+        }
+
+    def export(self, path : str, format : str='json'):
+        if format == 'json':
+            data = self.report()
+        elif format == 'chrome':
+            data = self.chrome_trace()
+        else:
+            raise Exception(f'Unknown profile format: {format}')
+        with open(path, 'w') as f:
+            json.dump(data, f, indent=1, default=str)
+
+def expr_size(expr):
+    '''
+    Number of distinct nodes of `expr`; shared (hash-consed) subterms are counted once
+    '''
+    seen = set()
+    stack = [expr]
+    while stack:
+        node = stack.pop()
+        if node not in seen:
+            seen.add(node)
+            stack.extend(node.children())
+    return len(seen)
+
+def solver_statistics(solver):
+    stats = solver.statistics()
+    return {key: stats.get_key_value(key) for key in stats.keys()}
+
+PROFILER = Profiler()
@@ -0,0 +1,112 @@
+import xml.etree.ElementTree as ET
+
+class ObligationResult:
+    '''
+    Outcome of a single proof obligation.
+        - status    : `'verified'`, `'violated'` or `'unknown'`
+        - kind      : `'precondition'` (the precondition implies the wp) or `'side condition'`
+        - constraint: the negated obligation the solver found satisfiable or gave up on
+        - model     : the counterexample of a violated obligation, as a dict from names to values
+        - reason    : why the solver gave up on an unknown obligation
+        - time      : seconds spent in the solver
+        - config    : the portfolio configuration that decided it (see `veripy.portfolio`), if any
+    '''
+    def __init__(self, status, kind, constraint='', message='', model=None, reason=None, time=0.0, config=None):
+        self.status = status
+        self.kind = kind
+        self.constraint = constraint
+        self.message = message
+        self.model = model if model is not None else dict()
+        self.reason = reason
+        self.time = time
+        self.config = config
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return f'ObligationResult({self.status}, {self.kind}, {self.time:.3f}s)'
+
+class FunctionResult:
+    '''
+    Outcome of verifying a function.
+        - status        : `'verified'`, `'violated'`, `'unknown'` or `'error'` (the function could
+                          not be translated or typechecked, see `error`)
+        - cached        : whether the proof was found in the proof cache
+        - obligations   : the `ObligationResult` of every checked obligation
+        - trivial       : number of obligations discharged by the simplifier, i.e. solver calls saved
+        - timings       : seconds spent in each phase (`parse`, `typecheck`, `wp`, `simplify`, `solve`)
+    '''
+    PHASES = ('parse', 'typecheck', 'wp', 'simplify', 'solve')
+
+    def __init__(self, scope, name, status='verified', cached=False, obligations=None, timings=None, error=None,
+                 trivial=0):
+        self.scope = scope
+        self.name = name
+        self.status = status
+        self.cached = cached
+        self.obligations = obligations if obligations is not None else []
+        self.trivial = trivial
+        self.timings = timings if timings is not None else {phase: 0.0 for phase in self.PHASES}
+        self.error = error
+
+    @property
+    def verified(self):
+        return self.status == 'verified'
+
+    @property
+    def time(self):
+        return sum(self.timings.values())
+
+    def failures(self):
+        return [o for o in self.obligations if o.status != 'verified']
+
+    def to_dict(self):
+        result = dict(self.__dict__)
+        result['obligations'] = [o.to_dict() for o in self.obligations]
+        return result
+
+    def __repr__(self):
+        return f'FunctionResult({self.scope}::{self.name}, {self.status}, {self.time:.3f}s)'
+
+def summary(results):
+    '''
+    Number of functions of `results` by status
+    '''
+    counts = {'verified': 0, 'violated': 0, 'unknown': 0, 'error': 0}
+    for r in results:
+        counts[r.status] = counts.get(r.status, 0) + 1
+    return counts
+
+def json_report(results):
+    return {'summary': summary(results), 'results': [r.to_dict() for r in results]}
+
+def junit_report(results):
+    '''
+    `results` as a JUnit XML tree, with a test suite per scope and a test case per function.
+    Violated and unknown functions are failures; functions that could not be checked are errors.
+    '''
+    suites = ET.Element('testsuites')
+    by_scope = dict()
+    for r in results:
+        by_scope.setdefault(r.scope, []).append(r)
+    for (scope, scope_results) in by_scope.items():
+        counts = summary(scope_results)
+        suite = ET.SubElement(suites, 'testsuite', name=str(scope), tests=str(len(scope_results)),
+                              failures=str(counts['violated'] + counts['unknown']), errors=str(counts['error']),
+                              time=f'{sum(r.time for r in scope_results):.3f}')
+        for r in scope_results:
+            case = ET.SubElement(suite, 'testcase', classname=str(scope), name=r.name, time=f'{r.time:.3f}')
+            if r.status == 'error':
+                ET.SubElement(case, 'error', message=(r.error or 'error').splitlines()[0]).text = r.error
+            elif r.status != 'verified':
+                failure = ET.SubElement(case, 'failure', message=r.status,
+                                        type='VerificationViolated' if r.status == 'violated' else 'VerificationUnknown')
+                failure.text = '\n'.join(o.message for o in r.failures())
+            elif r.cached:
+                ET.SubElement(case, 'system-out').text = 'cached'
+    counts = summary(results)
+    suites.set('tests', str(len(results)))
+    suites.set('failures', str(counts['violated'] + counts['unknown']))
+    suites.set('errors', str(counts['error']))
+    return ET.ElementTree(suites)
@@ -0,0 +1,183 @@
+import ast
+import inspect
+from functools import wraps
+from veripy.parser.syntax import *
+from veripy.parser.parser import parse_assertion
+from veripy.transformer import raise_exception
+
+'''
+Runtime checking of contracts. The parsed `requires` / `ensures` clauses are compiled once
+into Python closures over the arguments (and the returned value), which are then called on
+entry and exit of the function.
+'''
+
+class ContractViolation(RuntimeError): pass
+
+PY_BINOPS = {
+    ArithOps.Add:       '+',
+    ArithOps.Minus:     '-',
+    ArithOps.Mult:      '*',
+    ArithOps.IntDiv:    '//',
+    ArithOps.Mod:       '%',
+    BoolOps.And:        'and',
+    BoolOps.Or:         'or',
+    CompOps.Eq:         '==',
+    CompOps.Neq:        '!=',
+    CompOps.Gt:         '>',
+    CompOps.Ge:         '>=',
+    CompOps.Lt:         '<',
+    CompOps.Le:         '<=',
+}
+
+def py_literal(node, children):
+    return repr(node.value.v)
+
+def py_var(node, children):
+    return node.name
+
+def py_binop(node, children):
+    lhs, rhs = children
+    if node.op == BoolOps.Implies:
+        return f'((not {lhs}) or {rhs})'
+    if node.op == BoolOps.Iff:
+        return f'(bool({lhs}) == bool({rhs}))'
+    if node.op not in PY_BINOPS:
+        raise_exception(f'Unsupported Operator: {node.op}')
+    return f'({lhs} {PY_BINOPS[node.op]} {rhs})'
+
+def py_unop(node, children):
+    if node.op == BoolOps.Not:
+        return f'(not {children[0]})'
+    return f'(-{children[0]})'
+
+def py_slice(node, children):
+    if node.upper is None:
+        lower, step = children
+        return f'{lower}::{step}'
+    return '{}:{}:{}'.format(*children)
+
+def py_subscript(node, children):
+    return f'{children[0]}[{children[1]}]'
+
+def py_call(node, children):
+    return f'{node.func_name.name}({", ".join(children)})'
+
+PY_EXPR = {
+    Literal:        py_literal,
+    Var:            py_var,
+    BinOp:          py_binop,
+    UnOp:           py_unop,
+    Slice:          py_slice,
+    Subscript:      py_subscript,
+    FunctionCall:   py_call
+}
+
+def to_python(expr : Expr):
+    '''
+    Python source of a quantifier-free assertion
+    '''
+    def visit(node, children):
+        if type(node) not in PY_EXPR:
+            raise_exception(f'Runtime check not supported for {node}')
+        return PY_EXPR[type(node)](node, children)
+    return postorder(expr, visit)
+
+def checkable(expr : Expr):
+    '''
+    Quantified clauses range over unbounded integers and cannot be evaluated
+    '''
+    return postorder(expr, lambda node, children: not isinstance(node, Quantification) and all(children or ()))
+
+def compile_clauses(params, clauses, env):
+    '''
+    Compile `clauses` to a closure over `params` that holds when all of them hold,
+    and one closure per clause to tell which of them failed
+    '''
+    args = ', '.join(params)
+    sources = [to_python(c) for c in clauses]
+    conjunction = ' and '.join(sources) if sources else 'True'
+    check = eval(compile(f'lambda {args}: {conjunction}', '<contract>', 'eval'), env)
+    each = [eval(compile(f'lambda {args}: {s}', '<contract>', 'eval'), env) for s in sources]
+    return check, each
+
+class RuntimeChecker:
+    '''
+    Check the contracts of `func` on one call out of `sample`. The contracts are parsed and
+    compiled on the first checked call. Postconditions can only refer to the arguments and to
+    the returned variable (`return <name>`); clauses mentioning other variables, reassigned
+    arguments or quantifiers are not checked.
+    '''
+    def __init__(self, func, requires, ensures, sample=1):
+        self.func = func
+        self.requires = requires
+        self.ensures = ensures
+        self.sample = sample
+        self.compiled = False
+
+    def compile(self):
+        func_def = ast.parse(inspect.getsource(self.func)).body[0]
+        params = [a.arg for a in func_def.args.args]
+        assigned = {n.id for n in ast.walk(func_def) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
+        returns = [n.value.id for n in ast.walk(func_def)
+                   if isinstance(n, ast.Return) and isinstance(n.value, ast.Name)]
+        ret = returns[0] if returns and len(set(returns)) == 1 else None
+
+        def clauses(constraints, visible):
+            result = []
+            for c in constraints:
+                e = parse_assertion(c)
+                if checkable(e) and e.variables() <= visible:
+                    result.append((c, e))
+            return result
+
+        unchanged = {p for p in params if p not in assigned}
+        pre = clauses(self.requires, set(params))
+        post = clauses(self.ensures, unchanged | ({ret} if ret is not None else set()))
+        env = self.func.__globals__
+        self.signature = inspect.signature(self.func)
+        self.params = params
+        self.arity = len(params)
+        self.pre_clauses = [c for (c, _) in pre]
+        self.post_clauses = [c for (c, _) in post]
+        self.pre, self.pre_each = compile_clauses(params, [e for (_, e) in pre], env)
+        # the returned value is passed after the arguments, under the name of the returned variable
+        # (an argument of the same name is shadowed)
+        post_params = [f'_{p}' if p == ret else p for p in params] + [ret if ret is not None else '_']
+        self.post, self.post_each = compile_clauses(post_params, [e for (_, e) in post], env)
+        self.compiled = True
+
+    def arguments(self, args, kargs):
+        bound = self.signature.bind(*args, **kargs)
+        bound.apply_defaults()
+        return tuple(bound.arguments[p] for p in self.params)
+
+    def violation(self, kind, clauses, checks, values):
+        failed = [c for (c, check) in zip(clauses, checks) if not check(*values)]
+        return ContractViolation(f'{kind} violated at {self.func.__name__}: {", ".join(failed)}')
+
+    def check(self, args, kargs):
+        if not self.compiled:
+            self.compile()
+        values = args if not kargs and len(args) == self.arity else self.arguments(args, kargs)
+        if not self.pre(*values):
+            raise self.violation('Precondition', self.pre_clauses, self.pre_each, values)
+        result = self.func(*args, **kargs)
+        if not self.post(*values, result):
+            raise self.violation('Postcondition', self.post_clauses, self.post_each, (*values, result))
+        return result
+
+    def wrap(self):
+        '''
+        The checked version of `func`
+        '''
+        func, check, sample = self.func, self.check, self.sample
+        calls = 0
+        @wraps(func)
+        def checked(*args, **kargs):
+            nonlocal calls
+            calls += 1
+            if calls < sample:
+                return func(*args, **kargs)
+            calls = 0
+            return check(args, kargs)
+        return checked
@@ -0,0 +1,175 @@
+from veripy.parser.syntax import *
+
+'''
+Rewriting simplifier of verification conditions, run between VC generation and the translation
+to Z3: constant folding, boolean and arithmetic identities, and flattening of `and` / `or`
+chains with duplicate operands removed. Every rule is an equivalence over the integers.
+'''
+
+TRUE = Literal(VBool(True))
+FALSE = Literal(VBool(False))
+
+def is_int(e):
+    return isinstance(e, Literal) and isinstance(e.value, VInt)
+
+def is_bool(e):
+    return isinstance(e, Literal) and isinstance(e.value, VBool)
+
+def negate(e):
+    if is_bool(e):
+        return FALSE if e.value.v else TRUE
+    if isinstance(e, UnOp) and e.op == BoolOps.Not:
+        return e.e
+    return UnOp(BoolOps.Not, e)
+
+# division and modulo are only folded for positive divisors, on which Python and Z3 agree
+FOLD_INT = {
+    ArithOps.Add:       lambda x, y: x + y,
+    ArithOps.Minus:     lambda x, y: x - y,
+    ArithOps.Mult:      lambda x, y: x * y,
+    ArithOps.IntDiv:    lambda x, y: x // y if y > 0 else None,
+    ArithOps.Mod:       lambda x, y: x % y if y > 0 else None,
+    CompOps.Eq:         lambda x, y: x == y,
+    CompOps.Neq:        lambda x, y: x != y,
+    CompOps.Lt:         lambda x, y: x < y,
+    CompOps.Le:         lambda x, y: x <= y,
+    CompOps.Gt:         lambda x, y: x > y,
+    CompOps.Ge:         lambda x, y: x >= y,
+}
+
+# the value of `e op e`
+REFLEXIVE = {
+    CompOps.Eq:         TRUE,
+    CompOps.Le:         TRUE,
+    CompOps.Ge:         TRUE,
+    CompOps.Neq:        FALSE,
+    CompOps.Lt:         FALSE,
+    CompOps.Gt:         FALSE,
+    BoolOps.Implies:    TRUE,
+    BoolOps.Iff:        TRUE,
+}
+
+def operands(e, op):
+    '''
+    The operands of the chain of `op` rooted at `e`, from left to right
+    '''
+    result, stack = [], [e]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, BinOp) and node.op == op:
+            stack.append(node.e2)
+            stack.append(node.e1)
+        else:
+            result.append(node)
+    return result
+
+def simplify_junction(op, e1, e2):
+    '''
+    `e1 and e2` / `e1 or e2` as a left-nested chain without literals or duplicate operands.
+    The operands of `e1` are already simplified, so only `e2` can bring new ones.
+    '''
+    unit, zero = (TRUE, FALSE) if op == BoolOps.And else (FALSE, TRUE)
+    left = operands(e1, op)
+    seen = set(left)
+    result = e1
+    for e in operands(e2, op):
+        if e is zero or negate(e) in seen:
+            return zero
+        if e is unit or e in seen:
+            continue
+        seen.add(e)
+        result = e if result is unit else BinOp(result, op, e)
+    return result
+
+def simplify_BinOp(node, e1, e2):
+    op = node.op
+    if is_int(e1) and is_int(e2) and op in FOLD_INT:
+        v = FOLD_INT[op](e1.value.v, e2.value.v)
+        if v is not None:
+            return Literal(VBool(v)) if isinstance(v, bool) else Literal(VInt(v))
+    if e1 is e2 and op in REFLEXIVE:
+        return REFLEXIVE[op]
+    if op == BoolOps.And or op == BoolOps.Or:
+        unit, zero = (TRUE, FALSE) if op == BoolOps.And else (FALSE, TRUE)
+        if e1 is zero or e2 is zero:
+            return zero
+        if e1 is unit:
+            return e2
+        return simplify_junction(op, e1, e2)
+    if op == BoolOps.Implies:
+        if e1 is TRUE:
+            return e2
+        if e1 is FALSE or e2 is TRUE:
+            return TRUE
+        if e2 is FALSE:
+            return negate(e1)
+    if op == BoolOps.Iff:
+        if is_bool(e1):
+            e1, e2 = e2, e1
+        if e2 is TRUE:
+            return e1
+        if e2 is FALSE:
+            return negate(e1)
+    if op == ArithOps.Add:
+        if is_int(e1) and e1.value.v == 0:
+            return e2
+        if is_int(e2) and e2.value.v == 0:
+            return e1
+    if op == ArithOps.Minus and is_int(e2) and e2.value.v == 0:
+        return e1
+    if op == ArithOps.Minus and e1 is e2:
+        return Literal(VInt(0))
+    if op == ArithOps.Mult:
+        if is_int(e1):
+            e1, e2 = e2, e1
+        if is_int(e2) and e2.value.v == 1:
+            return e1
+        if is_int(e2) and e2.value.v == 0:
+            return e2
+    return node.rebuild([e1, e2])
+
+def simplify_UnOp(node, e):
+    if node.op == BoolOps.Not:
+        return negate(e)
+    if is_int(e):
+        return Literal(VInt(-e.value.v))
+    if isinstance(e, UnOp) and e.op == ArithOps.Neg:
+        return e.e
+    return node.rebuild([e])
+
+def simplify_Quantification(node, body):
+    # the domains of the bound variables are never empty
+    if is_bool(body) or node.var.name not in body.variables():
+        return body
+    return node.rebuild([body])
+
+def simplify_Subscript(node, arr, index):
+    if isinstance(arr, Store) and arr.index is index:
+        return arr.value
+    return node.rebuild([arr, index])
+
+SIMPLIFY = {
+    BinOp:          simplify_BinOp,
+    UnOp:           simplify_UnOp,
+    Quantification: simplify_Quantification,
+    Subscript:      simplify_Subscript,
+}
+
+def simplify(expr : Expr):
+    '''
+    An expression equivalent to `expr`, simplified bottom-up
+    '''
+    def visit(node, children):
+        rule = SIMPLIFY.get(type(node))
+        if rule is None:
+            return node.rebuild(children) if children else node
+        return rule(node, *children)
+    return postorder(expr, visit)
+
+def trivial(hypothesis : Expr, constraint : Expr):
+    '''
+    Whether the obligation `hypothesis ==> constraint` holds without calling the solver
+    '''
+    if constraint is TRUE or hypothesis is FALSE:
+        return True
+    return hypothesis is not None and constraint in operands(hypothesis, BoolOps.And)
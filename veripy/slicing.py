@@ -0,0 +1,44 @@
+from veripy.parser.syntax import *
+from veripy.simplify import operands
+
+class Slicer:
+    '''
+    Relevance filter of the conjuncts of a hypothesis. Conjuncts are grouped by the free variables
+    they share (transitively), and an obligation only needs the groups of the variables it mentions:
+    the other conjuncts constrain unrelated variables, so they cannot make it valid unless the
+    hypothesis itself is inconsistent.
+    '''
+    def __init__(self, hypothesis : Expr):
+        self.conjuncts = operands(hypothesis, BoolOps.And) if hypothesis is not None else []
+        self.parent = dict()
+        for c in self.conjuncts:
+            names = iter(c.variables())
+            first = next(names, None)
+            for name in names:
+                self.union(first, name)
+
+    def find(self, name):
+        root = name
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while name != root:
+            self.parent[name], name = root, self.parent.get(name, name)
+        return root
+
+    def union(self, n1, n2):
+        r1, r2 = self.find(n1), self.find(n2)
+        if r1 != r2:
+            self.parent[r1] = r2
+
+    def relevant(self, constraint : Expr):
+        '''
+        The conjuncts `constraint` may depend on, in their original order; closed conjuncts are
+        always kept
+        '''
+        groups = {self.find(name) for name in constraint.variables()}
+        result = []
+        for c in self.conjuncts:
+            names = c.variables()
+            if not names or self.find(next(iter(names))) in groups:
+                result.append(c)
+        return result
@@ -0,0 +1,466 @@
+import os
+import re
+import time
+import select
+import threading
+import subprocess
+from veripy.parser.syntax import *
+from veripy.typecheck.types import TINT, TBOOL, TARR
+from veripy.transformer import raise_exception
+from veripy.portfolio import timeout_ms
+
+'''
+Obligations as SMT-LIB 2 scripts, checked by a pool of long-lived solver processes
+(`z3 -in` by default, or any solver reading SMT-LIB from its standard input).
+The solvers run outside the Python process, so obligations are checked in parallel, a solver
+is killed when it overruns its time limit, and the script of a slow obligation can be saved
+and replayed with the solver alone.
+'''
+
+SMT_BINOPS = {
+    ArithOps.Add:       '+',
+    ArithOps.Minus:     '-',
+    ArithOps.Mult:      '*',
+    ArithOps.IntDiv:    'div',
+    ArithOps.Mod:       'mod',
+
+    BoolOps.And:        'and',
+    BoolOps.Or:         'or',
+    BoolOps.Implies:    '=>',
+    BoolOps.Iff:        '=',
+
+    CompOps.Eq:         '=',
+    CompOps.Gt:         '>',
+    CompOps.Ge:         '>=',
+    CompOps.Lt:         '<',
+    CompOps.Le:         '<=',
+}
+
+SMT_UNOPS = {
+    ArithOps.Neg:       '-',
+    BoolOps.Not:        'not',
+}
+
+def smt_sort(ty):
+    if ty == TINT:
+        return 'Int'
+    if ty == TBOOL:
+        return 'Bool'
+    if isinstance(ty, TARR):
+        element = smt_sort(ty.ty)
+        if element is not None:
+            return f'(Array Int {element})'
+    return None
+
+def element_sort(sort : str):
+    return sort[len('(Array Int '):-1]
+
+def shared_nodes(roots):
+    '''
+    The compound nodes reachable from `roots` through more than one edge
+    '''
+    parents = dict()
+    seen = set()
+    stack = list(roots)
+    for r in roots:
+        parents[r] = parents.get(r, 0) + 1
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        for c in node.children():
+            parents[c] = parents.get(c, 0) + 1
+            stack.append(c)
+    return {node for (node, n) in parents.items() if n > 1 and node.children()}
+
+class Printer:
+    '''
+    Printer of expressions as SMT-LIB terms. Expressions are DAGs, so a shared subterm that does
+    not depend on a bound variable is printed once, as a `define-fun`, instead of at each of its
+    occurrences. Arrays have an uninterpreted length function per sort, like in `Expr2Z3`.
+    '''
+    def __init__(self, sigma : dict):
+        self.sigma = sigma
+        self.cache = dict()
+        self.binders = []
+        self.shared = set()
+        self.declared = dict()
+        self.lengths = dict()
+        self.definitions = []
+
+    def key(self, node : Expr):
+        if not self.binders:
+            return node
+        free = node.variables()
+        bound = {name: sort for (name, sort) in self.binders if name in free}
+        return (node, *sorted(bound.items())) if bound else node
+
+    def lookup(self, name : str):
+        for (bound, sort) in reversed(self.binders):
+            if bound == name:
+                return sort
+        return None
+
+    def length(self, sort : str):
+        if sort not in self.lengths:
+            self.lengths[sort] = 'len$' + re.sub(r'[() ]+', '_', sort).strip('_')
+        return self.lengths[sort]
+
+    def print_Literal(self, node : Literal):
+        v = node.value
+        if isinstance(v, VBool):
+            return ('true' if v.v else 'false', 'Bool')
+        if isinstance(v, VInt):
+            return (str(v.v) if v.v >= 0 else f'(- {-v.v})', 'Int')
+        raise_exception(f'Unsupported data: {v}')
+
+    def print_Var(self, node : Var):
+        sort = self.lookup(node.name)
+        if sort is not None:
+            return (node.name, sort)
+        if node.name not in self.declared:
+            ty = self.sigma.get(node.name)
+            sort = smt_sort(ty) if type(ty) != dict else None
+            if sort is None:
+                raise_exception(f'Unsupported type of {node.name}: {ty}')
+            self.declared[node.name] = sort
+        return (node.name, self.declared[node.name])
+
+    def print_BinOp(self, node : BinOp, t1, t2):
+        if node.op == CompOps.Neq:
+            return (f'(not (= {t1[0]} {t2[0]}))', 'Bool')
+        if node.op not in SMT_BINOPS:
+            raise_exception(f'Unsupported Operator: {node.op}')
+        sort = 'Int' if isinstance(node.op, ArithOps) else 'Bool'
+        return (f'({SMT_BINOPS[node.op]} {t1[0]} {t2[0]})', sort)
+
+    def print_UnOp(self, node : UnOp, t):
+        if node.op not in SMT_UNOPS:
+            raise_exception(f'Unsupported Operator: {node.op}')
+        return (f'({SMT_UNOPS[node.op]} {t[0]})', t[1])
+
+    def print_Quantification(self, node : Quantification, bound, body):
+        name, sort = bound
+        return (f'(forall (({name} {sort})) {body[0]})', 'Bool')
+
+    def print_Subscript(self, node : Subscript, arr, index):
+        return (f'(select {arr[0]} {index[0]})', element_sort(arr[1]))
+
+    def print_Store(self, node : Store, arr, index, value):
+        return (f'(store {arr[0]} {index[0]} {value[0]})', arr[1])
+
+    def print_FunctionCall(self, node : FunctionCall, *args):
+        if node.func_name.name != 'len':
+            raise_exception(f'Unsupported function: {node.func_name.name}')
+        # updates preserve the length, so `len(Store(a, i, v))` is `len(a)`
+        arr = node.args[0]
+        while isinstance(arr, Store):
+            arr = arr.arr
+        text, sort = self.cache[self.key(arr)]
+        return (f'({self.length(sort)} {text})', 'Int')
+
+    PRINTERS = {
+        Literal:            print_Literal,
+        Var:                print_Var,
+        BinOp:              print_BinOp,
+        UnOp:               print_UnOp,
+        Quantification:     print_Quantification,
+        Subscript:          print_Subscript,
+        Store:              print_Store,
+        FunctionCall:       print_FunctionCall
+    }
+
+    def bind(self, node : Quantification):
+        sort = smt_sort(node.ty)
+        if sort is None:
+            raise Exception(f'Unsupported quantified type: {node.ty}')
+        self.binders.append((node.var.name, sort))
+
+    def term(self, expr : Expr):
+        '''
+        The SMT-LIB term of `expr`, printed bottom-up with an explicit stack
+        '''
+        stack = [(expr, False, None)]
+        results = []
+        while stack:
+            node, done, key = stack.pop()
+            if not done:
+                key = self.key(node)
+                if key in self.cache:
+                    results.append(self.cache[key])
+                    continue
+                if isinstance(node, Quantification):
+                    self.bind(node)
+                stack.append((node, True, key))
+                stack.extend((c, False, None) for c in reversed(node.children()))
+                continue
+            n = len(node.children())
+            args = results[len(results) - n:]
+            del results[len(results) - n:]
+            if isinstance(node, Quantification):
+                args.insert(0, self.binders.pop())
+            printer = self.PRINTERS.get(type(node))
+            if printer is None:
+                raise_exception(f'Unsupported expression: {node}')
+            text, sort = printer(self, node, *args)
+            if key is node and node in self.shared:
+                name = f'$t{len(self.definitions)}'
+                self.definitions.append((name, sort, text))
+                text = name
+            self.cache[key] = (text, sort)
+            results.append((text, sort))
+        return results[0][0]
+
+    def script(self, assertions):
+        '''
+        The declarations and assertions of `assertions`, without any command
+        '''
+        self.shared = shared_nodes(assertions)
+        asserted = [f'(assert {self.term(a)})' for a in assertions]
+        lines = [f'(declare-fun {name} () {sort})' for (name, sort) in sorted(self.declared.items())]
+        lines.extend(f'(declare-fun {f} ({sort}) Int)' for (sort, f) in sorted(self.lengths.items()))
+        lines.extend(f'(define-fun {name} () {sort} {text})' for (name, sort, text) in self.definitions)
+        return '\n'.join(lines + asserted) + '\n'
+
+def to_smtlib(sigma : dict, *assertions : Expr):
+    '''
+    SMT-LIB declarations and assertions of `assertions`, whose variables are typed by `sigma`
+    '''
+    return Printer(sigma).script(assertions)
+
+def tokenize(text : str):
+    return re.findall(r'[()]|"[^"]*"|\|[^|]*\||[^\s()]+', text)
+
+def parse_sexprs(text : str):
+    stack = [[]]
+    for token in tokenize(text):
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) > 1:
+                done = stack.pop()
+                stack[-1].append(done)
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+def unparse(sexpr):
+    if isinstance(sexpr, list):
+        return '(' + ' '.join(map(unparse, sexpr)) + ')'
+    return sexpr
+
+def value(sexpr):
+    if sexpr in ('true', 'false'):
+        return sexpr == 'true'
+    if isinstance(sexpr, str) and sexpr.isdigit():
+        return int(sexpr)
+    if isinstance(sexpr, list) and len(sexpr) == 2 and sexpr[0] == '-' and isinstance(sexpr[1], str) \
+       and sexpr[1].isdigit():
+        return -int(sexpr[1])
+    return unparse(sexpr)
+
+def parse_model(text : str):
+    '''
+    The constants of a `(get-model)` answer as Python values, leaving out internal (`$`-prefixed) names
+    '''
+    values = dict()
+    for model in parse_sexprs(text):
+        if not isinstance(model, list):
+            continue
+        for d in model:
+            if not (isinstance(d, list) and len(d) == 5 and d[0] == 'define-fun' and d[2] == []):
+                continue
+            name = d[1].strip('|')
+            if not name.startswith('$'):
+                values[name] = value(d[4])
+    return values
+
+class SolverError(Exception):
+    pass
+
+class SolverProcess:
+    '''
+    A solver reading SMT-LIB commands from a pipe. Each query is checked between `push` and `pop`,
+    and its answer is delimited by echoing `SENTINEL`.
+    '''
+    SENTINEL = 'veripy-done'
+    # seconds a solver gets past the time limit of a query before it is killed
+    GRACE = 1.0
+
+    def __init__(self, command):
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        self.buffer = b''
+        self.send('(set-option :print-success false)\n(set-option :produce-models true)\n')
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, text : str):
+        try:
+            self.process.stdin.write(text.encode('utf-8'))
+            self.process.stdin.flush()
+        except OSError as e:
+            raise SolverError(f'solver exited: {e}')
+
+    def receive(self, deadline=None):
+        '''
+        The lines answered up to the next sentinel; raises `SolverError` past `deadline`
+        '''
+        fd = self.process.stdout.fileno()
+        lines = []
+        while True:
+            while b'\n' in self.buffer:
+                line, self.buffer = self.buffer.split(b'\n', 1)
+                line = line.decode('utf-8', 'replace').strip()
+                if line.strip('"') == self.SENTINEL:
+                    return lines
+                if line:
+                    lines.append(line)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise SolverError('timeout, solver killed')
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise SolverError('timeout, solver killed')
+            chunk = os.read(fd, 1 << 16)
+            if not chunk:
+                raise SolverError('solver exited')
+            self.buffer += chunk
+
+    def command(self, text : str, deadline=None):
+        self.send(f'{text}\n(echo "{self.SENTINEL}")\n')
+        return self.receive(deadline)
+
+    def query(self, script : str, timeout=None, rlimit=None):
+        '''
+        Check the assertions of `script`. Returns `(status, model, reason)` like `veripy.portfolio.solve`.
+        A solver that overruns `timeout` is killed; the caller must not reuse it.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout + self.GRACE
+        # the limits are Z3 options, which other solvers ignore
+        options = [f'(set-option :timeout {timeout_ms(timeout)})',
+                   f'(set-option :rlimit {0 if rlimit is None else rlimit})']
+        try:
+            lines = self.command('\n'.join(options + ['(push 1)', script, '(check-sat)']), deadline)
+            status = next((l for l in lines if l in ('sat', 'unsat', 'unknown')), None)
+            model, reason = None, None
+            if status == 'sat':
+                model = parse_model('\n'.join(self.command('(get-model)', deadline)))
+            elif status == 'unknown':
+                answer = parse_sexprs(' '.join(self.command('(get-info :reason-unknown)', deadline)))
+                reason = answer[0][1].strip('"') if answer and isinstance(answer[0], list) and len(answer[0]) > 1 \
+                         else 'unknown'
+            elif status is None:
+                status, reason = 'unknown', '; '.join(lines) or 'no answer'
+            self.send('(pop 1)\n')
+            return (status, model, reason)
+        except SolverError as e:
+            self.kill()
+            return ('unknown', None, str(e))
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        for f in (self.process.stdin, self.process.stdout):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+class SolverPool:
+    '''
+    Settings of the external solvers, and the processes running them.
+        - command   : the solver command line, reading SMT-LIB from its standard input
+        - processes : number of solver processes, i.e. obligations checked in parallel
+        - slow      : seconds after which the script of an obligation is saved to `artifacts`
+                      (obligations the solver does not decide are always saved)
+        - artifacts : directory of the saved `.smt2` scripts
+    Processes are started on demand and reused across queries. The pool belongs to the process
+    that started them: a forked worker starts its own.
+    '''
+    def __init__(self, command=None, processes=None, slow=None, artifacts=None):
+        self.enabled = False
+        self.command = list(command) if command is not None else ['z3', '-in']
+        self.processes = processes if processes is not None else (os.cpu_count() or 1)
+        self.slow = slow
+        self.artifacts = artifacts
+        self.owner = os.getpid()
+        self.idle = []
+        self.started = 0
+        self.lock = threading.Condition()
+
+    def adopt(self):
+        '''
+        Forget the processes of the parent after a fork, since they are still used by the parent
+        '''
+        if self.owner != os.getpid():
+            self.owner = os.getpid()
+            self.idle = []
+            self.started = 0
+            self.lock = threading.Condition()
+
+    def acquire(self):
+        self.adopt()
+        with self.lock:
+            while not self.idle and self.started >= self.processes:
+                self.lock.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.started += 1
+        try:
+            return SolverProcess(self.command)
+        except OSError:
+            with self.lock:
+                self.started -= 1
+                self.lock.notify()
+            raise
+
+    def release(self, process : SolverProcess):
+        with self.lock:
+            if process.alive():
+                self.idle.append(process)
+            else:
+                self.started -= 1
+            self.lock.notify()
+
+    def check(self, script : str, timeout=None, rlimit=None):
+        '''
+        Check `script` on an idle solver, returning `(status, model, reason)`
+        '''
+        process = self.acquire()
+        try:
+            return process.query(script, timeout, rlimit)
+        finally:
+            self.release(process)
+
+    def save(self, name : str, script : str, comment : str=''):
+        '''
+        Write `script` as a standalone `.smt2` file, returning its path (`None` if it could not be written)
+        '''
+        if self.artifacts is None:
+            return None
+        path = os.path.join(self.artifacts, re.sub(r'[^\w.-]+', '_', name) + '.smt2')
+        try:
+            os.makedirs(self.artifacts, exist_ok=True)
+            with open(path, 'w') as f:
+                for line in comment.splitlines():
+                    f.write(f'; {line}\n')
+                f.write('(set-option :produce-models true)\n')
+                f.write(script)
+                f.write('(check-sat)\n(get-model)\n')
+        except OSError:
+            return None
+        return path
+
+    def close(self):
+        self.adopt()
+        with self.lock:
+            idle, self.idle = self.idle, []
+            self.started -= len(idle)
+        for process in idle:
+            process.kill()
+
+POOL = SolverPool()
@@ -0,0 +1,52 @@
+import os
+import ast
+import inspect
+
+class FunctionSource:
+    '''
+    A function to verify, known by its source only.
+        - name  : its name
+        - code  : its definition, decorators included
+        - path  : the file it is defined in, if any
+    '''
+    def __init__(self, name : str, code : str, path : str=None):
+        self.name = name
+        self.code = code
+        self.path = path
+
+    @property
+    def __name__(self):
+        return self.name
+
+    def definition(self):
+        return ast.parse(self.code).body[0]
+
+    def __repr__(self):
+        return f'FunctionSource({self.name}, {self.path})'
+
+def function_source(func):
+    '''
+    The `FunctionSource` of `func`, given as a function, a function definition (`ast.FunctionDef`),
+    the source of a function definition or a `FunctionSource`
+    '''
+    if isinstance(func, FunctionSource):
+        return func
+    if isinstance(func, ast.FunctionDef):
+        return FunctionSource(func.name, ast.unparse(func))
+    if isinstance(func, str):
+        func_def = ast.parse(func).body[0]
+        if not isinstance(func_def, ast.FunctionDef):
+            raise Exception('Expected the definition of a function')
+        return FunctionSource(func_def.name, func)
+    try:
+        path = os.path.abspath(inspect.getsourcefile(func))
+    except TypeError:
+        path = func.__module__
+    return FunctionSource(func.__name__, inspect.getsource(func), path)
+
+def definition_source(lines, func_def : ast.FunctionDef):
+    '''
+    The source of `func_def` in the file of `lines`, as `inspect.getsource` gives it for the function
+    '''
+    start = min([func_def.lineno] + [d.lineno for d in func_def.decorator_list])
+    return ''.join(lines[start - 1:func_def.end_lineno])
@@ -14,30 +14,62 @@ def subst(this : str, withThis : Expr, inThis : Expr) -> Expr:
     '''
     Substitute a variable (`this`) with `withThis` in expression `inThis` and return the resulted expression
     '''
-    if isinstance(inThis, Var):
-        if inThis.name == this:
-            return withThis
-        else:
-            return inThis
-    if isinstance(inThis, BinOp):
-        return BinOp(subst(this, withThis, inThis.e1), inThis.op, subst(this, withThis, inThis.e2))
-    if isinstance(inThis, Literal):
-        return inThis
-    if isinstance(inThis, UnOp):
-        return UnOp(inThis.op, subst(this, withThis, inThis.e))
-    if isinstance(inThis, Quantification):
-        if this != inThis.var:
-            return Quantification(inThis.var, subst(this, withThis, inThis.expr), inThis.ty)
-        return inThis
-    if isinstance(inThis, FunctionCall):
+    return subst_many({this: withThis}, inThis)
+
+def subst_many(mapping : dict, inThis : Expr) -> Expr:
+    '''
+    Simultaneously substitute every variable named by a key of `mapping` with its value in `inThis`.
+    The traversal uses an explicit stack and only enters subterms mentioning a substituted variable.
+    '''
+    if not mapping:
         return inThis
-    
-    raise NotImplementedError(f'Substitution not implemented for {type(inThis)}')
+    targets = mapping.keys()
+    def visit(node, children):
+        if isinstance(node, Var):
+            return mapping.get(node.name, node)
+        if children is None:
+            if isinstance(node, Quantification) and not targets.isdisjoint(node.variables()):
+                bound = {k: v for (k, v) in mapping.items() if k != node.var.name}
+                return node.rebuild([subst_many(bound, node.expr)])
+            return node
+        return node.rebuild(children)
+    def descend(node):
+        if isinstance(node, Quantification) and node.var.name in mapping:
+            return False
+        return not targets.isdisjoint(node.variables())
+    return postorder(inThis, visit, descend)
 
 class ExprTranslator:
     '''
     Translator that can convert a Python expression AST to veripy AST
     '''
+    BOOL_OPS = {
+        ast.And:    BoolOps.And,
+        ast.Or:     BoolOps.Or,
+    }
+
+    COMPARE_OPS = {
+        ast.Lt:     CompOps.Lt,
+        ast.LtE:    CompOps.Le,
+        ast.Gt:     CompOps.Gt,
+        ast.GtE:    CompOps.Ge,
+        ast.Eq:     CompOps.Eq,
+        ast.NotEq:  CompOps.Neq,
+    }
+
+    BIN_OPS = {
+        ast.Add:    ArithOps.Add,
+        ast.Sub:    ArithOps.Minus,
+        ast.Mult:   ArithOps.Mult,
+        ast.Div:    ArithOps.IntDiv,
+        ast.Mod:    ArithOps.Mod
+    }
+
+    UNARY_OPS = {
+        ast.USub:   ArithOps.Neg,
+        ast.Not:    BoolOps.Not
+    }
+
     def fold_binops(self, op : Op, values : List[Expr]):
         result = BinOp(self.visit(values[0]), op, self.visit(values[1]))
         for e in values[2:]:
@@ -57,11 +89,7 @@ class ExprTranslator:
         return self.visit(node.value)
     
     def visit_BoolOp(self, node):
-        op = {
-                ast.And:    lambda: BoolOps.And,
-                ast.Or:     lambda: BoolOps.Or,
-             }.get(node.op)
-        return self.fold_binops(op, node.values)
+        return self.fold_binops(self.BOOL_OPS[type(node.op)], node.values)
     
     def visit_Compare(self, node):
         '''
@@ -73,32 +101,22 @@ class ExprTranslator:
         lv = self.visit(node.left)
         rv = self.visit(node.comparators[0])
         op = node.ops[0]
-        return {
-            ast.Lt:     lambda: BinOp(lv, CompOps.Lt, rv),
-            ast.LtE:    lambda: BinOp(lv, CompOps.Le, rv),
-            ast.Gt:     lambda: BinOp(lv, CompOps.Gt, rv),
-            ast.GtE:    lambda: BinOp(lv, CompOps.Ge, rv),
-            ast.Eq:     lambda: BinOp(lv, CompOps.Eq, rv),
-            ast.NotEq:  lambda: BinOp(lv, CompOps.Neq, rv),
-        }.get(type(op), lambda: raise_exception(f'Not Supported: {op}'))()
+        if type(op) not in self.COMPARE_OPS:
+            raise_exception(f'Not Supported: {op}')
+        return BinOp(lv, self.COMPARE_OPS[type(op)], rv)
 
     def visit_BinOp(self, node):
         lv = self.visit(node.left)
         rv = self.visit(node.right)
-        return {
-            ast.Add:    lambda: BinOp(lv, ArithOps.Add, rv),
-            ast.Sub:    lambda: BinOp(lv, ArithOps.Minus, rv),
-            ast.Mult:   lambda: BinOp(lv, ArithOps.Mult, rv),
-            ast.Div:    lambda: BinOp(lv, ArithOps.IntDiv, rv),
-            ast.Mod:    lambda: BinOp(lv, ArithOps.Mod, rv)
-        }.get(type(node.op), lambda: raise_exception(f'Not Supported: {node.op}'))()
+        if type(node.op) not in self.BIN_OPS:
+            raise_exception(f'Not Supported: {node.op}')
+        return BinOp(lv, self.BIN_OPS[type(node.op)], rv)
     
     def visit_UnaryOp(self, node):
         v = self.visit(node.operand)
-        return {
-            ast.USub:   lambda: UnOp(ArithOps.Neg, v),
-            ast.Not:    lambda: UnOp(BoolOps.Not, v)
-        }.get(type(node.op), lambda: raise_exception(f'Not Supported {node.op}'))()
+        if type(node.op) not in self.UNARY_OPS:
+            raise_exception(f'Not Supported {node.op}')
+        return UnOp(self.UNARY_OPS[type(node.op)], v)
 
     def visit_Index(self, node):
         return self.visit(node.value)
@@ -111,7 +129,7 @@ class ExprTranslator:
             if func == 'invariant':
                 return parse_assertion(node.args[0].s)
         else:
-            return FunctionCall(Var(func), list(map(lambda x: Var(x.id), node.args)))
+            return FunctionCall(Var(func), [self.visit(x) for x in node.args])
     
     def visit_Slice(self, node):
         lo, hi, step = [None] * 3
@@ -131,24 +149,29 @@ class ExprTranslator:
     def visit_Constant(self, node):
         assert isinstance(node, ast.Constant)
         value = node.value
+        if isinstance(value, bool):
+            return Literal (VBool (value))
         return Literal (VInt (value))
+
+    VISITORS = {
+        ast.BinOp:          visit_BinOp,
+        ast.Name:           visit_Name,
+        ast.Compare:        visit_Compare,
+        ast.BoolOp:         visit_BoolOp,
+        ast.NameConstant:   visit_NameConstant,
+        ast.Num:            visit_Num,
+        ast.UnaryOp:        visit_UnaryOp,
+        ast.Call:           visit_Call,
+        ast.Subscript:      visit_Subscript,
+        ast.Index:          visit_Index,
+        ast.Constant:       visit_Constant,
+    }
     
     def visit(self, node):
-        # if isinstance(node, ast.Constant):
-        #     print(dir(node), node.s, node.n, node.value)
-        return {
-                ast.BinOp:          lambda: self.visit_BinOp(node),
-                ast.Name:           lambda: self.visit_Name(node),
-                ast.Compare:        lambda: self.visit_Compare(node),
-                ast.BoolOp:         lambda: self.visit_BoolOp(node),
-                ast.NameConstant:   lambda: self.visit_NameConstant(node),
-                ast.Num:            lambda: self.visit_Num(node),
-                ast.UnaryOp:        lambda: self.visit_UnaryOp(node),
-                ast.Call:           lambda: self.visit_Call(node),
-                ast.Subscript:      lambda: self.visit_Subscript(node),
-                ast.Index:          lambda: self.visit_Index(node),
-                ast.Constant:       lambda: self.visit_Constant(node),
-            }.get(type(node), lambda: raise_exception(f'Expr not supported: {node}'))()
+        visitor = self.VISITORS.get(type(node))
+        if visitor is None:
+            raise_exception(f'Expr not supported: {node}')
+        return visitor(self, node)
 
 class StmtTranslator:
     '''
@@ -156,6 +179,7 @@ class StmtTranslator:
     '''
     def __init__(self):
         self.expr_translator = ExprTranslator()
+        self.discarded = 0
 
     def make_seq(self, stmts, need_visit=True):
         '''
@@ -166,11 +190,10 @@ class StmtTranslator:
                               `need_visit` is True; otherwise, each node will be filled in directly.
         '''
         if stmts:
-            hd, *stmts = stmts
-            t_node = self.visit(hd) if need_visit else hd
-            while stmts:
-                t2_node, stmts = self.visit(stmts[0]) if need_visit else stmts[0], stmts[1:]
-                t_node = Seq(t_node, t2_node)
+            nodes = iter(stmts)
+            t_node = self.visit(next(nodes)) if need_visit else next(nodes)
+            for stmt in nodes:
+                t_node = Seq(t_node, self.visit(stmt) if need_visit else stmt)
             if not isinstance(t_node, Seq):
                 return Seq(t_node, Skip())
             return t_node
@@ -185,7 +208,7 @@ class StmtTranslator:
             if func == 'invariant':
                 return parse_assertion(node.args[0].s)
         else:
-            return FunctionCall(Var(func), list(map(lambda x: Var(x.id), node.args)))
+            return FunctionCall(Var(func), [self.expr_translator.visit(x) for x in node.args])
     
     def visit_FunctionDef(self, node):
         return self.make_seq(node.body)
@@ -196,14 +219,39 @@ class StmtTranslator:
     def visit_Return(self, node):
         return Skip()
 
+    def visit_Expr(self, node):
+        '''
+        Expression statements: `assume(...)`, calls whose result is discarded (assigned to a
+        fresh `$discard` variable, so that the callee's precondition is still checked) and docstrings
+        '''
+        if isinstance(node.value, ast.Call) and isinstance(node.value.func, ast.Name):
+            if node.value.func.id == 'assume':
+                return self.visit_Call(node.value)
+            if node.value.func.id == 'invariant':
+                raise_exception('Invariants can only be specified at the beginning of a loop body')
+            self.discarded += 1
+            return Assign(f'$discard{self.discarded}', self.expr_translator.visit(node.value))
+        if isinstance(node.value, ast.Constant):
+            return Skip()
+        raise_exception(f'Stmt not supported: {node}')
+
+    def visit_Pass(self, node):
+        return Skip()
+
     def visit_Assign(self, node):
-        if isinstance(node.targets[0], ast.Subscript):
-            varname = self.expr_translator.visit(node.targets[0])
-            print(varname)
-        else:
-            varname = node.targets[0].id
+        '''
+        An assignment to an element updates the whole array:
+        `a[i][j] = e` becomes `a = Store(a, i, Store(a[i], j, e))`
+        '''
+        target = node.targets[0]
         expr = self.expr_translator.visit(node.value)
-        return Assign(varname, expr)
+        while isinstance(target, ast.Subscript):
+            arr = self.expr_translator.visit(target.value)
+            expr = Store(arr, self.expr_translator.visit(target.slice), expr)
+            target = target.value
+        if not isinstance(target, ast.Name):
+            raise_exception(f'Assignment target not supported: {target}')
+        return Assign(target.id, expr)
 
     def visit_While(self, node):
         '''
@@ -211,7 +259,7 @@ class StmtTranslator:
             While e S
             ==>
             assert invariant
-            havoc x (for all x referred in S)
+            havoc x (for all x assigned in S)
             assume invariant
             if e then S;assert invariants;assume false
             else skip
@@ -225,7 +273,7 @@ class StmtTranslator:
         body = self.make_seq(list(filter(lambda x: True if not isinstance(x, ast.Expr)
                                                            or not isinstance(x.value, ast.Call)
                                                         else x.value.func.id != 'invariant', node.body)))
-        loop_targets = body.variables()
+        loop_targets = sorted(body.assigned())
         havocs = list(map(Havoc, loop_targets))
         invariants = Literal (VBool (True)) if not invars \
                       else reduce(lambda i1, i2: BinOp(i1, BoolOps.And, i2), invars)
@@ -252,18 +300,24 @@ class StmtTranslator:
     def visit_Assert(self, node):
         return Assert(self.expr_translator.visit(node.test))
     
+    VISITORS = {
+        ast.FunctionDef: visit_FunctionDef,
+        ast.Module:      visit_Module,
+        ast.If:          visit_If,
+        ast.While:       visit_While,
+        ast.Assert:      visit_Assert,
+        ast.Assign:      visit_Assign,
+        ast.Return:      visit_Return,
+        ast.Expr:        visit_Expr,
+        ast.Call:        visit_Call,
+        ast.Pass:        visit_Pass
+    }
+
     def visit(self, node):
-        return {
-                ast.FunctionDef: lambda: self.visit_FunctionDef(node),
-                ast.Module:      lambda: self.visit_Module(node),
-                ast.If:          lambda: self.visit_If(node),
-                ast.While:       lambda: self.visit_While(node),
-                ast.Assert:      lambda: self.visit_Assert(node),
-                ast.Assign:      lambda: self.visit_Assign(node),
-                ast.Return:      lambda: self.visit_Return(node),
-                ast.Call:        lambda: self.visit_Call(node),
-                ast.Pass:        lambda: Skip()
-            }.get(type(node), lambda: raise_exception(f'Stmt not supported: {node}'))()
+        visitor = self.VISITORS.get(type(node))
+        if visitor is None:
+            raise_exception(f'Stmt not supported: {node}')
+        return visitor(self, node)
 
 
 class Expr2Z3:
@@ -272,74 +326,164 @@ class Expr2Z3:
     '''
     def __init__(self, name_dict: dict):
         self.name_dict = name_dict
+        self.cache = dict()
+        self.binders = []
+        self.lengths = dict()
 
-    def translate_type(self, ty):
+    @staticmethod
+    def translate_type(ty):
         if ty == TINT:
             return z3.IntSort()
         if ty == TBOOL:
             return z3.BoolSort()
         if isinstance(ty, TARR):
-            return z3.ArraySort(z3.IntSort(), self.translate_type(ty.ty))
+            element = Expr2Z3.translate_type(ty.ty)
+            if element is not None:
+                return z3.ArraySort(z3.IntSort(), element)
+        return None
+
+    def length(self, arr):
+        '''
+        The length of a Z3 array: an uninterpreted function per array sort. Updates
+        preserve the length, so `len(Store(a, i, v))` is `len(a)`.
+        '''
+        while z3.is_store(arr):
+            arr = arr.arg(0)
+        sort = arr.sort()
+        if sort not in self.lengths:
+            self.lengths[sort] = z3.Function('len', sort, z3.IntSort())
+        return self.lengths[sort](arr)
+
+    BINOPS = {
+        ArithOps.Add:       lambda c1, c2: c1 + c2,
+        ArithOps.Minus:     lambda c1, c2: c1 - c2,
+        ArithOps.Mult:      lambda c1, c2: c1 * c2,
+        ArithOps.IntDiv:    lambda c1, c2: c1 / c2,
+        ArithOps.Mod:       lambda c1, c2: c1 % c2,
+
+        BoolOps.And:        lambda c1, c2: z3.And(c1, c2),
+        BoolOps.Or:         lambda c1, c2: z3.Or(c1, c2),
+        BoolOps.Implies:    lambda c1, c2: z3.Implies(c1, c2),
+        BoolOps.Iff:        lambda c1, c2: z3.And(z3.Implies(c1, c2), z3.Implies(c2, c1)),
+
+        CompOps.Eq:         lambda c1, c2: c1 == c2,
+        CompOps.Neq:        lambda c1, c2: z3.Not(c1 == c2),
+        CompOps.Gt:         lambda c1, c2: c1 > c2,
+        CompOps.Ge:         lambda c1, c2: c1 >= c2,
+        CompOps.Lt:         lambda c1, c2: c1 < c2,
+        CompOps.Le:         lambda c1, c2: c1 <= c2
+    }
+
+    UNOPS = {
+        ArithOps.Neg:       lambda c: -c,
+        BoolOps.Not:        lambda c: z3.Not(c)
+    }
 
     def visit_Literal(self, lit : Literal):
         v = lit.value
-        return {
-            VBool: lambda: v.v,
-            VInt: lambda: v.v
-        }.get(type(v), lambda: raise_exception(f'Unsupported data: {v}'))()
+        if type(v) not in (VBool, VInt):
+            raise_exception(f'Unsupported data: {v}')
+        return v.v
 
     def visit_Var(self, node : Var):
         return self.name_dict[node.name]
     
-    def visit_BinOp(self, node : BinOp):
-        c1 = self.visit(node.e1)
-        c2 = self.visit(node.e2)
-        return {
-            ArithOps.Add:       lambda: c1 + c2,
-            ArithOps.Minus:     lambda: c1 - c2,
-            ArithOps.Mult:      lambda: c1 * c2,
-            ArithOps.IntDiv:    lambda: c1 / c2,
-            ArithOps.Mod:       lambda: c1 % c2,
-            
-            BoolOps.And:        lambda: z3.And(c1, c2),
-            BoolOps.Or:         lambda: z3.Or(c1, c2),
-            BoolOps.Implies:    lambda: z3.Implies(c1, c2),
-            BoolOps.Iff:        lambda: z3.And(z3.Implies(c1, c2), z3.Implies(c2, c1)),
-
-            CompOps.Eq:         lambda: c1 == c2,
-            CompOps.Neq:        lambda: z3.Not(c1 == c2),
-            CompOps.Gt:         lambda: c1 > c2,
-            CompOps.Ge:         lambda: c1 >= c2,
-            CompOps.Lt:         lambda: c1 < c2,
-            CompOps.Le:         lambda: c1 <= c2
-        }.get(node.op, lambda: raise_exception(f'Unsupported Operator: {node.op}'))()
+    def visit_BinOp(self, node : BinOp, c1, c2):
+        if node.op not in self.BINOPS:
+            raise_exception(f'Unsupported Operator: {node.op}')
+        return self.BINOPS[node.op](c1, c2)
     
-    def visit_UnOp(self, node : UnOp):
-        c = self.visit(node.e)
-        return {
-            ArithOps.Neg: lambda: -c,
-            BoolOps.Not:  lambda: z3.Not(c)
-        }.get(node.op, lambda: raise_exception(f'Unsupported Operator: {node.op}'))()
+    def visit_UnOp(self, node : UnOp, c):
+        if node.op not in self.UNOPS:
+            raise_exception(f'Unsupported Operator: {node.op}')
+        return self.UNOPS[node.op](c)
     
-    def visit_Quantification(self, node : Quantification):
-        bound_var = None
-        if node.ty == TINT:
-            bound_var = z3.Int(node.var.name)
-        elif node.ty == TBOOL:
-            bound_var = z3.Bool(node.var.name)
-        elif isinstance(node.ty, TARR):
-            bound_var = z3.Array(z3.IntSort(), self.translate_type(node.ty.ty))
-        if bound_var is not None:
-            self.name_dict[node.var.name] = bound_var
-            return z3.ForAll(bound_var, self.visit(node.expr))
-        else:
+    def bind(self, node : Quantification):
+        '''
+        Bind the variable of `node` before its body is translated
+        '''
+        sort = self.translate_type(node.ty)
+        if sort is None:
             raise Exception(f'Unsupported quantified type: {node.ty}')
+        bound_var = z3.Const(node.var.name, sort)
+        self.binders.append((node.var.name, self.name_dict.get(node.var.name), bound_var))
+        self.name_dict[node.var.name] = bound_var
+
+    def unbind(self):
+        name, shadowed, bound_var = self.binders.pop()
+        if shadowed is None:
+            self.name_dict.pop(name)
+        else:
+            self.name_dict[name] = shadowed
+        return bound_var
+
+    def visit_Quantification(self, node : Quantification, bound_var, body):
+        return z3.ForAll(bound_var, body)
+
+    def visit_Subscript(self, node : Subscript, arr, index):
+        return z3.Select(arr, index)
+
+    def visit_Store(self, node : Store, arr, index, value):
+        return z3.Store(arr, index, value)
+
+    def visit_FunctionCall(self, node : FunctionCall, *args):
+        if node.func_name.name == 'len':
+            return self.length(args[0])
+        raise_exception(f'Unsupported function: {node.func_name.name}')
+
+    VISITORS = {
+        Literal:            visit_Literal,
+        Var:                visit_Var,
+        BinOp:              visit_BinOp,
+        UnOp:               visit_UnOp,
+        Quantification:     visit_Quantification,
+        Subscript:          visit_Subscript,
+        Store:              visit_Store,
+        FunctionCall:       visit_FunctionCall
+    }
+
+    def key(self, node : Expr):
+        '''
+        The memoization key of `node`: below a quantifier a bound variable name may denote
+        constants of different sorts, so the bound constants `node` refers to are part of the key
+        '''
+        if not self.binders:
+            return node
+        free = node.variables()
+        bound = {name: var.get_id() for (name, _, var) in self.binders if name in free}
+        return (node, *sorted(bound.items())) if bound else node
 
     def visit(self, expr : Expr):
-        return {
-            Literal:            lambda: self.visit_Literal(expr),
-            Var:                lambda: self.visit_Var(expr),
-            BinOp:              lambda: self.visit_BinOp(expr),
-            UnOp:               lambda: self.visit_UnOp(expr),
-            Quantification:     lambda: self.visit_Quantification(expr)
-        }.get(type(expr), lambda: raise_exception(f'Unsupported AST: {expr}'))()
\ No newline at end of file
+        '''
+        Translate `expr` bottom-up with an explicit stack, so deep expressions do not hit the
+        recursion limit. Translations are memoized per (hash-consed) node and bound constants.
+        '''
+        stack = [(expr, False, None)]
+        results = []
+        while stack:
+            node, done, key = stack.pop()
+            if not done:
+                key = self.key(node)
+                if key in self.cache:
+                    results.append(self.cache[key])
+                    continue
+                if isinstance(node, Quantification):
+                    self.bind(node)
+                stack.append((node, True, key))
+                stack.extend((c, False, None) for c in reversed(node.children()))
+                continue
+            n = len(node.children())
+            args = results[len(results) - n:]
+            del results[len(results) - n:]
+            if isinstance(node, Quantification):
+                args.insert(0, self.unbind())
+            result = self.translate(node, args)
+            self.cache[key] = result
+            results.append(result)
+        return results[0]
+
+    def translate(self, node : Expr, args):
+        visitor = self.VISITORS.get(type(node))
+        if visitor is None:
+            raise_exception(f'Unsupported AST: {node}')
+        return visitor(self, node, *args)
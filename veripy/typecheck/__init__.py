@@ -1,4 +1,4 @@
-from veripy.typecheck.type_check import (type_check_expr, type_infer_expr, type_check_stmt)
+from veripy.typecheck.type_check import (type_check_expr, type_infer_expr, type_check_stmt, resolve_types)
 
 __all__ = [
     'types',
@@ -4,14 +4,24 @@ from veripy.typecheck.types import *
 from veripy.built_ins import FUNCTIONS
 from veripy.log import log
 import typing_utils
+import types
 
-def type_check_stmt(sigma : dict, func_sigma : dict, stmt : Stmt):
+def type_check_stmt(sigma : dict, func_sigma : dict, stmt : Stmt, resolved : dict=None):
+    '''
+    Check `stmt`, returning the types of its variables. The types inferred for the bound variables
+    of quantifiers are recorded in `resolved` (see `resolve_types`).
+    '''
     if isinstance(stmt, Skip):
         return sigma
     if isinstance(stmt, Seq):
-        return type_check_stmt(type_check_stmt(sigma, func_sigma, stmt.s1), func_sigma, stmt.s2)
+        for s in flatten_seq(stmt):
+            sigma = type_check_stmt(sigma, func_sigma, s, resolved)
+        return sigma
     if isinstance(stmt, Assign):
-        ty = type_infer_expr(sigma, func_sigma, stmt.expr)
+        ty = type_infer_expr(sigma, func_sigma, stmt.expr, resolved)
+        if isinstance(ty, TARR) and isinstance(stmt.expr, Var) and stmt.expr.name != stmt.var:
+            # arrays are verified as values, Python lists are shared by reference
+            raise TypeError(f'Aliasing arrays is not supported: {stmt.var} = {stmt.expr.name}')
         if stmt.var not in sigma:
             sigma[stmt.var] = ty
             return sigma
@@ -22,46 +32,94 @@ def type_check_stmt(sigma : dict, func_sigma : dict, stmt : Stmt):
                 raise TypeError(f'Mutating Type of {stmt.var}!')
             return sigma
     if isinstance(stmt, If):
-        type_check_expr(sigma, func_sigma, TBOOL, stmt.cond)
-        return type_check_stmt(type_check_stmt(sigma, func_sigma, stmt.lb), func_sigma, stmt.rb)
+        type_check_expr(sigma, func_sigma, TBOOL, stmt.cond, resolved)
+        sigma = type_check_stmt(sigma, func_sigma, stmt.lb, resolved)
+        return type_check_stmt(sigma, func_sigma, stmt.rb, resolved)
     if isinstance(stmt, Assert) or isinstance(stmt, Assume):
-        type_check_expr(sigma, func_sigma, TBOOL, stmt.e)
+        type_check_expr(sigma, func_sigma, TBOOL, stmt.e, resolved)
         return sigma
     if isinstance(stmt, While):
-        type_check_expr(sigma, func_sigma, TBOOL, stmt.cond)
+        type_check_expr(sigma, func_sigma, TBOOL, stmt.cond, resolved)
         for i in stmt.invariants:
-            type_check_expr(sigma, func_sigma, TBOOL, i)
-        return type_check_stmt(sigma, func_sigma, stmt.body)
+            type_check_expr(sigma, func_sigma, TBOOL, i, resolved)
+        return type_check_stmt(sigma, func_sigma, stmt.body, resolved)
     if isinstance(stmt, Havoc):
         return sigma
     
     raise NotImplementedError(f'type check not implemented for: {type(stmt)}')
 
-def type_check_expr(sigma: dict, func_sigma : dict, expected, expr: Expr):
-    actual = type_infer_expr(sigma, func_sigma, expr)
+def check_type(sigma: dict, expected, expr: Expr, actual):
     if actual == TANY and isinstance(expr, Var):
         sigma[expr.name] = expected
         return expected
+    if isinstance(expected, TARR) or isinstance(actual, TARR):
+        if isinstance(expected, TARR) and isinstance(actual, TARR) and expected.ty in (TANY, actual.ty):
+            return actual
+        raise TypeError(f'{expr}: expected type {expected}, actual type {actual}')
     if actual == expected or typing_utils.issubtype(actual, expected):
         return actual
     else:
         raise TypeError(f'{expr}: expected type {expected}, actual type {actual};\
                         issubtype({actual}, {expected})={typing_utils.issubtype(actual, expected)}')
 
+def type_check_expr(sigma: dict, func_sigma : dict, expected, expr: Expr, resolved : dict=None):
+    return check_type(sigma, expected, expr, type_infer_expr(sigma, func_sigma, expr, resolved))
+
+def resolve_types(node, resolved : dict):
+    '''
+    The expression or statement `node` with its quantifiers replaced by the typed quantifiers of
+    `resolved`, the inferred types recorded by `type_check_stmt` / `type_check_expr`
+    '''
+    if not resolved:
+        return node
+    if isinstance(node, Expr):
+        def visit(e, children):
+            if children and any(c is not o for (c, o) in zip(children, e.children())):
+                rebuilt = e.rebuild(children)
+            else:
+                rebuilt = e
+            if isinstance(e, Quantification) and e in resolved:
+                return rebuilt.resolve_type(resolved[e])
+            return rebuilt
+        return postorder(node, visit)
+    if isinstance(node, Seq):
+        stmts = [resolve_types(s, resolved) for s in flatten_seq(node)]
+        result = stmts.pop()
+        while stmts:
+            result = Seq(stmts.pop(), result)
+        return result
+    if isinstance(node, Assign):
+        return Assign(node.var, resolve_types(node.expr, resolved))
+    if isinstance(node, If):
+        return If(resolve_types(node.cond, resolved), resolve_types(node.lb, resolved), resolve_types(node.rb, resolved))
+    if isinstance(node, (Assert, Assume)):
+        return type(node)(resolve_types(node.e, resolved))
+    if isinstance(node, While):
+        return While([resolve_types(i, resolved) for i in node.invariants], resolve_types(node.cond, resolved),
+                     resolve_types(node.body, resolved))
+    return node
+
 ###############################################
 #               Type Inference                #
 ###############################################
+'''
+The inference rules of compound expressions are generators: each `yield (expected, e)`
+checks the sub-expression `e` against `expected` and evaluates to its checked type.
+`type_infer_expr` runs them on an explicit stack so deep expressions cannot overflow.
+'''
 
 def type_infer_Subscript(sigma, func_sigma, expr: Subscript):
     obj = expr.var
-    exact_type = type_check_expr(sigma, func_sigma, List, obj)
+    exact_type = yield (TARR(TANY), obj)
     # Assume subscripts are integer indices for now
-    type_check_expr(sigma, func_sigma, TINT, expr.subscript)
-    type_args = typing.get_args(exact_type)
-    if type_args:
-        return type_args[0]
-    else:
-        return TANY
+    yield (TINT, expr.subscript)
+    return exact_type.ty
+
+def type_infer_Store(sigma, func_sigma, expr: Store):
+    exact_type = yield (TARR(TANY), expr.arr)
+    yield (TINT, expr.index)
+    yield (exact_type.ty, expr.value)
+    return exact_type
 
 def type_infer_literal(sigma, func_sigma, expr: Literal):
     return {
@@ -71,54 +129,70 @@ def type_infer_literal(sigma, func_sigma, expr: Literal):
 
 def type_infer_UnOp(sigma, func_sigma, expr: UnOp):
     if expr.op == BoolOps.Not:
-        return type_check_expr(sigma, func_sigma, TBOOL, expr.e)
+        return (yield (TBOOL, expr.e))
     if expr.op == ArithOps.Neg:
-        return type_check_expr(sigma, func_sigma, TINT, expr.e)
+        return (yield (TINT, expr.e))
 
 def type_infer_BinOp(sigma, func_sigma, expr: BinOp):
     if isinstance(expr.op, ArithOps):
-        type_check_expr(sigma, func_sigma, TINT, expr.e1)
-        return type_check_expr(sigma, func_sigma, TINT, expr.e2)
+        yield (TINT, expr.e1)
+        return (yield (TINT, expr.e2))
     if isinstance(expr.op, CompOps):
-        type_check_expr(sigma, func_sigma, TINT, expr.e1)
-        type_check_expr(sigma, func_sigma, TINT, expr.e2)
+        yield (TINT, expr.e1)
+        yield (TINT, expr.e2)
         return TBOOL
     if isinstance(expr.op, BoolOps):
-        type_check_expr(sigma, func_sigma, TBOOL, expr.e1)
-        return type_check_expr(sigma, func_sigma, TBOOL, expr.e2)
+        yield (TBOOL, expr.e1)
+        return (yield (TBOOL, expr.e2))
 
 def type_infer_Slice(sigma, func_sigma, expr: Slice):
     if expr.lower or expr.upper or expr.step:
         if expr.lower:
-            type_check_expr(sigma, func_sigma, TINT, expr.lower)
+            yield (TINT, expr.lower)
         if expr.upper:
-            type_check_expr(sigma, func_sigma, TINT, expr.upper)
+            yield (TINT, expr.upper)
         if expr.step:
-            type_check_expr(sigma, func_sigma, TINT, expr.step)
+            yield (TINT, expr.step)
         return TSLICE
     raise Exception('Slice must have at least one field that is not None')
 
-def type_infer_FunctionCall(sigma, func_sigma: typing.Dict[str, TARROW], expr: FunctionCall):
-    func_name = expr.func_name
-    func_type: TARROW = func_sigma[func_name]
-    
+def type_infer_FunctionCall(sigma, func_sigma: dict, expr: FunctionCall):
+    func_name = expr.func_name.name
+    if func_name in FUNCTIONS:
+        func_type: TARROW = BUILT_IN_FUNC_TYPE[func_name]
+    elif func_name in func_sigma:
+        func_type: TARROW = func_sigma[func_name]['func_type']
+    else:
+        raise TypeError(f'Unknown function: {func_name}')
+    if len(expr.args) != len(func_type.t1.types):
+        raise TypeError(f'{func_name} expects {len(func_type.t1.types)} arguments, {len(expr.args)} given')
+    for (ty, arg) in zip(func_type.t1.types, expr.args):
+        yield (ty, arg)
+    return func_type.t2
+
 
-def type_infer_quantification(sigma, func_sigma, expr: Quantification):
+def type_infer_quantification(sigma, func_sigma, expr: Quantification, resolved : dict=None):
     sigma[expr.var.name] = TANY if expr.ty is None else expr.ty
-    type_check_expr(sigma, func_sigma, TBOOL, expr.expr)
+    yield (TBOOL, expr.expr)
     if sigma[expr.var.name] == TANY:
         raise Exception(f'Cannot infer type for {expr.var} in {expr}')
-    expr.ty = sigma[expr.var.name]
+    if expr.ty is None and resolved is not None:
+        # the node is shared: the inferred type is recorded aside, not set on it
+        if resolved.setdefault(expr, sigma[expr.var.name]) != sigma[expr.var.name]:
+            raise TypeError(f'Conflicting types inferred for {expr.var} in {expr}')
     sigma.pop(expr.var.name)
     return TBOOL
 
-def type_infer_expr(sigma: dict, func_sigma : dict, expr: Expr):
+def type_infer_var(sigma, func_sigma, expr: Var):
+    assert sigma is not None
+    assert expr.name in sigma
+    return sigma[expr.name]
+
+def type_infer_step(sigma: dict, func_sigma : dict, expr: Expr, resolved : dict=None):
     if isinstance(expr, Literal):
         return type_infer_literal(sigma, func_sigma, expr)
     if isinstance(expr, Var):
-        assert sigma is not None
-        assert expr.name in sigma
-        return sigma[expr.name]
+        return type_infer_var(sigma, func_sigma, expr)
     if isinstance(expr, UnOp):
         return type_infer_UnOp(sigma, func_sigma, expr)
     if isinstance(expr, BinOp):
@@ -126,8 +200,35 @@ def type_infer_expr(sigma: dict, func_sigma : dict, expr: Expr):
     if isinstance(expr, Slice):
         return type_infer_Slice(sigma, func_sigma, expr)
     if isinstance(expr, Quantification):
-        return type_infer_quantification(sigma, func_sigma, expr)
+        return type_infer_quantification(sigma, func_sigma, expr, resolved)
     if isinstance(expr, Subscript):
         return type_infer_Subscript(sigma, func_sigma, expr)
+    if isinstance(expr, Store):
+        return type_infer_Store(sigma, func_sigma, expr)
+    if isinstance(expr, FunctionCall):
+        return type_infer_FunctionCall(sigma, func_sigma, expr)
 
     raise NotImplementedError(f'Unknown expression: {expr}')
+
+def type_infer_expr(sigma: dict, func_sigma : dict, expr: Expr, resolved : dict=None):
+    result = type_infer_step(sigma, func_sigma, expr, resolved)
+    if not isinstance(result, types.GeneratorType):
+        return result
+    # each frame is (rule, expected type, expression) of a pending inference
+    stack = [(result, None, expr)]
+    value = None
+    while stack:
+        rule, _, _ = stack[-1]
+        try:
+            expected, e = rule.send(value)
+        except StopIteration as done:
+            _, expected, e = stack.pop()
+            value = done.value if expected is None else check_type(sigma, expected, e, done.value)
+            continue
+        result = type_infer_step(sigma, func_sigma, e, resolved)
+        if isinstance(result, types.GeneratorType):
+            stack.append((result, expected, e))
+            value = None
+        else:
+            value = check_type(sigma, expected, e, result)
+    return value
@@ -8,15 +8,40 @@ TANY = typing.Any
 
 class Type: pass
 
+def type_name(ty):
+    return getattr(ty, '__name__', repr(ty))
+
 class TARROW(Type):
     def __init__(self, t1, t2):
         self.t1 = t1
         self.t2 = t2
 
+    def __repr__(self):
+        return f'{self.t1!r} -> {type_name(self.t2)}'
+
 class TPROD(Type):
     def __init__(self, *types):
         self.types = tuple(types)
 
+    def __repr__(self):
+        return f'({", ".join(map(type_name, self.types))})'
+
+class TARR(Type):
+    '''
+    Lists of `ty`, indexed by integers from 0 to their length
+    '''
+    def __init__(self, ty):
+        self.ty = ty
+
+    def __eq__(self, other):
+        return isinstance(other, TARR) and self.ty == other.ty
+
+    def __hash__(self):
+        return hash((TARR, self.ty))
+
+    def __repr__(self):
+        return f'List[{type_name(self.ty)}]'
+
 def name_to_ast_type(node):
     return {
         'int' : TINT,
@@ -28,12 +53,23 @@ def subscript_to_ast_type(node):
     if node.slice == None:
         return TANY
     
-    ty_arg = to_ast_type(node.slice.value)
+    # the type argument is wrapped in an `ast.Index` before Python 3.9
+    ty_arg = to_ast_type(node.slice.value if isinstance(node.slice, ast.Index) else node.slice)
+    if ty_contr in ('List', 'list'):
+        return TARR(ty_arg)
     return {
-        'List' : typing.List,
         'Tuple': typing.Tuple
     }.get(ty_contr, lambda _: TANY)[ty_arg]
 
+def from_typing(ty):
+    '''
+    The veripy type of a `typing` annotation (e.g. `List[int]` given in `inputs`)
+    '''
+    if typing.get_origin(ty) is list:
+        args = typing.get_args(ty)
+        return TARR(from_typing(args[0]) if args else TANY)
+    return ty
+
 def to_ast_type(ty):
     return {
             ast.Name        : name_to_ast_type,
@@ -41,7 +77,7 @@ def to_ast_type(ty):
     }.get(type(ty), lambda _: TANY)(ty)
 
 BUILT_IN_FUNC_TYPE = {
-    'len' : TARROW(typing.Sequence[typing.Any], TINT)
+    'len' : TARROW(TPROD(TARR(TANY)), TINT)
 }
 
 SUPPORTED = typing.Union[TINT, TBOOL, typing.List]
\ No newline at end of file
@@ -1,6 +1,12 @@
 import ast
+import io
 import z3
-import inspect
+import time
+import pickle
+import threading
+import multiprocessing
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import redirect_stdout, nullcontext
 from typing import List, Tuple, TypeVar
 from veripy.parser.syntax import *
 from veripy.parser.parser import parse_assertion, parse_expr
@@ -9,21 +15,52 @@ from veripy.transformer import *
 from functools import reduce
 from veripy.prettyprint import pretty_print
 from veripy import typecheck as tc
+from veripy.cache import CACHE
+from veripy.passive import passive_wp
+from veripy.result import FunctionResult, ObligationResult
+from veripy.profiling import PROFILER, expr_size, solver_statistics
+from veripy.runtime import RuntimeChecker
+from veripy.depgraph import DependencyGraph, function_node, node_id, called_functions
+from veripy.calls import lower_calls
+from veripy.arrays import check_bounds, length_facts, same_length
+from veripy.portfolio import PORTFOLIO, model_dict, solve, to_smt2, timeout_ms
+from veripy.simplify import simplify, trivial
+from veripy.slicing import Slicer
+from veripy.smtlib import POOL, to_smtlib
+from veripy.source import FunctionSource, function_source
 
 class VerificationStore:
     def __init__(self):
         self.store = dict()
         self.scope = []
         self.switch = False
+        self.on_call = False
+        self.runtime_sample = 0
+        self.deferred = False
+        self.lock = threading.RLock()
     
-    def enable_verification(self):
+    def enable_verification(self, on_call=False):
         self.switch = True
+        self.on_call = on_call and not self.deferred
+
+    def defer(self):
+        '''
+        Leave verification to a driver (`python -m veripy`): functions are always registered,
+        and the calls of the verified modules to `verify_all` / `do_verification` do nothing
+        '''
+        self.switch = True
+        self.on_call = False
+        self.deferred = True
 
     def push(self, scope):
+        if scope == self.current_scope() and not self.store[scope]['funcs']:
+            # e.g. a module opening the scope named after it, which the driver opened before importing it
+            return
         assert scope not in self.store
         self.scope.append(scope)
         self.store[scope] = {
             'func_attrs' : dict(),
+            'funcs'      : dict(),
             'vf'         : []
         }
     
@@ -31,74 +68,386 @@ class VerificationStore:
         if self.scope:
             return self.scope[-1]
     
-    def push_verification(self, func_name, verification_func):
+    def close_scopes(self):
+        '''
+        Close every open scope, returning them innermost first: the functions decorated from
+        now on belong to the scopes opened next
+        '''
+        scopes = list(reversed(self.scope))
+        self.scope.clear()
+        return scopes
+
+    def push_verification(self, func_name, verification_func, scope=None):
         if self.switch:
-            if not self.scope:
+            if scope is None and not self.scope:
                 raise Exception('No Scope Defined')
-            self.store[self.scope[-1]]['vf'].append((func_name, verification_func))
-    
-    def verify(self, scope, ignore_err):
-        if self.switch and self.store:
-            print(f'=> Verifying Scope `{scope}`')
-            verifications = self.store[scope]
-            for f_name, f in verifications['vf']:
-                try:
-                    f()
-                except Exception as e:
-                    print(f'Exception encountered while verifying {scope}::{f_name}')
-                    if not ignore_err:
-                        raise e
-                    else:
-                        print(e)
-            print(f'=> End Of `{scope}`\n')
+            self.store[self.scope[-1] if scope is None else scope]['vf'].append((func_name, verification_func))
     
-    def verify_all(self, ignore_err):
-        if self.switch:
+    def verify(self, scope, ignore_err, jobs=1, incremental=False):
+        if self.switch and self.store and not self.deferred:
+            return self.verify_scopes([scope], ignore_err, jobs, incremental=incremental)
+        return []
+
+    def verify_all(self, ignore_err, jobs=1, incremental=False, background=False):
+        '''
+        Verify and close every scope. With `background`, a `Future` of the results is returned:
+        the scopes are closed at once and verified by a separate thread, which never sees the
+        functions decorated in the meantime (they belong to the scopes opened next).
+        '''
+        active = self.switch and not self.deferred
+        if background:
+            scopes = self.close_scopes() if active else []
+        def run():
+            if not active:
+                return []
             try:
-                while self.scope:
-                    self.verify(self.scope.pop(), ignore_err)
+                if background:
+                    return self.verify_scopes(scopes, ignore_err, jobs, incremental=incremental)
+                return self.verify_scopes(list(reversed(self.scope)), ignore_err, jobs, pop=True,
+                                          incremental=incremental)
             except Exception as e:
                 if not ignore_err:
                     raise e
                 else:
-                    print(e)           
+                    print(e)
+            return []
+        if not background:
+            return run()
+        future = Future()
+        def run_in_background():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(run())
+                except BaseException as e:
+                    future.set_exception(e)
+        threading.Thread(target=run_in_background, name='veripy-verify-all').start()
+        return future
+
+    def verify_on_call(self, scope, f_name, pending):
+        '''
+        Run the verification in `pending` (if it was not run yet) when `scope::f_name` is first called
+        '''
+        with self.lock:
+            if pending:
+                f = pending.pop()
+                try:
+                    f()
+                except Exception as e:
+                    print(f'Exception encountered while verifying {scope}::{f_name}')
+                    print(e)
+
+    def verify_scopes(self, scopes, ignore_err, jobs=1, pop=False, incremental=False, selected=None):
+        with self.lock:
+            return self.verify_scopes_locked(scopes, ignore_err, jobs, pop, incremental, selected)
+
+    def dependency_graph(self, scopes, vfs=None):
+        '''
+        The dependency graph of the functions of `scopes` (or of the verifications `vfs[scope]`),
+        as a `DependencyGraph` and a map from `(scope, name)` to node ids
+        '''
+        graph, ids = DependencyGraph(), dict()
+        for scope in scopes:
+            funcs = self.store[scope]['funcs']
+            for f_name, _ in (self.store[scope]['vf'] if vfs is None else vfs[scope]):
+                func, inputs, requires, ensures = funcs[f_name]
+                try:
+                    semantics = call_semantics(self.get_func_attrs(scope, f_name))
+                except Exception:
+                    # the error is reported when the function itself is verified
+                    semantics = ''
+                ids[(scope, f_name)] = node_id(func, scope)
+                graph.nodes[ids[(scope, f_name)]] = function_node(func, inputs, requires, ensures, set(funcs),
+                                                                  semantics)
+        return graph, ids
+
+    def verify_scopes_locked(self, scopes, ignore_err, jobs=1, pop=False, incremental=False, selected=None):
+        '''
+        Verify every function of `scopes` in order (only those for which `selected(scope, name)`
+        holds, if given). With `jobs > 1` the
+        functions are verified by a pool of forked worker processes and the
+        results are reported in the same order as a sequential run.
+        With `incremental`, only the functions whose body or contract, or whose
+        callees' contracts, changed since their last successful verification
+        (recorded in the dependency graph next to the proof cache) are verified.
+        Returns the `FunctionResult` of every function verified before the
+        first error that is not ignored.
+        '''
+        # functions registered while verifying (e.g. by another thread) are left to the next run
+        vfs = {scope: list(self.store[scope]['vf']) for scope in scopes}
+        dirty = None
+        if incremental:
+            previous = DependencyGraph.load(CACHE.graph()) if CACHE.enabled else DependencyGraph()
+            graph, ids = self.dependency_graph(scopes, vfs)
+            dirty = graph.dirty(previous)
+        tasks = [(scope, i) for scope in scopes for (i, (f_name, _)) in enumerate(vfs[scope])
+                 if (selected is None or selected(scope, f_name)) and (dirty is None or ids[(scope, f_name)] in dirty)]
+        outcomes = iter(run_tasks(tasks, jobs))
+        results = []
+        try:
+            for scope in scopes:
+                if pop:
+                    self.scope.remove(scope)
+                print(f'=> Verifying Scope `{scope}`')
+                for f_name, _ in vfs[scope]:
+                    if selected is not None and not selected(scope, f_name):
+                        if dirty is not None and ids[(scope, f_name)] not in dirty:
+                            # not checked, but still verified since the last run
+                            graph.nodes[ids[(scope, f_name)]].status = 'verified'
+                        continue
+                    if dirty is not None and ids[(scope, f_name)] not in dirty:
+                        graph.nodes[ids[(scope, f_name)]].status = 'verified'
+                        results.append(FunctionResult(scope, f_name, cached=True))
+                        print(f'{f_name} Verified! (unchanged)')
+                        continue
+                    output, e, result = next(outcomes)
+                    results.append(result)
+                    if dirty is not None:
+                        graph.nodes[ids[(scope, f_name)]].status = result.status
+                    print(output, end='')
+                    if e is not None:
+                        print(f'Exception encountered while verifying {scope}::{f_name}')
+                        if not ignore_err:
+                            raise e
+                        else:
+                            print(e)
+                print(f'=> End Of `{scope}`\n')
+        finally:
+            if dirty is not None and CACHE.enabled:
+                graph.merge(previous).save(CACHE.graph())
+        return results
     
-    def insert_func_attr(self, scope, fname, inputs=[], inputs_map={}, returns=tc.types.TANY, requires=[], ensures=[]):
+    def insert_func_attr(self, scope, fname, inputs=[], inputs_map={}, returns=tc.types.TANY, requires=[], ensures=[],
+                         params=[], ret_var=None, modifies=[], reassigned=[]):
         if self.switch and self.store:
             self.store[scope]['func_attrs'][fname] = {
                 'inputs' : inputs_map,
                 'ensures': ensures,
                 'requires': requires,
                 'returns' : returns,
-                'func_type' : tc.types.TARROW(tc.types.TPROD(lambda i: i[1], inputs), returns)
+                'params' : params,
+                'ret_var' : ret_var,
+                'modifies' : modifies,
+                'reassigned' : reassigned,
+                'func_type' : tc.types.TARROW(tc.types.TPROD(*inputs), returns)
             }
     
+    def defer_func_attr(self, scope, fname, func, inputs, requires, ensures):
+        '''
+        Record `func` so that its attributes are only parsed when they are first needed
+        '''
+        if self.switch and self.store:
+            if scope is None:
+                raise Exception('No Scope Defined')
+            self.store[scope]['funcs'][fname] = (func, inputs, requires, ensures)
+
+    def resolve_func_attr(self, scope, fname):
+        if fname not in self.store[scope]['func_attrs'] and fname in self.store[scope]['funcs']:
+            func, inputs, requires, ensures = self.store[scope]['funcs'][fname]
+            types = parse_func_types(func, inputs=inputs)
+            self.insert_func_attr(scope, fname, types[0], types[1], types[2], requires, ensures, *types[3:])
+
     def get_func_attr(self, fname):
-        if self.store:
-            return self.store[-1].get('func_attrs', dict()).get(fname)
+        if self.scope:
+            scope = self.scope[-1]
+            if fname in self.store[scope]['funcs']:
+                return self.get_func_attrs(scope, fname)
         return None
 
     def current_func_attrs(self):
         if self.scope:
-            return self.store[self.scope[-1]]['func_attrs']
+            return self.get_scope_func_attrs(self.scope[-1])
+
+    def get_scope_func_attrs(self, scope):
+        '''
+        The attributes of every function of `scope`, by name
+        '''
+        for fname in self.store[scope]['funcs']:
+            self.resolve_func_attr(scope, fname)
+        return self.store[scope]['func_attrs']
     
     def get_func_attrs(self, scope, fname):
-        if self.scope:
+        if self.store:
+            self.resolve_func_attr(scope, fname)
             return self.store[scope]['func_attrs'][fname]
 
+class VerificationFailure(Exception):
+    '''
+    Base class of verification failures, carrying the `FunctionResult` of the function
+    '''
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+class VerificationViolated(VerificationFailure):
+    '''
+    Some obligation of a function has a counterexample
+    '''
+    pass
+
+class VerificationUnknown(VerificationFailure):
+    '''
+    No obligation is violated, but the solver gave up on some of them
+    (timeout, resource limit or incompleteness)
+    '''
+    pass
+
 STORE = VerificationStore()
+MAX_SPLIT = 64
 
-def enable_verification():
-    STORE.enable_verification()
+# Default solver limits, overridden per function by the arguments of `verify`.
+#   - timeout       : seconds the solver may spend on a single obligation
+#   - rlimit        : Z3 resource limit of a single obligation
+#   - total_timeout : seconds the solver may spend on all the obligations of a function
+LIMITS = {
+    'timeout'       : None,
+    'rlimit'        : None,
+    'total_timeout' : None
+}
+
+def run_task(task, capture=True):
+    '''
+    Run the verification function at `STORE.store[scope]['vf'][index]`,
+    returning its output (if `capture`), the exception it raised (if any) and its `FunctionResult`.
+    '''
+    scope, index = task
+    f_name, f = STORE.store[scope]['vf'][index]
+    output = io.StringIO()
+    error = None
+    with redirect_stdout(output) if capture else nullcontext():
+        try:
+            result = f()
+        except VerificationFailure as e:
+            error, result = e, e.result
+        except Exception as e:
+            error, result = e, FunctionResult(scope, f_name, 'error', error=str(e))
+    return (output.getvalue(), error, result)
+
+def run_pickleable_task(task):
+    mark = len(PROFILER.events)
+    output, error, result = run_task(task)
+    try:
+        pickle.dumps(error)
+    except Exception:
+        error = Exception(str(error))
+    return (output, error, result, PROFILER.events[mark:])
+
+def run_tasks(tasks, jobs):
+    '''
+    Lazily yield the results of `tasks` in order. Workers are forked so that
+    they inherit `STORE`; each of them builds its own solver and translator.
+    Sequential runs print directly instead of capturing the output, which would
+    also capture the output of other threads.
+    '''
+    if jobs > 1 and len(tasks) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(tasks))) as pool:
+            for (output, error, result, events) in pool.imap(run_pickleable_task, tasks):
+                PROFILER.events.extend(events)
+                yield (output, error, result)
+    else:
+        yield from (run_task(task, capture=False) for task in tasks)
+
+def enable_verification(on_call : bool=False):
+    '''
+    Enable verification of the functions decorated from now on. With `on_call`, each of them is
+    verified when it is first called instead of by `verify_all` / `do_verification`.
+    '''
+    STORE.enable_verification(on_call)
+
+def enable_runtime_checks(sample : int=1):
+    '''
+    Check the contracts of the functions decorated from now on at runtime, on one call out of
+    `sample`; `sample=0` disables the checks
+    '''
+    STORE.runtime_sample = sample
+
+def enable_cache(path : str=None, max_entries : int=None):
+    CACHE.enabled = True
+    if path is not None:
+        CACHE.path = path
+    if max_entries is not None:
+        CACHE.max_entries = max_entries
+
+def disable_cache():
+    CACHE.enabled = False
+
+def enable_portfolio(configs : List[str]=None, trigger : float=1.0, path : str=None):
+    '''
+    Race the obligations the solver does not decide within `trigger` seconds under the solver
+    configurations `configs` (all of `veripy.portfolio.CONFIGS` by default), in parallel processes.
+    The winning configuration of each function is stored in `path` (next to the proof cache by
+    default) and used first on later runs.
+    '''
+    PORTFOLIO.enabled = True
+    if configs is not None:
+        PORTFOLIO.configs = list(configs)
+    PORTFOLIO.trigger = trigger
+    PORTFOLIO.path = path if path is not None else CACHE.portfolio()
+    PORTFOLIO.winners = None
+
+def disable_portfolio():
+    PORTFOLIO.enabled = False
+
+def enable_external_solver(command : List[str]=None, processes : int=None, slow : float=None, artifacts : str=None):
+    '''
+    Check obligations with external solver processes reading SMT-LIB (`z3 -in` by default) instead
+    of the Z3 bindings. Up to `processes` obligations (one per CPU by default) are checked in
+    parallel, and a solver overrunning the time limit is killed. The SMT-LIB script of every
+    obligation taking more than `slow` seconds, or not decided, is saved to `artifacts` (next to
+    the proof cache by default).
+    '''
+    POOL.close()
+    POOL.enabled = True
+    if command is not None:
+        POOL.command = list(command)
+    if processes is not None:
+        POOL.processes = processes
+    POOL.slow = slow
+    POOL.artifacts = artifacts if artifacts is not None else CACHE.smtlib()
+
+def disable_external_solver():
+    POOL.enabled = False
+    POOL.close()
+
+def enable_profiling(hook=None):
+    '''
+    Record the phases of every verification in `PROFILER`, and call `hook(event)` after each phase
+    '''
+    PROFILER.enable()
+    if hook is not None:
+        PROFILER.add_hook(hook)
+
+def disable_profiling():
+    PROFILER.disable()
+
+def export_profile(path : str, format : str='json'):
+    '''
+    Write the recorded phases to `path`, as a JSON report (`'json'`) or a Chrome trace (`'chrome'`)
+    '''
+    PROFILER.export(path, format)
+
+def set_limits(timeout : float=None, rlimit : int=None, total_timeout : float=None):
+    '''
+    Set the default solver limits of every function (see `LIMITS`); `None` means unlimited
+    '''
+    LIMITS['timeout'] = timeout
+    LIMITS['rlimit'] = rlimit
+    LIMITS['total_timeout'] = total_timeout
 
 def scope(name : str):
     STORE.push(name)
 
-def do_verification(name : str, ignore_err : bool=True):
-    STORE.verify(name, ignore_err)
+def do_verification(name : str, ignore_err : bool=True, jobs : int=1, incremental : bool=False):
+    return STORE.verify(name, ignore_err, jobs, incremental)
 
-def verify_all(ignore_err : bool=True):
-    STORE.verify_all(ignore_err)
+def verify_all(ignore_err : bool=True, jobs : int=1, background : bool=False, incremental : bool=False):
+    '''
+    Verify the functions of every scope, returning their `FunctionResult`s.
+    With `incremental`, only the functions affected by a change since the last run are verified.
+    With `background`, verification runs in a separate thread and a `Future` of the results is
+    returned immediately, so it does not delay the import of the calling module. The scopes are
+    closed before it returns: the functions decorated next belong to the scopes opened next.
+    '''
+    return STORE.verify_all(ignore_err, jobs, incremental, background)
 
 def invariant(inv):
     return parse_assertion(inv)
@@ -107,10 +456,58 @@ def assume(C):
     if not C:
         raise RuntimeError('Assumption Violation')
 
+def wp_skip(sigma, stmt, Q):
+    return (Q, set())
+
+def wp_assume(sigma, stmt, Q):
+    return (BinOp(stmt.e, BoolOps.Implies, Q), set())
+
+def wp_assign(sigma, stmt, Q):
+    return (subst(stmt.var, stmt.expr, Q), set())
+
+def wp_assert(sigma, stmt, Q):
+    return (BinOp(Q, BoolOps.And, stmt.e), set())
+
+def wp_havoc(sigma, stmt, Q):
+    ty = sigma[stmt.var]
+    if not isinstance(ty, TARR):
+        return (Quantification(Var(stmt.var + '$0'), subst(stmt.var, Var(stmt.var + '$0'), Q), ty=ty), set())
+    # havocking an array keeps its length; the bound array is named apart, since the
+    # frame condition mentions the havocked one and nested loops havoc it again
+    k = 0
+    while f'{stmt.var}${k}' in sigma:
+        k += 1
+    fresh = f'{stmt.var}${k}'
+    sigma[fresh] = ty
+    Q = BinOp(same_length(Var(fresh), Var(stmt.var)), BoolOps.Implies, subst(stmt.var, Var(fresh), Q))
+    return (Quantification(Var(fresh), Q, ty=ty), set())
+
+def compose_assignments(block):
+    '''
+    The simultaneous substitution performing the assignments of `block` in order. Each right-hand
+    side is rewritten in terms of the values before the block, sharing the nodes of the earlier
+    ones, so the cost is linear in the size of the block instead of substituting into the
+    postcondition once per assignment.
+    '''
+    state = dict()
+    for s in block:
+        state[s.var] = subst_many(state, s.expr)
+    return state
+
 def wp_seq(sigma, stmt, Q):
-    (p2, c2) = wp(sigma, stmt.s2, Q)
-    (p1, c1) = wp(sigma, stmt.s1, p2)
-    return (p1, c1.union(c2))
+    C = set()
+    stmts = list(flatten_seq(stmt))
+    while stmts:
+        if isinstance(stmts[-1], Assign):
+            start = len(stmts) - 1
+            while start > 0 and isinstance(stmts[start - 1], Assign):
+                start -= 1
+            Q = subst_many(compose_assignments(stmts[start:]), Q)
+            del stmts[start:]
+            continue
+        (Q, c) = wp(sigma, stmts.pop(), Q)
+        C.update(c)
+    return (Q, C)
 
 def wp_if(sigma, stmt, Q):
     (p1, c1) = wp(sigma, stmt.lb, Q)
@@ -126,37 +523,234 @@ def wp_if(sigma, stmt, Q):
         c1.union(c2)
     )
 
-def wp_while(stmt, Q):
-    cond = stmt.cond
-    s = stmt.body
-    invars = stmt.invariants
-    combined_invars = Literal (VBool (True)) if not invars \
-                      else reduce(lambda i1, i2: BinOp(i1, BoolOps.And, i2), invars)
-    (p, c) = wp(s, combined_invars)
-    return (combined_invars, c.union({
-        BinOp(BinOp(combined_invars, BoolOps.And, cond), BoolOps.Implies, p),
-        BinOp(BinOp(combined_invars, BoolOps.And, (UnOp(BoolOps.Not, cond))), BoolOps.Implies, Q)
-    }))
+WP = {
+    Skip:   wp_skip,
+    Assume: wp_assume,
+    Assign: wp_assign,
+    Assert: wp_assert,
+    Seq:    wp_seq,
+    If:     wp_if,
+    Havoc:  wp_havoc
+}
 
 def wp(sigma, stmt, Q):
-    return {
-        Skip:   lambda: (Q, set()),
-        Assume:  lambda: (BinOp(stmt.e, BoolOps.Implies, Q), set()),
-        Assign: lambda: (subst(stmt.var, stmt.expr, Q), set()),
-        Assert: lambda: (BinOp(Q, BoolOps.And, stmt.e), set()),
-        Seq:    lambda: wp_seq(sigma, stmt, Q),
-        If:     lambda: wp_if(sigma, stmt, Q),
-        Havoc:  lambda: (Quantification(Var(stmt.var + '$0'), subst(stmt.var, Var(stmt.var + '$0'), Q), ty=sigma[stmt.var]), set())
-    }.get(type(stmt), lambda: raise_exception(f'wp not implemented for {type(stmt)}'))()
+    rule = WP.get(type(stmt))
+    if rule is None:
+        raise_exception(f'wp not implemented for {type(stmt)}')
+    return rule(sigma, stmt, Q)
 
 def emit_smt(translator: Expr2Z3, solver, constraint : Expr, fail_msg : str):
-    solver.push()
-    const = translator.visit(UnOp(BoolOps.Not, constraint))
-    solver.add(const)
-    if str(solver.check()) == 'sat':
-        model = solver.model()
-        raise Exception(f'VerificationViolated on\n{const}\nModel: {model}\n{fail_msg}')
-    solver.pop()
+    result = check_obligations(translator, solver, [(None, constraint, 'precondition', fail_msg)])[0]
+    if result.status != 'verified':
+        raise (VerificationViolated if result.status == 'violated' else VerificationUnknown)(result.message)
+
+def split_obligation(hypothesis : Expr, constraint : Expr, limit : int=MAX_SPLIT):
+    '''
+    Split `constraint` into conjuncts (also below the consequent of implications) so that
+    each can be checked and reported on its own. At most `limit` obligations are produced.
+    '''
+    result, worklist = [], [(hypothesis, constraint)]
+    while worklist:
+        h, c = worklist.pop()
+        if len(result) + len(worklist) + 1 < limit and isinstance(c, BinOp):
+            if c.op == BoolOps.And:
+                worklist.extend([(h, c.e2), (h, c.e1)])
+                continue
+            if c.op == BoolOps.Implies:
+                h = c.e1 if h is None else BinOp(h, BoolOps.And, c.e1)
+                worklist.append((h, c.e2))
+                continue
+        result.append((h, c))
+    return result
+
+def check_obligations(translator: Expr2Z3, solver, obligations, timeout=None, rlimit=None, deadline=None,
+                      portfolio=None, function=None):
+    '''
+    Check a batch of obligations `(hypothesis, constraint, kind, fail_msg)` on a single solver.
+    Every conjunct of a hypothesis is asserted once, guarded by an assumption literal; every negated
+    constraint is guarded by a fresh literal and checked with `solver.check(literals)` under the
+    conjuncts it is relevant to (see `veripy.slicing`), so lemmas learned on one obligation are
+    reused by the next. A counterexample found without the other conjuncts is checked again
+    under the whole hypothesis.
+    Each check is limited to `timeout` seconds and `rlimit` resources, and no check
+    runs past `deadline` (a `time.monotonic()` timestamp).
+    With a `portfolio`, an obligation the solver does not decide within `portfolio.trigger` seconds
+    is raced under several configurations (see `veripy.portfolio`), and the obligations of a
+    `function` which needed it are checked with its winning configuration in the first place.
+    Returns the `ObligationResult` of every obligation.
+    '''
+    guards = dict()
+    slicers = dict()
+    results = []
+    preferred = portfolio.winner(function) if portfolio is not None else None
+    if rlimit is not None:
+        solver.set('rlimit', rlimit)
+
+    def guard(conjunct):
+        if conjunct not in guards:
+            guards[conjunct] = z3.FreshBool('$h')
+            solver.add(z3.Implies(guards[conjunct], translator.visit(conjunct)))
+        return guards[conjunct]
+
+    def attempt(conjuncts, literal, const, kind, limit):
+        '''
+        Check the negated constraint `const` under `conjuncts`, returning `(status, model, reason, config)`
+        '''
+        nonlocal preferred
+        start = time.perf_counter()
+        model, reason, config = None, None, None
+        if preferred is not None:
+            config = preferred
+            with PROFILER.phase('check', kind=kind, config=config) as phase:
+                smt2 = to_smt2(*(translator.visit(c) for c in conjuncts), const)
+                status, model, reason = solve(config, smt2, limit, rlimit)
+                phase.args['status'] = status
+        else:
+            with PROFILER.phase('z3-translate'):
+                assumptions = [guard(c) for c in conjuncts] + [literal]
+            first = limit if portfolio is None else portfolio.trigger if limit is None else min(limit, portfolio.trigger)
+            # the solver is shared by all the obligations: a limit must not carry over to the next check
+            solver.set('timeout', timeout_ms(first))
+            with PROFILER.phase('check', kind=kind) as phase:
+                status = solver.check(*assumptions)
+                phase.args['status'] = str(status)
+                phase.args['hypotheses'] = len(conjuncts)
+            if status == z3.sat:
+                model = model_dict(solver.model())
+            elif status == z3.unknown:
+                reason = solver.reason_unknown()
+            status = str(status)
+        if status == 'unknown' and portfolio is not None:
+            remaining = None if limit is None else limit - (time.perf_counter() - start)
+            if remaining is None or remaining > 0:
+                with PROFILER.phase('portfolio', kind=kind) as phase:
+                    smt2 = to_smt2(*(translator.visit(c) for c in conjuncts), const)
+                    config, status, model, reason = portfolio.race(smt2, remaining, rlimit)
+                    phase.args['status'] = status
+                    phase.args['config'] = config
+                if config is not None:
+                    portfolio.record(function, config)
+                    preferred = config
+        return (status, model, reason, config)
+
+    for (hypothesis, constraint, kind, fail_msg) in obligations:
+        limit = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                results.append(ObligationResult('unknown', kind, '',
+                                                f'VerificationUnknown: time budget exhausted\n{fail_msg}',
+                                                reason='time budget exhausted'))
+                continue
+            limit = remaining if limit is None else min(limit, remaining)
+        start = time.perf_counter()
+        with PROFILER.phase('z3-translate'):
+            if hypothesis not in slicers:
+                slicers[hypothesis] = Slicer(hypothesis)
+            slicer = slicers[hypothesis]
+            relevant = slicer.relevant(constraint)
+            literal = z3.FreshBool('$o')
+            const = translator.visit(UnOp(BoolOps.Not, constraint))
+            solver.add(z3.Implies(literal, const))
+        status, model, reason, config = attempt(relevant, literal, const, kind, limit)
+        if status == 'sat' and len(relevant) < len(slicer.conjuncts):
+            remaining = None if limit is None else limit - (time.perf_counter() - start)
+            if remaining is None or remaining > 0:
+                status, model, reason, config = attempt(slicer.conjuncts, literal, const, kind, remaining)
+        elapsed = time.perf_counter() - start
+        if status == 'unsat':
+            results.append(ObligationResult('verified', kind, time=elapsed, config=config))
+            continue
+        if hypothesis is not None:
+            const = z3.Not(z3.Implies(translator.visit(hypothesis), translator.visit(constraint)))
+        if status == 'sat':
+            values = ', '.join(f'{name} = {v}' for (name, v) in model.items())
+            results.append(ObligationResult('violated', kind, str(const),
+                                            f'VerificationViolated on\n{const}\nModel: [{values}]\n{fail_msg}',
+                                            model=model, time=elapsed, config=config))
+        else:
+            results.append(ObligationResult('unknown', kind, str(const),
+                                            f'VerificationUnknown on\n{const}\nReason: {reason}\n{fail_msg}',
+                                            reason=reason, time=elapsed))
+    return results
+
+def check_obligations_external(pool, sigma : dict, obligations, timeout=None, rlimit=None, deadline=None,
+                               portfolio=None, function=None):
+    '''
+    Check the obligations `(hypothesis, constraint, kind, fail_msg)` like `check_obligations`, on the
+    external solvers of `pool` (see `veripy.smtlib`). Each obligation is printed as an SMT-LIB script
+    and the obligations are checked in parallel, one per solver process. A solver that overruns its
+    limit is killed. The script of an obligation decided after `pool.slow` seconds, or not decided,
+    is saved to `pool.artifacts`.
+    '''
+    slicers = dict()
+    # the checks run in other threads, which do not see the enclosing phase
+    profiled = PROFILER.stack[-1].function if PROFILER.stack else None
+    for (hypothesis, _, _, _) in obligations:
+        if hypothesis not in slicers:
+            slicers[hypothesis] = Slicer(hypothesis)
+
+    def attempt(conjuncts, constraint, kind, limit):
+        with PROFILER.phase('smtlib', function=profiled):
+            script = to_smtlib(sigma, *conjuncts, UnOp(BoolOps.Not, constraint))
+        first = limit if portfolio is None else portfolio.trigger if limit is None else min(limit, portfolio.trigger)
+        start = time.perf_counter()
+        with PROFILER.phase('check', function=profiled, kind=kind, solver=pool.command[0]) as phase:
+            status, model, reason = pool.check(script, first, rlimit)
+            phase.args['status'] = status
+            phase.args['hypotheses'] = len(conjuncts)
+        config = None
+        if status == 'unknown' and portfolio is not None:
+            remaining = None if limit is None else limit - (time.perf_counter() - start)
+            if remaining is None or remaining > 0:
+                with PROFILER.phase('portfolio', function=profiled, kind=kind) as phase:
+                    config, status, model, reason = portfolio.race(script, remaining, rlimit)
+                    phase.args['status'] = status
+                    phase.args['config'] = config
+                if config is not None:
+                    portfolio.record(function, config)
+        return (status, model, reason, config, script)
+
+    def check(index):
+        hypothesis, constraint, kind, fail_msg = obligations[index]
+        limit = timeout
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return ObligationResult('unknown', kind, '', f'VerificationUnknown: time budget exhausted\n{fail_msg}',
+                                        reason='time budget exhausted')
+            limit = remaining if limit is None else min(limit, remaining)
+        start = time.perf_counter()
+        slicer = slicers[hypothesis]
+        relevant = slicer.relevant(constraint)
+        status, model, reason, config, script = attempt(relevant, constraint, kind, limit)
+        if status == 'sat' and len(relevant) < len(slicer.conjuncts):
+            remaining = None if limit is None else limit - (time.perf_counter() - start)
+            if remaining is None or remaining > 0:
+                status, model, reason, config, script = attempt(slicer.conjuncts, constraint, kind, remaining)
+        elapsed = time.perf_counter() - start
+        if status != 'unsat' or (pool.slow is not None and elapsed >= pool.slow):
+            pool.save(f'{function}-{index}', script,
+                      f'{function}: {kind} #{index}\n{status} after {elapsed:.3f}s' +
+                      (f' ({reason})' if reason else ''))
+        if status == 'unsat':
+            return ObligationResult('verified', kind, time=elapsed, config=config)
+        # the Z3 form of the failed obligation, for the message
+        negated = UnOp(BoolOps.Not, constraint if hypothesis is None else BinOp(hypothesis, BoolOps.Implies, constraint))
+        const = Expr2Z3(declare_consts(sigma)).visit(negated)
+        if status == 'sat':
+            values = ', '.join(f'{name} = {v}' for (name, v) in model.items())
+            return ObligationResult('violated', kind, str(const),
+                                    f'VerificationViolated on\n{const}\nModel: [{values}]\n{fail_msg}',
+                                    model=model, time=elapsed, config=config)
+        return ObligationResult('unknown', kind, str(const),
+                                f'VerificationUnknown on\n{const}\nReason: {reason}\n{fail_msg}',
+                                reason=reason, time=elapsed)
+
+    if len(obligations) <= 1 or pool.processes <= 1:
+        return [check(i) for i in range(len(obligations))]
+    with ThreadPoolExecutor(min(pool.processes, len(obligations))) as executor:
+        return list(executor.map(check, range(len(obligations))))
 
 def fold_constraints(constraints : List[str]):
     fold_and_str = lambda x, y: BinOp(parse_assertion(x) if isinstance(x, str) else x,
@@ -168,47 +762,170 @@ def fold_constraints(constraints : List[str]):
     else:
         return Literal(VBool(True))
 
-def verify_func(func, scope, inputs, requires, ensures):
-    code = inspect.getsource(func)
-    func_ast = ast.parse(code)
-    target_language_ast = StmtTranslator().visit(func_ast)
-    func_attrs = STORE.get_func_attrs(scope, func.__name__)
-    sigma = tc.type_check_stmt(func_attrs['inputs'], func_attrs, target_language_ast)
+def typecheck_function(inputs : dict, func_sigma : dict, stmt : Stmt, precond : Expr, postcond : Expr):
+    '''
+    Type check the translated function `stmt` and its contracts, given the signatures `func_sigma`
+    of the functions of its scope. Returns `(sigma, stmt, precond, postcond)`, with the types of
+    the variables in `sigma` and the types of the quantifiers resolved; the calls of `stmt` are
+    replaced by the contracts of the callees and its array accesses are checked.
+    '''
+    resolved = dict()
+    sigma = tc.type_check_stmt(dict(inputs), func_sigma, stmt, resolved)
+    tc.type_check_expr(sigma, func_sigma, TBOOL, precond, resolved)
+    tc.type_check_expr(sigma, func_sigma, TBOOL, postcond, resolved)
+    precond = tc.resolve_types(precond, resolved)
+    postcond = tc.resolve_types(postcond, resolved)
+    stmt = check_bounds(lower_calls(sigma, func_sigma, tc.resolve_types(stmt, resolved)))
+    return (sigma, stmt, precond, postcond)
+
+def generate_vc(sigma : dict, stmt : Stmt, postcond : Expr, vcgen='wp'):
+    '''
+    The verification condition `(P, C)` of `stmt` (see `wp` and `passive_wp`)
+    '''
+    if vcgen == 'passive':
+        return passive_wp(sigma, stmt, postcond)
+    if vcgen == 'wp':
+        return wp(sigma, stmt, postcond)
+    raise Exception(f'Unknown VC generation mode: {vcgen}')
+
+def proof_obligations(sigma : dict, name : str, precond : Expr, P : Expr, C):
+    '''
+    The simplified obligations `(hypothesis, goal, kind, message)` of the verification condition
+    `(P, C)` of `name`, and the number of trivial ones that were dropped
+    '''
+    hypothesis = simplify(length_facts(sigma, precond))
+    obligations = [(h, c, 'precondition', f'Precondition does not imply wp at {name}')
+                    for (h, c) in split_obligation(hypothesis, simplify(P))]
+    obligations.extend((None, simplify(c), 'side condition', f'Side condition violated at {name}')
+                       for c in C)
+    checked = [o for o in obligations if not trivial(o[0], o[1])]
+    return (checked, len(obligations) - len(checked))
+
+def verify_func(func, scope, inputs, requires, ensures, vcgen='wp', timeout=None, rlimit=None, total_timeout=None):
+    '''
+    Verify `func` against its contracts. `vcgen` selects how verification conditions are generated:
+    `'wp'` for the textbook weakest precondition, or `'passive'` for the linear-size
+    passive form, which scales to functions with many branches.
+    The solver limits default to `LIMITS`. Returns the `FunctionResult` of a verified function;
+    raises `VerificationViolated` if some obligation has a counterexample, and
+    `VerificationUnknown` if the solver could not decide some of them.
+    `func` is a function, or only its definition: an `ast.FunctionDef`, its source or a
+    `FunctionSource` (see `veripy.discovery`), so that modules can be verified without being imported.
+    '''
+    source = function_source(func)
+    name = source.name
+    timeout = LIMITS['timeout'] if timeout is None else timeout
+    rlimit = LIMITS['rlimit'] if rlimit is None else rlimit
+    total_timeout = LIMITS['total_timeout'] if total_timeout is None else total_timeout
+    with PROFILER.phase('verify', function=f'{scope}::{name}'):
+        result = FunctionResult(scope, name)
+        timings = result.timings
 
-    user_precond = fold_constraints(requires)
-    user_postcond = fold_constraints(ensures)
+        start = time.perf_counter()
+        with PROFILER.phase('getsource'):
+            code = source.code
+            # the proof also depends on the contracts of the callees
+            funcs = STORE.store[scope]['funcs']
+            callees = sorted(called_functions(ast.parse(code).body[0]) & set(funcs))
+            key = CACHE.key(code, inputs, requires, ensures,
+                            *(f'{f}:{funcs[f][1:]!r}:{call_semantics(STORE.get_func_attrs(scope, f))}'
+                              for f in callees))
+        if CACHE.hit(key):
+            result.cached = True
+            timings['parse'] = time.perf_counter() - start
+            print(f'{name} Verified! (cached)')
+            return result
+        with PROFILER.phase('parse'):
+            func_ast = ast.parse(code)
+            user_precond = fold_constraints(requires)
+            user_postcond = fold_constraints(ensures)
+        with PROFILER.phase('translate'):
+            target_language_ast = StmtTranslator().visit(func_ast)
+        timings['parse'] = time.perf_counter() - start
 
-    tc.type_check_expr(sigma, func_attrs, TBOOL, user_precond)
-    tc.type_check_expr(sigma, func_attrs, TBOOL, user_postcond)
+        start = time.perf_counter()
+        with PROFILER.phase('typecheck'):
+            func_sigma = STORE.get_scope_func_attrs(scope)
+            (sigma, target_language_ast, user_precond, user_postcond) = \
+                typecheck_function(func_sigma[name]['inputs'], func_sigma, target_language_ast,
+                                   user_precond, user_postcond)
+        timings['typecheck'] = time.perf_counter() - start
 
-    (P, C) = wp(sigma, target_language_ast, user_postcond)
-    check_P = BinOp(user_precond, BoolOps.Implies, P)
+        start = time.perf_counter()
+        with PROFILER.phase('wp', vcgen=vcgen) as phase:
+            (P, C) = generate_vc(sigma, target_language_ast, user_postcond, vcgen)
+            if PROFILER.enabled:
+                phase.args['vc_size'] = expr_size(P) + sum(expr_size(c) for c in C)
+        timings['wp'] = time.perf_counter() - start
 
-    solver = z3.Solver()
-    translator = Expr2Z3(declare_consts(sigma))
+        start = time.perf_counter()
+        with PROFILER.phase('simplify') as phase:
+            (obligations, result.trivial) = proof_obligations(sigma, name, user_precond, P, C)
+            if PROFILER.enabled:
+                phase.args['saved'] = result.trivial
+                phase.args['vc_size'] = sum(expr_size(c) for (_, c, _, _) in obligations)
+        timings['simplify'] = time.perf_counter() - start
 
-    emit_smt(translator, solver, check_P, f'Precondition does not imply wp at {func.__name__}')
-    for c in C:
-        emit_smt(translator, solver, c, f'Side condition violated at {func.__name__}')
-    print(f'{func.__name__} Verified!')
+        start = time.perf_counter()
+        with PROFILER.phase('solve') as phase:
+            deadline = None if total_timeout is None else time.monotonic() + total_timeout
+            portfolio = PORTFOLIO if PORTFOLIO.enabled else None
+            if POOL.enabled:
+                result.obligations = check_obligations_external(POOL, sigma, obligations, timeout, rlimit, deadline,
+                                                                portfolio, node_id(source, scope))
+            else:
+                solver = z3.Solver()
+                translator = Expr2Z3(declare_consts(sigma))
+                result.obligations = check_obligations(translator, solver, obligations, timeout, rlimit, deadline,
+                                                       portfolio, node_id(source, scope))
+            if PROFILER.enabled:
+                phase.args['obligations'] = len(obligations)
+                if not POOL.enabled:
+                    phase.args['statistics'] = solver_statistics(solver)
+        timings['solve'] = time.perf_counter() - start
 
+        failures = result.failures()
+        if failures:
+            message = '\n'.join(o.message for o in failures)
+            if any(o.status == 'violated' for o in failures):
+                result.status = 'violated'
+                raise VerificationViolated(message, result)
+            result.status = 'unknown'
+            raise VerificationUnknown(message, result)
+        print(f'{name} Verified!')
+        CACHE.insert(key)
+        return result
+
+
+class Constants(dict):
+    '''
+    The Z3 constants of the variables of `sigma`, declared when they are first referenced
+    '''
+    def __init__(self, sigma : dict):
+        super().__init__()
+        self.sigma = sigma
+
+    def __missing__(self, name):
+        ty = self.sigma[name]
+        sort = Expr2Z3.translate_type(ty) if type(ty) != dict else None
+        if sort is None:
+            raise_exception(f'Unsupported type of {name}: {ty}')
+        const = self[name] = z3.Const(name, sort)
+        return const
 
 def declare_consts(sigma : dict):
-    consts = dict()
-    for (name, ty) in sigma.items():
-        if type(ty) != dict:
-            consts[name] = {
-                tc.types.TINT: lambda:  z3.Int(name),
-                tc.types.TBOOL: lambda: z3.Bool(name)
-            }.get(ty)()
-    return consts
+    return Constants(sigma)
+
+def call_semantics(attrs : dict):
+    '''
+    What the callers of a function rely on besides its contract, as derived from its definition
+    '''
+    return repr([attrs[k] for k in ('params', 'ret_var', 'modifies', 'reassigned', 'func_type')])
 
 def parse_func_types(func, inputs=[]):
-    code = inspect.getsource(func)
-    func_ast = ast.parse(code)
-    func_def = func_ast.body[0]
+    func_def = function_source(func).definition()
     result = []
-    provided = dict(inputs)
+    provided = {x: tc.types.from_typing(ty) for (x, ty) in inputs}
     for i in func_def.args.args:
         if i.annotation:
             result.append(tc.types.to_ast_type(i.annotation))
@@ -216,20 +933,57 @@ def parse_func_types(func, inputs=[]):
             result.append(provided.get(i.arg, tc.types.TANY))
         provided[i.arg] = result[-1]
 
+    params = [i.arg for i in func_def.args.args]
+    # the variable the contracts refer to the result by, if the function always returns the same one
+    returned = {n.value.id if isinstance(n.value, ast.Name) else None
+                for n in ast.walk(func_def) if isinstance(n, ast.Return)}
+    ret_var = returned.pop() if len(returned) == 1 else None
+    # the parameters whose elements are assigned, which the caller sees through its own list
+    modified = set()
+    for n in ast.walk(func_def):
+        if isinstance(n, ast.Assign) and isinstance(n.targets[0], ast.Subscript):
+            target = n.targets[0]
+            while isinstance(target, ast.Subscript):
+                target = target.value
+            if isinstance(target, ast.Name) and target.id in params:
+                modified.add(target.id)
+    # the parameters the body assigns: the postcondition sees their final values, not the arguments
+    reassigned = {n.id for n in ast.walk(func_def) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Store)}
     if func_def.returns:
         ret_type = tc.types.to_ast_type(func_def.returns)
-        return (result, provided, ret_type)
+        return (result, provided, ret_type, params, ret_var, sorted(modified), sorted(reassigned & set(params)))
     else:
         raise Exception('Return annotation is required for verifying functions')
 
-def verify(inputs: List[Tuple[str, tc.types.SUPPORTED]]=[], requires: List[str]=[], ensures: List[str]=[]):
+def verify(inputs: List[Tuple[str, tc.types.SUPPORTED]]=[], requires: List[str]=[], ensures: List[str]=[], vcgen: str='wp',
+           timeout: float=None, rlimit: int=None, total_timeout: float=None, runtime_check: int=None):
+    '''
+    Register a function for verification against `requires` / `ensures`.
+    `runtime_check=N` also checks the contracts on one call out of N, raising `ContractViolation`;
+    by default the rate set by `enable_runtime_checks` is used.
+    '''
     def verify_impl(func):
-        @wraps(func)
-        def caller(*args, **kargs):
-            return func(*args, **kargs)
-        types = parse_func_types(func, inputs=inputs)
+        # nothing is parsed until the function is verified
         scope = STORE.current_scope()
-        STORE.insert_func_attr(scope, func.__name__, types[0], types[1], types[2], requires, ensures)
-        STORE.push_verification(func.__name__, lambda: verify_func(func, scope, inputs, requires, ensures))
-        return caller
-    return verify_impl
\ No newline at end of file
+        STORE.defer_func_attr(scope, func.__name__, func, inputs, requires, ensures)
+        verification = lambda: verify_func(func, scope, inputs, requires, ensures, vcgen,
+                                           timeout, rlimit, total_timeout)
+        func.__requires__ = requires
+        func.__ensures__ = ensures
+        func.__inputs__ = inputs
+        sample = STORE.runtime_sample if runtime_check is None else runtime_check
+        if STORE.switch and STORE.on_call:
+            pending = [verification]
+            target = RuntimeChecker(func, requires, ensures, sample).wrap() if sample else func
+            @wraps(func)
+            def caller(*args, **kargs):
+                if pending:
+                    STORE.verify_on_call(scope, func.__name__, pending)
+                return target(*args, **kargs)
+            return caller
+        STORE.push_verification(func.__name__, verification)
+        if sample:
+            return RuntimeChecker(func, requires, ensures, sample).wrap()
+        # no runtime behaviour: calls go to `func` itself, without a wrapper frame
+        return func
+    return verify_impl